@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+
+"""
+python -m airline_bi, see airline_bi/cli.py.
+"""
+
+import sys
+
+from airline_bi import cli
+
+if __name__ == "__main__":
+    sys.exit(cli.main())
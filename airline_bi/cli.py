@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Command line entry point of the pipeline.
+    synth        synthesize the operational database, arguments go to data.synthesize_reldb
+    full         full load of the warehouse and the star schema
+    incremental  incremental load of the warehouse and the star schema
+    csv          load the reviews csv into the warehouse
+    bench        run a benchmark, arguments go to benchmarks.<name>
+--tables on full reloads only those warehouse tables and the tables that reference them (their surrogate keys
+change), then rebuilds the star schema. On incremental it replaces change detection, only those tables are diffed.
+--batch-id loads under the given batch id and leaves the ledger alone, by default the ledger allocates one.
+--resume BATCH continues a failed run after the last table it committed (see etl.checkpoints), run it with the
+same subcommand and --tables. Without --tables an incremental resume loads the changes the failed run detected, not
+the ones since.
+--dry-run prints what would be loaded and loads nothing.
+--parallel N loads up to N warehouse tables of a full load at a time, a table only waits for the tables it references.
+N is limited by the connections of the warehouse engine role (database/engines.py).
+Loads wait for the stage locks, ETL_LOCK_TIMEOUT seconds at most.
+
+Usage:
+    python -m airline_bi full --parallel 4
+    python -m airline_bi full --tables pilots --dry-run
+    python -m airline_bi incremental --tables flights airline_reviews
+    python -m airline_bi full --resume 42
+    python -m airline_bi csv --file data/output/reviews.csv
+    python -m airline_bi synth --resume
+    python -m airline_bi bench etl_scale run --sf 1
+    python -m airline_bi bench import_time -- --help
+"""
+
+import argparse
+import contextlib
+import subprocess
+import sys
+from typing import Callable
+
+BENCHMARKS = ("etl_scale", "bi_queries", "dashboard_load", "import_time")
+
+
+@contextlib.contextmanager
+def batch(args, kind: str, sources: Callable[[], dict[str, str]] | None = None):
+    # an explicit batch id skips the ledger, its sequence would hand out another one
+    if args.batch_id is not None:
+        print(f"+++++ Loading as batch {args.batch_id}, not recorded in the ledger")
+        yield args.batch_id
+        return
+    from etl import ledger
+    resume = getattr(args, "resume", None)
+    if resume is not None:
+        print(f"+++++ Resuming batch {resume}")
+        with ledger.run(kind, resume=resume) as batch_id:
+            yield batch_id
+        return
+    with ledger.run(kind, sources() if sources else None) as batch_id:
+        yield batch_id
+
+
+def check_tables(tables: list[str] | None):
+    # checked here rather than as argparse choices, --help should not have to import the loaders
+    if not tables:
+        return
+    from etl.warehouse import warehouse_table_names
+    unknown = set(tables) - set(warehouse_table_names())
+    if unknown:
+        raise SystemExit(f"Unknown warehouse tables: {', '.join(sorted(unknown))} (known: {', '.join(warehouse_table_names())})")
+
+
+def run_module(module: str, arguments: list[str]) -> int:
+    # a process of its own, multiprocessing workers of the synthesizer must not re-import this one
+    return subprocess.run([sys.executable, "-m", module, *arguments]).returncode
+
+
+def run_synth(args) -> int:
+    return run_module("data.synthesize_reldb", args.arguments)
+
+
+def run_bench(args) -> int:
+    return run_module(f"benchmarks.{args.name}", args.arguments)
+
+
+def run_full(args) -> int:
+    from database import engines
+    from etl import change_detection, locks
+    from etl import warehouse as warehouse_etl
+    from etl.star_schema import full_load_star_schema
+
+    check_tables(args.tables)
+    settings = engines.ROLES["warehouse"]()
+    if args.parallel > settings.pool_size + settings.max_overflow:
+        raise SystemExit(f"--parallel {args.parallel} exceeds the {settings.pool_size + settings.max_overflow} connections of the warehouse engine")
+    table_names = warehouse_etl.table_dependents(set(args.tables)) if args.tables else warehouse_etl.warehouse_table_names()
+    if args.tables:
+        print(f"+++++ Reloading {', '.join(table_names)} and the star schema")
+    else:
+        print("+++++ Full load of the warehouse and the star schema")
+    for level, level_tables in enumerate(warehouse_etl.load_levels(table_names)):
+        print(f"    level {level}: {', '.join(level_tables)}")
+    if args.dry_run:
+        return 0
+
+    resume = args.resume is not None
+    with locks.stage_locks(*locks.PIPELINE_STAGES, mode="wait"):
+        if args.tables:
+            with batch(args, "reload") as batch_id:
+                warehouse_etl.reload_warehouse_tables(batch_id, set(args.tables), args.parallel, resume)
+                full_load_star_schema(batch_id, resume)
+        else:
+            # signatures taken before loading, the first incremental load then skips what did not change since
+            with batch(args, "full", change_detection.source_signatures) as batch_id:
+                warehouse_etl.full_load_warehouse_2(batch_id, args.parallel, resume)
+                full_load_star_schema(batch_id, resume)
+    return 0
+
+
+def run_incremental(args) -> int:
+    from etl import change_detection, locks
+    from etl import warehouse as warehouse_etl
+    from etl.star_schema import incremental_load_star_schema
+
+    check_tables(args.tables)
+    if args.tables:
+        tables = set(args.tables) - set(warehouse_etl.CSV_TABLES)
+        reviews = bool(set(args.tables) & set(warehouse_etl.CSV_TABLES))
+        sources = None
+    elif args.resume is not None:
+        # what the failed run set out to load, its checkpoints skip the tables it committed
+        changes = change_detection.run_changes(args.resume)
+        tables, reviews = changes.tables, changes.reviews
+        sources = None
+    else:
+        changes = change_detection.detect_changes()
+        if not changes.any:
+            print("+++++ No source changes since the last batch, nothing to load")
+            return 0
+        tables, reviews = changes.tables, changes.reviews
+        sources = lambda: changes.signatures
+    print(f"+++++ Incremental load of {', '.join(sorted(tables | ({'reviews'} if reviews else set())))}")
+    if args.dry_run:
+        return 0
+
+    resume = args.resume is not None
+    with locks.stage_locks(*locks.PIPELINE_STAGES, mode="wait"):
+        with batch(args, "incremental", sources) as batch_id:
+            changed_rows = warehouse_etl.incremental_load_warehouse(batch_id, tables, reviews, resume)
+            if changed_rows:
+                incremental_load_star_schema(batch_id, resume)
+            else:
+                print("+++++ No warehouse rows changed, skipping the star schema")
+    return 0
+
+
+def run_csv(args) -> int:
+    from etl import locks
+    from etl import warehouse as warehouse_etl
+
+    print(f"+++++ Loading reviews from {args.file} into the warehouse")
+    if args.dry_run:
+        return 0
+    with locks.stage_locks("warehouse", mode="wait"):
+        with batch(args, "csv") as batch_id:
+            changed_rows = warehouse_etl.incremental_load_csv_staging(batch_id, args.file)
+    print(f"+++++ {changed_rows:,} warehouse review rows inserted or closed, the next incremental load carries them into the star schema")
+    return 0
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m airline_bi", description="Airline BI pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # synth and bench pass everything after the subcommand (and the benchmark name) on, see parse_args()
+    synth_parser = subparsers.add_parser("synth", help="Synthesize the operational database, further arguments go to data.synthesize_reldb")
+    synth_parser.set_defaults(handler=run_synth, passthrough=True)
+
+    load_options = argparse.ArgumentParser(add_help=False)
+    load_options.add_argument("--batch-id", type=int, help="load as this batch instead of allocating one in the ledger")
+    load_options.add_argument("--dry-run", action="store_true", help="print what would be loaded and stop")
+
+    resume_options = argparse.ArgumentParser(add_help=False)
+    resume_options.add_argument("--resume", type=int, metavar="BATCH_ID", help="continue this failed run after its last committed table")
+
+    full_parser = subparsers.add_parser("full", parents=[load_options, resume_options], help="Full load of the warehouse and the star schema")
+    full_parser.add_argument("--tables", nargs="+", help="reload only these warehouse tables and their dependents")
+    full_parser.add_argument("--parallel", type=int, default=1, help="warehouse tables loaded at a time")
+    full_parser.set_defaults(handler=run_full)
+
+    incremental_parser = subparsers.add_parser("incremental", parents=[load_options, resume_options], help="Incremental load of the warehouse and the star schema")
+    incremental_parser.add_argument("--tables", nargs="+", help="diff only these warehouse tables instead of the changed ones")
+    incremental_parser.set_defaults(handler=run_incremental)
+
+    csv_parser = subparsers.add_parser("csv", parents=[load_options], help="Load the reviews csv into the warehouse")
+    csv_parser.add_argument("--file", default="data/output/reviews.csv")
+    csv_parser.set_defaults(handler=run_csv)
+
+    bench_parser = subparsers.add_parser("bench", help="Run a benchmark, further arguments go to benchmarks.<name>")
+    bench_parser.add_argument("name", choices=BENCHMARKS)
+    bench_parser.set_defaults(handler=run_bench, passthrough=True)
+    return parser
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    # a REMAINDER positional would not take options right after the subcommand (synth --resume), so the pass-through
+    # subcommands get whatever argparse did not recognize, in order. A leading -- is dropped
+    cli_parser = parser()
+    args, unknown = cli_parser.parse_known_args(argv)
+    if not getattr(args, "passthrough", False):
+        if unknown:
+            cli_parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+        return args
+    args.arguments = unknown[1:] if unknown[:1] == ["--"] else unknown
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if getattr(args, "parallel", 1) < 1:
+        raise SystemExit("--parallel must be at least 1")
+    if getattr(args, "batch_id", None) is not None and getattr(args, "resume", None) is not None:
+        raise SystemExit("--batch-id and --resume do not go together")
+    from etl import locks
+    try:
+        return args.handler(args)
+    except locks.StageBusy as e:
+        print(e)
+        return 1
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+
+"""
+Latency benchmark for dashboard-style questions over the star schema.
+Every query in the catalogue is run repeatedly and reported as p50/p95/p99 latency together with
+its EXPLAIN plan, either against the star schema as it is or after building it at one or more
+scale factors (see benchmarks.etl_scale), so schema and index changes can be compared run to run.
+
+Usage:
+    python -m benchmarks.bi_queries run --repetitions 20 --out benchmarks/results/bi_current.json
+    python -m benchmarks.bi_queries run --sf 0.1 1 --analyze
+    python -m benchmarks.bi_queries compare benchmarks/results/bi_baseline.json benchmarks/results/bi_current.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+import database.star_schema as star_db
+
+RESULTS_VERSION = 1
+
+# typical two-class seat counts, the schema has no capacity column
+SEATS_PER_MODEL = {
+    "Airbus A320neo": 180,
+    "Boeing 737 MAX 8": 178,
+    "Airbus A321neo": 220,
+    "Boeing 787-9": 290,
+    "Airbus A350-900": 325,
+}
+
+_seats_values = ", ".join(f"('{model}', {seats})" for model, seats in SEATS_PER_MODEL.items())
+
+# what the Metabase dashboards ask, written the way its query builder would
+QUERIES: dict[str, str] = {
+    "on_time_by_route_month": """
+        SELECT dep.code AS origin, arr.code AS destination, d.year, d.month,
+               count(*) AS flights,
+               avg(CASE WHEN f.delay_minutes <= 15 THEN 1.0 ELSE 0.0 END) * 100 AS on_time_pct
+        FROM star_schema.fact_flight f
+        JOIN star_schema.dim_flight df ON df.flight_sk = f.flight_sk
+        JOIN star_schema.dim_airport dep ON dep.airport_sk = df.departure_airport_sk
+        JOIN star_schema.dim_airport arr ON arr.airport_sk = df.arrival_airport_sk
+        JOIN star_schema.dim_date d ON d.date_sk = f.departure_date_sk
+        WHERE df.status <> 'cancelled'
+        GROUP BY dep.code, arr.code, d.year, d.month
+        ORDER BY d.year, d.month, on_time_pct
+    """,
+    "load_factor_by_model": f"""
+        WITH seats(model, seats) AS (VALUES {_seats_values}),
+        booked AS (
+            SELECT df.flight_sk, df.airplane_sk, count(b.flight_booking_sk) AS passengers
+            FROM star_schema.dim_flight df
+            LEFT JOIN star_schema.fact_booking b ON b.flight_sk = df.flight_sk
+            WHERE df.status <> 'cancelled' AND NOT df.is_ferry_flight
+            GROUP BY df.flight_sk, df.airplane_sk
+        )
+        SELECT a.model, count(*) AS flights,
+               avg(booked.passengers::float / seats.seats) * 100 AS load_factor_pct
+        FROM booked
+        JOIN star_schema.dim_airplane a ON a.airplane_sk = booked.airplane_sk
+        JOIN seats ON seats.model = a.model
+        GROUP BY a.model
+        ORDER BY load_factor_pct DESC
+    """,
+    "review_scores_by_seat_class": """
+        SELECT r.seat_class, count(*) AS reviews,
+               avg(r.rating) AS rating,
+               avg(r.seat_comfort) AS seat_comfort,
+               avg(r.cabin_staff_service) AS cabin_staff_service,
+               avg(r.food_and_beverages) AS food_and_beverages,
+               avg(r.inflight_entertainment) AS inflight_entertainment,
+               avg(r.value_for_money) AS value_for_money,
+               avg(CASE WHEN r.recommended THEN 1.0 ELSE 0.0 END) * 100 AS recommended_pct
+        FROM star_schema.fact_review r
+        GROUP BY r.seat_class
+        ORDER BY rating DESC
+    """,
+    "top_delayed_airports": """
+        SELECT a.code, a.city, count(*) AS departures,
+               avg(f.delay_minutes) AS avg_delay_minutes,
+               sum(CASE WHEN f.delay_minutes > 15 THEN 1 ELSE 0 END) AS delayed_departures
+        FROM star_schema.fact_flight f
+        JOIN star_schema.dim_flight df ON df.flight_sk = f.flight_sk
+        JOIN star_schema.dim_airport a ON a.airport_sk = df.departure_airport_sk
+        GROUP BY a.code, a.city
+        ORDER BY avg_delay_minutes DESC
+        LIMIT 10
+    """,
+}
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # nearest rank, no interpolation between samples
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def explain(connection: sqlalchemy.Connection, sql: str, analyze: bool = False) -> dict:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    return connection.scalar(sqlalchemy.text(f"EXPLAIN ({options}) {sql}"))[0]
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def plan_summary(plan: dict) -> dict:
+    nodes = list(plan_nodes(plan["Plan"]))
+    summary = {
+        "total_cost": plan["Plan"]["Total Cost"],
+        "plan_rows": plan["Plan"]["Plan Rows"],
+        "node_types": sorted({node["Node Type"] for node in nodes}),
+        "seq_scans": sorted({node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"}),
+    }
+    if "Execution Time" in plan:
+        summary["execution_ms"] = plan["Execution Time"]
+    return summary
+
+
+def run_queries(
+        repetitions: int = 20,
+        warmup: int = 2,
+        analyze: bool = False,
+        queries: dict[str, str] | None = None,
+) -> dict[str, dict]:
+    """
+    Runs each query warmup times untimed, then repetitions times timed including the fetch.
+    Returns latency percentiles in milliseconds, the row count and the EXPLAIN plan per query.
+    """
+    queries = queries or QUERIES
+    results = {}
+    with star_db.engine.connect() as connection:
+        for name, sql in queries.items():
+            statement = sqlalchemy.text(sql)
+            for _ in range(warmup):
+                connection.execute(statement).fetchall()
+            latencies = []
+            rows = 0
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                rows = len(connection.execute(statement).fetchall())
+                latencies.append((time.perf_counter() - start) * 1000)
+            plan = explain(connection, sql, analyze)
+            connection.rollback()
+            results[name] = {
+                "repetitions": repetitions,
+                "rows": rows,
+                "mean_ms": sum(latencies) / len(latencies),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "plan_summary": plan_summary(plan),
+                "plan": plan,
+            }
+            print(f" +++ {name}: p50 {results[name]['p50_ms']:.1f} ms, p95 {results[name]['p95_ms']:.1f} ms, "
+                  f"p99 {results[name]['p99_ms']:.1f} ms, {rows:,} rows +++ ")
+    return results
+
+
+def print_results(results: dict[str, dict]):
+    print(f"{'query':<30} {'rows':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}  seq scans")
+    for name, result in results.items():
+        print(f"{name:<30} {result['rows']:>8,} {result['p50_ms']:>10.1f} {result['p95_ms']:>10.1f} {result['p99_ms']:>10.1f}  "
+              f"{', '.join(result['plan_summary']['seq_scans']) or '-'}")
+
+
+def run_benchmark(
+        scale_factors: list[float] | None = None,
+        repetitions: int = 20,
+        warmup: int = 2,
+        analyze: bool = False,
+        seed: int = 0,
+) -> dict:
+    """
+    Without scale factors the queries run against the current star schema, otherwise the
+    operational database, warehouse and star schema are rebuilt at each factor first.
+    """
+    results = {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": dict(repetitions=repetitions, warmup=warmup, analyze=analyze, seed=seed),
+        "runs": [],
+    }
+    for scale_factor in scale_factors or [None]:
+        if scale_factor is not None:
+            # imported here, building the schema pulls in the synthesizer and the loaders
+            from benchmarks.etl_scale import run_benchmark as build_star_schema
+            print(f"+++++ Building the star schema at SF{scale_factor:g}...")
+            build_star_schema(scale_factor, incremental_rounds=0, seed=seed)
+        print(f"+++++ Running {len(QUERIES)} queries x {repetitions}{f' at SF{scale_factor:g}' if scale_factor else ''}...")
+        queries = run_queries(repetitions, warmup, analyze)
+        print_results(queries)
+        results["runs"].append({"scale_factor": scale_factor, "queries": queries})
+    return results
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.2, metric: str = "p95_ms", min_ms: float = 5.0) -> list[str]:
+    """
+    Compares metric per (scale factor, query) and returns the ones slower than the baseline by more than threshold.
+    Queries faster than min_ms in the baseline are too noisy to flag.
+    Plan changes are printed as well, a new sequential scan is usually the reason.
+    """
+    base_runs = {run["scale_factor"]: run["queries"] for run in baseline["runs"]}
+    regressions = []
+    print(f"{'sf':>6} {'query':<30} {'baseline':>10} {'current':>10} {'change':>8}")
+    for run in current["runs"]:
+        scale_factor = run["scale_factor"]
+        if scale_factor not in base_runs:
+            print(f"WARNING: no baseline at SF{scale_factor}")
+            continue
+        for name, result in run["queries"].items():
+            base = base_runs[scale_factor].get(name)
+            if base is None:
+                continue
+            change = (result[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+            flag = ""
+            if change > threshold and base[metric] >= min_ms:
+                regressions.append(f"SF{scale_factor} {name}")
+                flag = "  REGRESSION"
+            print(f"{'-' if scale_factor is None else f'{scale_factor:g}':>6} {name:<30} {base[metric]:>10.1f} {result[metric]:>10.1f} {change:>+8.1%}{flag}")
+            new_scans = set(result["plan_summary"]["seq_scans"]) - set(base["plan_summary"]["seq_scans"])
+            if new_scans:
+                print(f"{'':>6} {'':<30} new sequential scans: {', '.join(sorted(new_scans))}")
+
+    if regressions:
+        print(f"+++++ {len(regressions)} queries slower than {threshold:.0%} on {metric}")
+    else:
+        print(f"+++++ No query slower than {threshold:.0%} on {metric}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BI query latency benchmark over the star schema.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the query catalogue and write a results file")
+    run_parser.add_argument("--sf", type=float, nargs="*", help="rebuild the star schema at these scale factors first")
+    run_parser.add_argument("--repetitions", type=int, default=20)
+    run_parser.add_argument("--warmup", type=int, default=2)
+    run_parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE the queries, runs each one once more")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", default="benchmarks/results/bi_queries.json")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare a results file against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+    compare_parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    compare_parser.add_argument("--min-ms", type=float, default=5.0, help="ignore queries faster than this in the baseline")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        results = run_benchmark(args.sf, args.repetitions, args.warmup, args.analyze, args.seed)
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"+++++ Results written to {args.out}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(1 if compare_results(baseline, current, args.threshold, args.metric, args.min_ms) else 0)
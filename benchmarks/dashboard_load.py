@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""
+Load test for dashboards and the incremental loader running at the same time.
+Concurrent reader threads replay the BI query catalogue (benchmarks.bi_queries) against the star schema:
+first on their own for a baseline, then while an incremental warehouse + star load runs.
+The loader is also timed once without readers, so both sides of the contention are measured:
+query latency inflation for the readers, slowdown for the loader, and lock waits sampled from pg_locks.
+
+Usage:
+    python -m benchmarks.dashboard_load --concurrency 8 --duration 30 --change-ratio 0.01
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+from database import engines
+import database.warehouse as warehouse
+from benchmarks.bi_queries import QUERIES, percentile
+from data.change_stream import DEFAULT_MIX, simulate_changes
+from etl.star_schema import incremental_load_star_schema
+from etl.warehouse import incremental_load_warehouse
+
+# every kind of change, the star refresh remaps the facts of updated flights and customers
+DEFAULT_CHANGES = tuple(DEFAULT_MIX)
+
+LOCK_SAMPLE_INTERVAL = 0.1
+
+
+def next_batch_id() -> int:
+    # one past the newest batch that touched the warehouse
+    batch_id = 0
+    with warehouse.engine.connect() as connection:
+        for table in warehouse.metadata.sorted_tables:
+            if "insert_id" in table.c:
+                newest = connection.scalar(sqlalchemy.select(sqlalchemy.func.max(
+                    sqlalchemy.func.greatest(table.c.insert_id, sqlalchemy.func.coalesce(table.c.update_id, 0))
+                )))
+                batch_id = max(batch_id, newest or 0)
+    return batch_id + 1
+
+
+class QueryReplayer:
+    """
+    Runs random catalogue queries from concurrency threads, each on its own connection,
+    until stopped. Every execution is recorded as (phase, query, latency ms).
+    """
+
+    def __init__(self, engine: sqlalchemy.engine.Engine, concurrency: int, seed: int = 0):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.seed = seed
+        self.phase = "baseline"
+        self.samples: list[tuple[str, str, float]] = []
+        self.errors: list[str] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def _worker(self, index: int):
+        rng = random.Random(self.seed + index)
+        names = list(QUERIES)
+        statements = {name: sqlalchemy.text(sql) for name, sql in QUERIES.items()}
+        with self.engine.connect() as connection:
+            while not self._stop.is_set():
+                name = rng.choice(names)
+                phase = self.phase
+                start = time.perf_counter()
+                try:
+                    connection.execute(statements[name]).fetchall()
+                    connection.rollback()
+                except Exception as e:
+                    connection.rollback()
+                    with self._lock:
+                        self.errors.append(f"{name}: {e!r}")
+                    continue
+                latency = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    self.samples.append((phase, name, latency))
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(self.concurrency)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+class LockSampler:
+    """
+    Polls pg_locks for ungranted locks while running, per phase it keeps the number of
+    samples, how many of them saw a waiter, the most waiters at once and the longest wait.
+    """
+
+    def __init__(self, engine: sqlalchemy.engine.Engine, interval: float = LOCK_SAMPLE_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self.phase = "baseline"
+        self.stats: dict[str, dict] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self):
+        query = sqlalchemy.text("""
+            SELECT count(*), coalesce(max(extract(epoch FROM now() - a.query_start)), 0)
+            FROM pg_locks l
+            JOIN pg_stat_activity a ON a.pid = l.pid
+            WHERE NOT l.granted AND a.datname = current_database()
+        """)
+        with self.engine.connect() as connection:
+            while not self._stop.wait(self.interval):
+                waiting, longest = connection.execute(query).one()
+                connection.rollback()
+                stats = self.stats.setdefault(self.phase, {"samples": 0, "samples_with_waiters": 0, "max_waiters": 0, "longest_wait_s": 0.0})
+                stats["samples"] += 1
+                if waiting:
+                    stats["samples_with_waiters"] += 1
+                stats["max_waiters"] = max(stats["max_waiters"], waiting)
+                stats["longest_wait_s"] = max(stats["longest_wait_s"], float(longest))
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_incremental_load(batch_id: int) -> dict:
+    timings = {}
+    start = time.perf_counter()
+    try:
+        incremental_load_warehouse(batch_id)
+        timings["warehouse_seconds"] = time.perf_counter() - start
+        star_start = time.perf_counter()
+        incremental_load_star_schema(batch_id)
+        timings["star_schema_seconds"] = time.perf_counter() - star_start
+    except Exception as e:
+        timings["error"] = repr(e)
+        print(f" --- Incremental load of batch {batch_id} failed: {e!r} ---")
+    timings["seconds"] = time.perf_counter() - start
+    return timings
+
+
+def latency_summary(samples: list[tuple[str, str, float]], phase: str, seconds: float) -> dict:
+    summary = {}
+    for name in QUERIES:
+        latencies = [latency for sample_phase, query, latency in samples if sample_phase == phase and query == name]
+        if latencies:
+            summary[name] = {
+                "count": len(latencies),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+            }
+    total = sum(result["count"] for result in summary.values())
+    return {"seconds": seconds, "queries": total, "queries_per_s": total / seconds if seconds else 0.0, "per_query": summary}
+
+
+def run_load_test(
+        concurrency: int = 8,
+        duration: float = 30.0,
+        change_ratio: float = 0.01,
+        changes: tuple[str, ...] = DEFAULT_CHANGES,
+        seed: int = 0,
+) -> dict:
+    """
+    1. applies changes and runs the incremental load alone,
+    2. replays queries for duration seconds without the loader,
+    3. applies the same amount of changes and runs the incremental load with the readers still going.
+    Returns latency per phase and query, loader timings with and without readers, and lock wait samples.
+    """
+    mix = {kind: DEFAULT_MIX[kind] for kind in changes}
+    # readers and the sampler each hold a connection for the whole run
+    engine = engines.create_role_engine("warehouse", pool_size=concurrency + 1, max_overflow=0)
+    replayer = QueryReplayer(engine, concurrency, seed)
+    sampler = LockSampler(engine)
+
+    print(f"+++++ Dashboard load test: {concurrency} readers, {duration:g}s baseline, {change_ratio:.2%} changes per load")
+    print(" --- Incremental load without readers ---")
+    simulate_changes(change_ratio=change_ratio, mix=mix, seed=seed)
+    sampler.phase = "etl_alone"
+    sampler.start()
+    etl_alone = run_incremental_load(next_batch_id())
+    sampler.stop()
+
+    print(f" --- Readers without the loader for {duration:g}s ---")
+    simulate_changes(change_ratio=change_ratio, mix=mix, seed=seed + 1)
+    sampler.phase = replayer.phase = "baseline"
+    sampler.start()
+    replayer.start()
+    time.sleep(duration)
+
+    print(" --- Incremental load with readers ---")
+    sampler.phase = replayer.phase = "during_etl"
+    etl_loaded = run_incremental_load(next_batch_id())
+    replayer.stop()
+    sampler.stop()
+    engine.dispose()
+
+    baseline = latency_summary(replayer.samples, "baseline", duration)
+    during = latency_summary(replayer.samples, "during_etl", etl_loaded["seconds"])
+    inflation = {
+        name: during["per_query"][name]["p95_ms"] / result["p95_ms"]
+        for name, result in baseline["per_query"].items()
+        if name in during["per_query"] and result["p95_ms"]
+    }
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": dict(concurrency=concurrency, duration=duration, change_ratio=change_ratio, changes=list(changes), seed=seed),
+        "latency": {"baseline": baseline, "during_etl": during},
+        "p95_inflation": inflation,
+        "etl": {
+            "alone": etl_alone,
+            "with_readers": etl_loaded,
+            "slowdown": etl_loaded["seconds"] / etl_alone["seconds"] if etl_alone["seconds"] else None,
+        },
+        "lock_waits": sampler.stats,
+        "query_errors": replayer.errors,
+    }
+
+    print(f"{'query':<30} {'base p95':>10} {'etl p95':>10} {'inflation':>10}")
+    for name, result in baseline["per_query"].items():
+        during_p95 = during["per_query"].get(name, {}).get("p95_ms")
+        print(f"{name:<30} {result['p95_ms']:>10.1f} {during_p95 if during_p95 is not None else float('nan'):>10.1f} "
+              f"{inflation.get(name, float('nan')):>9.2f}x")
+    print(f"Throughput: {baseline['queries_per_s']:,.1f} queries/s alone, {during['queries_per_s']:,.1f} queries/s during the load")
+    slowdown = results["etl"]["slowdown"]
+    print(f"Loader: {etl_alone['seconds']:.2f}s alone, {etl_loaded['seconds']:.2f}s with readers"
+          f"{f' ({slowdown:.2f}x)' if slowdown else ''}")
+    for phase, stats in sampler.stats.items():
+        print(f"Lock waits {phase}: {stats['samples_with_waiters']} of {stats['samples']} samples, "
+              f"at most {stats['max_waiters']} waiters, longest {stats['longest_wait_s']:.2f}s")
+    if replayer.errors:
+        print(f"WARNING: {len(replayer.errors)} queries failed, first: {replayer.errors[0]}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay dashboard queries concurrently with an incremental load.")
+    parser.add_argument("--concurrency", type=int, default=8, help="reader threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of readers without the loader")
+    parser.add_argument("--change-ratio", type=float, default=0.01, help="fraction of operational rows changed before each load")
+    parser.add_argument("--changes", default=",".join(DEFAULT_CHANGES), help=f"comma separated change kinds, of {','.join(DEFAULT_MIX)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmarks/results/dashboard_load.json")
+    args = parser.parse_args()
+    results = run_load_test(args.concurrency, args.duration, args.change_ratio, tuple(args.changes.split(",")), args.seed)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"+++++ Results written to {args.out}")
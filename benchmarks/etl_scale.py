@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+"""
+End-to-end ETL benchmark at fixed scale factors.
+Synthesizes the operational database, runs the full warehouse and star schema loads and then
+rounds of simulated changes followed by incremental loads, and writes per-table wall time,
+rows/s, peak RSS and database sizes into a JSON baseline that later runs are compared against.
+
+Scale factors: SF1 is the synthesize_reldb defaults, larger factors grow the fleet
+(and with it flights, bookings, customers and staff), fractional ones shorten the synthesized year.
+
+Usage:
+    python -m benchmarks.etl_scale run --sf 1 --out benchmarks/results/sf1.json
+    python -m benchmarks.etl_scale compare benchmarks/results/sf1.json current.json --threshold 0.1
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy
+from faker import Faker
+
+import constants
+import data.csv
+import database
+import database.reldb as reldb
+import database.star_schema as star_db
+import database.warehouse as warehouse
+from data.change_stream import DEFAULT_MIX, REVIEWS_FNAME, append_reviews, operational_row_count, simulate_changes
+from data.synthesize_reldb import synthesize_reldb
+from etl.star_schema import full_load_star_schema, incremental_load_star_schema
+from etl.warehouse import full_load_warehouse_2, incremental_load_warehouse
+from util import profiling
+
+RESULTS_VERSION = 1
+
+# SF1 defaults of synthesize_reldb
+SF1_AIRCRAFT = 40
+SF1_DAYS = 365
+SF1_BATCH_SIZE = 4000
+SF1_REVIEWS = 10_000
+
+# table names of the DML statements the loaders run, SELECTs and DDL are not timed
+DML_RE = re.compile(r'^\s*(INSERT INTO|UPDATE|DELETE FROM)\s+([\w."]+)', re.IGNORECASE)
+
+
+def scale_factor_params(scale_factor: float) -> dict:
+    if scale_factor <= 0:
+        raise ValueError(f"Scale factor must be positive, got {scale_factor}")
+    if scale_factor >= 1:
+        return dict(num_aircraft=round(SF1_AIRCRAFT * scale_factor), days_per_year=SF1_DAYS)
+    # below SF1 keep the fleet so the schedule still looks like an airline, just for fewer days,
+    # batches shrink with it since the pipeline only generates whole batches,
+    # but stay above a few planeloads because flight complement batches are batch_size // pax_per_flight flights
+    return dict(
+        num_aircraft=SF1_AIRCRAFT,
+        days_per_year=max(1, round(SF1_DAYS * scale_factor)),
+        batch_size=max(SF1_BATCH_SIZE // 10, round(SF1_BATCH_SIZE * scale_factor)),
+    )
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and bytes on macOS, children only count once they were waited for
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak * scale / 2**20
+
+
+def database_size() -> dict:
+    schemas = [constants.AIRLINE_SCHEMA, constants.WAREHOUSE_SCHEMA, constants.CSV_STAGING_SCHEMA, constants.STAR_SCHEMA]
+    with reldb.engine.connect() as connection:
+        total = connection.scalar(sqlalchemy.text("SELECT pg_database_size(current_database())"))
+        rows = connection.execute(sqlalchemy.text("""
+            SELECT n.nspname, c.relname, pg_total_relation_size(c.oid)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.relkind IN ('r', 'p') AND n.nspname = ANY(:schemas)
+        """), {"schemas": schemas}).all()
+    tables = {f"{schema}.{table}": size for schema, table, size in rows}
+    return {
+        "total_bytes": total,
+        "schemas": {schema: sum(size for name, size in tables.items() if name.split(".")[0] == schema) for schema in schemas},
+        "tables": tables,
+    }
+
+
+class StatementTimer:
+    """
+    Times every DML statement executed on the given engines through cursor events,
+    so the loaders are measured without changing them. Totals are kept per (stage, table, kind).
+    """
+
+    def __init__(self, engines: list[sqlalchemy.engine.Engine]):
+        # the warehouse and star schema share an engine, a listener is added and removed once per engine
+        self.engines = list(dict.fromkeys(engines))
+        self.stage: str | None = None
+        self.totals: dict[tuple[str, str, str], dict] = {}
+
+    def __enter__(self):
+        for engine in self.engines:
+            sqlalchemy.event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+            sqlalchemy.event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            sqlalchemy.event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+            sqlalchemy.event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["statement_start"].pop()
+        match = DML_RE.match(statement)
+        if self.stage is None or match is None:
+            return
+        kind = match.group(1).split()[0].lower()
+        table = match.group(2).replace('"', "")
+        rows = cursor.rowcount
+        if rows < 0:
+            rows = len(parameters) if executemany else 0
+        totals = self.totals.setdefault((self.stage, table, kind), {"statements": 0, "seconds": 0.0, "rows": 0})
+        totals["statements"] += 1
+        totals["seconds"] += elapsed
+        totals["rows"] += rows
+
+    def stage_tables(self, stage: str) -> list[dict]:
+        return [
+            dict(table=table, kind=kind, **totals, rows_per_s=totals["rows"] / totals["seconds"] if totals["seconds"] else 0.0)
+            for (stage_name, table, kind), totals in self.totals.items()
+            if stage_name == stage
+        ]
+
+
+def write_reviews_csv(num_reviews: int, seed: int):
+    columns = data.csv.AirlineReview(0, 0, "", "", 0.0, False, 0, 0, 0, 0, 0, datetime.now()).__dict__.keys()
+    os.makedirs(os.path.dirname(REVIEWS_FNAME), exist_ok=True)
+    with open(REVIEWS_FNAME, "w", newline="") as f:
+        csv.writer(f).writerow(columns)
+    fake = Faker()
+    fake.seed_instance(seed)
+    with database.get_session(reldb.engine) as session:
+        append_reviews(session, fake, num_reviews)
+
+
+def run_benchmark(
+        scale_factor: float = 1.0,
+        incremental_rounds: int = 3,
+        change_ratio: float = 0.01,
+        seed: int = 0,
+        skip_synthesis: bool = False,
+        change_mix: dict[str, float] | None = None,
+) -> dict:
+    """
+    Runs every stage once (incremental ones incremental_rounds times) and returns the results document.
+    A failing stage is recorded with its error and ends the run, the results up to it are still returned.
+    The reviews CSV is regenerated for the run, an existing one is restored afterwards.
+    """
+    synth_params = scale_factor_params(scale_factor)
+    print(f"+++++ ETL benchmark at SF{scale_factor:g}: {synth_params}, {incremental_rounds} incremental rounds at {change_ratio:.2%}")
+    results = {
+        "version": RESULTS_VERSION,
+        "scale_factor": scale_factor,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "config": dict(synth_params, incremental_rounds=incremental_rounds, change_ratio=change_ratio, change_mix=change_mix, seed=seed),
+        "stages": [],
+    }
+
+    def record(name: str, elapsed: float, rows: int, tables: list[dict], error: str | None = None):
+        stage = dict(name=name, seconds=elapsed, rows=rows, rows_per_s=rows / elapsed if elapsed else 0.0, peak_rss_mb=peak_rss_mb(), tables=tables)
+        if error is not None:
+            stage["error"] = error
+            print(f" --- {name} failed after {elapsed:.2f}s: {error} ---")
+        else:
+            print(f" +++ {name}: {rows:,} rows in {elapsed:.2f}s, peak RSS {stage['peak_rss_mb']:,.0f} MB +++ ")
+        results["stages"].append(stage)
+
+    backup_dir = tempfile.mkdtemp()
+    backup = os.path.join(backup_dir, "reviews.csv")
+    if os.path.exists(REVIEWS_FNAME):
+        shutil.copy2(REVIEWS_FNAME, backup)
+    try:
+        with StatementTimer([reldb.engine, warehouse.engine, star_db.engine]) as timer:
+            if not skip_synthesis:
+                start = time.perf_counter()
+                synthesize_reldb(seed=seed, **synth_params)
+                write_reviews_csv(round(SF1_REVIEWS * scale_factor), seed)
+                with database.get_session(reldb.engine) as session:
+                    rows = operational_row_count(session)
+                record("synthesize", time.perf_counter() - start, rows, [])
+
+            stages = [
+                ("full_warehouse", lambda: full_load_warehouse_2(1)),
+                ("full_star_schema", lambda: full_load_star_schema(1)),
+            ]
+            for i in range(incremental_rounds):
+                batch_id = i + 2
+                stages += [
+                    (f"changes_{i + 1}", lambda batch_id=batch_id: simulate_changes(change_ratio=change_ratio, mix=change_mix, seed=seed + batch_id)),
+                    (f"incremental_warehouse_{i + 1}", lambda batch_id=batch_id: incremental_load_warehouse(batch_id)),
+                    (f"incremental_star_schema_{i + 1}", incremental_load_star_schema),
+                ]
+            for name, stage_fn in stages:
+                timer.stage = name
+                start = time.perf_counter()
+                try:
+                    outcome = stage_fn()
+                except Exception as e:
+                    # later stages depend on this one, stop here but keep what was measured so far
+                    record(name, time.perf_counter() - start, 0, timer.stage_tables(name), error=repr(e))
+                    break
+                finally:
+                    timer.stage = None
+                elapsed = time.perf_counter() - start
+                tables = timer.stage_tables(name)
+                rows = sum(outcome.values()) if isinstance(outcome, dict) else sum(t["rows"] for t in tables)
+                record(name, elapsed, rows, tables)
+    finally:
+        if os.path.exists(backup):
+            shutil.move(backup, REVIEWS_FNAME)
+        shutil.rmtree(backup_dir)
+
+    results["database_size"] = database_size()
+    print(f"+++++ Database size: {results['database_size']['total_bytes'] / 2**20:,.0f} MB")
+    return results
+
+
+def flatten_results(results: dict) -> dict[str, float]:
+    metrics = {}
+    for stage in results["stages"]:
+        if "error" in stage:
+            continue
+        metrics[f"{stage['name']} seconds"] = stage["seconds"]
+        for table in stage["tables"]:
+            metrics[f"{stage['name']} {table['kind']} {table['table']} seconds"] = table["seconds"]
+    metrics["peak RSS MB"] = max((stage["peak_rss_mb"] for stage in results["stages"]), default=0.0)
+    metrics["database MB"] = results.get("database_size", {}).get("total_bytes", 0) / 2**20
+    return metrics
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.1, min_seconds: float = 0.5) -> list[str]:
+    """
+    Prints every metric side by side and returns the ones that got worse by more than threshold.
+    Timings whose baseline is below min_seconds are too noisy to flag.
+    """
+    if baseline["scale_factor"] != current["scale_factor"]:
+        print(f"WARNING: comparing SF{current['scale_factor']:g} against a SF{baseline['scale_factor']:g} baseline")
+
+    base_metrics = flatten_results(baseline)
+    current_metrics = flatten_results(current)
+    regressions = []
+    print(f"{'metric':<70} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, base_value in base_metrics.items():
+        if name not in current_metrics:
+            # the stage failed or never ran, that is worse than any slowdown
+            regressions.append(name)
+            print(f"{name:<70} {base_value:>12.2f} {'missing':>12}  REGRESSION")
+            continue
+        value = current_metrics[name]
+        change = (value - base_value) / base_value if base_value else 0.0
+        flag = ""
+        if change > threshold and (not name.endswith("seconds") or base_value >= min_seconds):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<70} {base_value:>12.2f} {value:>12.2f} {change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"+++++ {len(regressions)} regressions above {threshold:.0%}")
+    else:
+        print(f"+++++ No regressions above {threshold:.0%}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scale-factor end-to-end ETL benchmark.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark and write a results file")
+    run_parser.add_argument("--sf", type=float, default=1.0, help="scale factor, 1 = synthesize_reldb defaults")
+    run_parser.add_argument("--rounds", type=int, default=3, help="incremental load rounds")
+    run_parser.add_argument("--change-ratio", type=float, default=0.01, help="fraction of operational rows changed per round")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--changes", help=f"comma separated change kinds to simulate, default all of {','.join(DEFAULT_MIX)}")
+    run_parser.add_argument("--skip-synthesis", action="store_true", help="Benchmark the ETL against the current operational database")
+    run_parser.add_argument("--out", help="results file, defaults to benchmarks/results/sf<SF>.json")
+    run_parser.add_argument("--profile", help="profile synthesis and ETL into this directory, slows every stage down")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare a results file against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown that counts as a regression")
+    compare_parser.add_argument("--min-seconds", type=float, default=0.5, help="ignore timings shorter than this in the baseline")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        change_mix = {kind: DEFAULT_MIX[kind] for kind in args.changes.split(",")} if args.changes else None
+        if args.profile:
+            profiling.enable(args.profile)
+        results = run_benchmark(args.sf, args.rounds, args.change_ratio, args.seed, args.skip_synthesis, change_mix)
+        if args.profile:
+            profiling.write_report(args.profile)
+        out = args.out or f"benchmarks/results/sf{args.sf:g}.json"
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"+++++ Results written to {out}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(1 if compare_results(baseline, current, args.threshold, args.min_seconds) else 0)
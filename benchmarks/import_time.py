@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+Import time of the ETL entry points.
+Each module is imported in a fresh interpreter with python -X importtime, repeated, and reported with
+its cumulative import time (best run), the slowest packages it pulls in and which of the heavy optional
+ones (pandas, prefect, slack_sdk, faker) got loaded.
+The interpreters run outside the repository and without DATABASE_URL and the Slack and Prefect settings,
+so an entry point that needs a setting or a connection just to be imported fails here.
+
+Usage:
+    python -m benchmarks.import_time --repeat 5 --out benchmarks/results/import_time.json
+    python -m benchmarks.import_time etl.warehouse flows.initial
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = (
+    "etl.warehouse",
+    "etl.star_schema",
+    "etl.ledger",
+    "etl.change_detection",
+    "etl.locks",
+    "etl.explain",
+    "etl.cdc",
+    "etl.triggers",
+    "etl.streaming",
+    "flows.initial",
+    "data.synthesize_reldb",
+    "data.shard_loader",
+)
+HEAVY_MODULES = ("pandas", "prefect", "slack_sdk", "faker")
+# settings no entry point should need at import time
+SETTINGS = ("DATABASE_URL", "WAREHOUSE_DATABASE_URL", "SLACK_BOT_TOKEN", "SLACK_CHANNEL", "PREFECT_API_URL")
+TOP_PACKAGES = 5
+
+
+def parse_importtime(stderr: str, module: str) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Returns the cumulative import time of module and the cumulative times of its direct imports, in ms.
+    Lines are "import time: self [us] | cumulative | imported package", children before their parent,
+    nesting is the indentation of the name.
+    """
+    direct = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            direct.append((name.strip(), int(cumulative) / 1000))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative) / 1000, direct
+            direct = []
+    return 0.0, []
+
+
+def measure(module: str) -> dict:
+    code = f"import {module}; import sys, json; print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    env = {key: value for key, value in os.environ.items() if key not in SETTINGS}
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=cwd, env=env)
+        wall = time.perf_counter() - start
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"}
+    import_ms, direct = parse_importtime(result.stderr, module)
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": import_ms,
+        "heavy": json.loads(result.stdout.strip().splitlines()[-1]),
+        "slowest": sorted(direct, key=lambda item: -item[1])[:TOP_PACKAGES],
+    }
+
+
+def run(modules: list[str], repeat: int = 3) -> dict:
+    results = {}
+    for module in modules:
+        runs = [measure(module) for _ in range(repeat)]
+        errors = [run for run in runs if "error" in run]
+        if errors:
+            results[module] = errors[0]
+            print(f"{module:<24} FAILED: {errors[0]['error']}")
+            continue
+        best = min(runs, key=lambda run: run["import_ms"])
+        results[module] = best
+        print(f"{module:<24} {best['import_ms']:>8.1f} ms import {best['wall_ms']:>8.1f} ms wall  "
+              f"heavy: {', '.join(best['heavy']) or '-'}")
+        print(f"{'':<24} slowest: {', '.join(f'{name} {ms:.0f}ms' for name, ms in best['slowest'])}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time of the ETL entry points.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=3, help="the best of this many fresh interpreters is reported")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.modules, args.repeat)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "modules": results}, f, indent=2)
+        print(f"+++++ Results written to {args.out}")
+    if any("error" in result for result in results.values()):
+        sys.exit(1)
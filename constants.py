@@ -2,6 +2,8 @@
 
 """
 Constands and environment variables.
+Settings from the environment are resolved on first use, an entry point only needs the ones it touches
+(the ETL does not need the Slack token until it sends a message).
 """
 
 import dotenv
@@ -15,15 +17,32 @@ def require_env(key: str) -> str:
         raise EnvironmentError(f"Missing required environment variable: {key}")
     return value
 
-DATABASE_URL = require_env("DATABASE_URL")
-BOT_TOKEN = require_env("SLACK_BOT_TOKEN")
-CHANNEL = require_env("SLACK_CHANNEL")
-PREFECT_API_URL = require_env("PREFECT_API_URL")
+_settings = {
+    "DATABASE_URL": lambda: require_env("DATABASE_URL"),
+    # warehouse, csv staging and star schema, the operational database when not set
+    "WAREHOUSE_DATABASE_URL": lambda: os.getenv("WAREHOUSE_DATABASE_URL") or __getattr__("DATABASE_URL"),
+    "SPLIT_DATABASES": lambda: __getattr__("WAREHOUSE_DATABASE_URL") != __getattr__("DATABASE_URL"),
+    "BOT_TOKEN": lambda: require_env("SLACK_BOT_TOKEN"),
+    "CHANNEL": lambda: require_env("SLACK_CHANNEL"),
+    # Slack Web API base url, Slack itself when not set (see notifications.slack)
+    "SLACK_API_URL": lambda: os.getenv("SLACK_API_URL"),
+    "PREFECT_API_URL": lambda: require_env("PREFECT_API_URL"),
+}
+
+def __getattr__(name: str):
+    # only called for names not set yet, the resolved value is cached as a plain module attribute
+    if name not in _settings:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = _settings[name]()
+    return value
 
 AIRLINE_SCHEMA = "airline"
 WAREHOUSE_SCHEMA = "warehouse"
 CSV_STAGING_SCHEMA = "csv_staging"
 STAR_SCHEMA = "star_schema"
+ETL_META_SCHEMA = "etl_meta"
+# copies of the operational tables on the warehouse side when the databases are split (see etl.streaming)
+AIRLINE_STAGING_SCHEMA = "airline_staging"
 
 WAREHOUSE_RELDB_SOURCE_ID = 1
 WAREHOUSE_CSV_SOURCE_ID = 2
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+"""
+Simulates ongoing operational churn on top of a synthesized airline schema, so incremental
+ETL can be measured under realistic change volumes rather than against a static dataset.
+Changes are applied in small transactions at a target rate:
+new flights and bookings, delays, cancellations, customer profile edits and new reviews
+appended to the reviews CSV.
+"""
+
+import argparse
+import csv
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+import sqlalchemy
+from faker import Faker
+from sqlalchemy.orm import Session
+
+import data.csv
+import database
+import database.reldb as reldb
+from model.common import FlightStatusEnum
+from model.reldb import Airplane, Airport, Customer, Flight, FlightBooking, Pilot
+
+REVIEWS_FNAME = "data/output/reviews.csv"
+
+# share of each kind of change in the stream
+DEFAULT_MIX = {
+    "new_flights": 0.10,
+    "new_bookings": 0.35,
+    "delays": 0.20,
+    "cancellations": 0.05,
+    "customer_edits": 0.20,
+    "reviews": 0.10,
+}
+
+# the 0.1%, 1% and 10% scenarios the incremental benchmarks run at
+CHANGE_RATIOS = (0.001, 0.01, 0.1)
+
+
+def max_id(session: Session, model) -> int:
+    return session.scalar(sqlalchemy.select(sqlalchemy.func.max(model.id))) or 0
+
+
+def operational_row_count(session: Session) -> int:
+    # max(id) is an index lookup and close enough to the row count for tables we never delete from
+    total = 0
+    for table in reldb.metadata.sorted_tables:
+        if "id" in table.c:
+            total += session.scalar(sqlalchemy.select(sqlalchemy.func.max(table.c.id))) or 0
+    return total
+
+
+def sample_ids(session: Session, model, n: int, *criteria) -> list[int]:
+    """
+    Picks up to n random existing ids. Ids are sampled from the id range and then
+    checked against the table, which is much cheaper than ORDER BY random() on large tables.
+    """
+    upper = max_id(session, model)
+    if upper == 0 or n <= 0:
+        return []
+    candidates = random.sample(range(1, upper + 1), min(upper, n * 2))
+    return list(session.scalars(
+        sqlalchemy.select(model.id).where(model.id.in_(candidates), *criteria).limit(n)
+    ))
+
+
+def add_flights(session: Session, fake: Faker, n: int) -> int:
+    airport_ids = list(session.scalars(sqlalchemy.select(Airport.id)))
+    airplane_ids = list(session.scalars(sqlalchemy.select(Airplane.id)))
+    pilot_ids = list(session.scalars(sqlalchemy.select(Pilot.id)))
+    latest = session.scalar(sqlalchemy.select(sqlalchemy.func.max(Flight.departure_time))) or datetime.now()
+
+    flights = []
+    for _ in range(n):
+        origin, destination = random.sample(airport_ids, 2)
+        pilot, copilot = random.sample(pilot_ids, 2) if len(pilot_ids) >= 2 else (pilot_ids[0], None)
+        departure = latest + timedelta(minutes=random.randint(30, 24 * 60))
+        flights.append(Flight(
+            flight_number=fake.bothify(text='??####'),
+            status=FlightStatusEnum.SCHEDULED,
+            departure_time=departure,
+            arrival_time=departure + timedelta(hours=3, minutes=30),
+            delay_minutes=0,
+            departure_airport_id=origin,
+            arrival_airport_id=destination,
+            pilot_id=pilot,
+            copilot_id=copilot,
+            airplane_id=random.choice(airplane_ids),
+            is_ferry_flight=False,
+            estimated_flight_hours=3.5,
+        ))
+    session.add_all(flights)
+    return len(flights)
+
+
+def add_bookings(session: Session, fake: Faker, n: int) -> int:
+    flight_ids = sample_ids(session, Flight, max(1, n // 100), Flight.status != FlightStatusEnum.CANCELLED)
+    upper_customer = max_id(session, Customer)
+    if not flight_ids or upper_customer == 0:
+        return 0
+    bookings = [
+        FlightBooking(
+            flight_id=random.choice(flight_ids),
+            customer_id=random.randint(1, upper_customer),
+            seat_number=str(random.randint(1, 180)),
+        )
+        for _ in range(n)
+    ]
+    session.add_all(bookings)
+    return len(bookings)
+
+
+def delay_flights(session: Session, fake: Faker, n: int) -> int:
+    ids = sample_ids(session, Flight, n, Flight.status != FlightStatusEnum.CANCELLED)
+    rows = session.execute(
+        sqlalchemy.select(Flight.id, Flight.delay_minutes, Flight.departure_time, Flight.arrival_time).where(Flight.id.in_(ids))
+    ).all()
+    updates = []
+    for flight_id, delay_minutes, departure_time, arrival_time in rows:
+        delay = random.randint(15, 120)
+        updates.append(dict(
+            id=flight_id,
+            status=FlightStatusEnum.DELAYED,
+            delay_minutes=(delay_minutes or 0) + delay,
+            departure_time=departure_time + timedelta(minutes=delay),
+            arrival_time=arrival_time + timedelta(minutes=delay) if arrival_time is not None else None,
+        ))
+    if updates:
+        session.execute(sqlalchemy.update(Flight), updates)
+    return len(updates)
+
+
+def cancel_flights(session: Session, fake: Faker, n: int) -> int:
+    ids = sample_ids(session, Flight, n, Flight.status != FlightStatusEnum.CANCELLED)
+    if ids:
+        session.execute(sqlalchemy.update(Flight), [
+            dict(id=flight_id, status=FlightStatusEnum.CANCELLED, arrival_time=None, pilot_id=None, copilot_id=None)
+            for flight_id in ids
+        ])
+    return len(ids)
+
+
+def edit_customers(session: Session, fake: Faker, n: int) -> int:
+    ids = sample_ids(session, Customer, n)
+    if ids:
+        session.execute(sqlalchemy.update(Customer), [
+            dict(id=customer_id, email=fake.email(), frequent_flyer=random.choice(['Yes', 'No']))
+            for customer_id in ids
+        ])
+    return len(ids)
+
+
+def append_reviews(session: Session, fake: Faker, n: int, fname: str = REVIEWS_FNAME) -> int:
+    flight_ids = sample_ids(session, Flight, max(1, n), Flight.status == FlightStatusEnum.SCHEDULED)
+    upper_customer = max_id(session, Customer)
+    if not flight_ids or upper_customer == 0:
+        return 0
+    with open(fname, "a", newline="") as f:
+        writer = csv.writer(f)
+        for _ in range(n):
+            scores = [random.randint(1, 5) for _ in range(5)]
+            review = data.csv.AirlineReview(
+                flight_id=random.choice(flight_ids),
+                customer_id=random.randint(1, upper_customer),
+                seat_class=random.choice(["Economy", "Premium Economy", "Business", "First"]),
+                content=fake.paragraph(),
+                rating=sum(scores) / len(scores),
+                recommended=random.random() < 0.6,
+                seat_comfort=scores[0],
+                cabin_staff_service=scores[1],
+                food_and_beverages=scores[2],
+                inflight_entertainment=scores[3],
+                value_for_money=scores[4],
+                date_published=datetime.now(),
+            )
+            # same layout parse_our_reviews expects, the date always carries microseconds
+            row = list(review.__dict__.values())
+            row[-1] = review.date_published.strftime("%Y-%m-%d %H:%M:%S.%f")
+            writer.writerow(row)
+    return n
+
+
+CHANGE_FNS = {
+    "new_flights": add_flights,
+    "new_bookings": add_bookings,
+    "delays": delay_flights,
+    "cancellations": cancel_flights,
+    "customer_edits": edit_customers,
+    "reviews": append_reviews,
+}
+
+
+def simulate_changes(
+        change_ratio: float = 0.01,
+        rate: float | None = None,
+        mix: dict[str, float] | None = None,
+        batch_size: int = 1000,
+        seed: int | None = None,
+) -> dict[str, int]:
+    """
+    Applies roughly change_ratio * (operational rows) changes, split according to mix,
+    in transactions of at most batch_size changes. With rate set (changes per second)
+    the stream is throttled to it, otherwise it runs as fast as the database allows.
+    Returns the number of changes applied per kind.
+    """
+    mix = mix or DEFAULT_MIX
+    unknown = set(mix) - set(CHANGE_FNS)
+    if unknown:
+        raise ValueError(f"Unknown change kinds: {unknown}")
+    random.seed(seed)
+    fake = Faker()
+    if seed is not None:
+        fake.seed_instance(seed)
+
+    session = database.get_session(reldb.engine)
+    base_rows = operational_row_count(session)
+    total_changes = math.ceil(base_rows * change_ratio)
+    weight = sum(mix.values())
+    targets = {kind: round(total_changes * share / weight) for kind, share in mix.items()}
+
+    print(f"+++++ Simulating {sum(targets.values()):,} changes ({change_ratio:.2%} of {base_rows:,} operational rows)"
+          f"{f' at {rate:,.0f} changes/s' if rate else ''}...")
+    applied = {kind: 0 for kind in mix}
+    exhausted = set()
+    start = time.perf_counter()
+    done = 0
+    while any(applied[kind] < targets[kind] and kind not in exhausted for kind in mix):
+        # interleave kinds in every transaction, like real traffic would
+        for kind in mix:
+            remaining = targets[kind] - applied[kind]
+            if remaining <= 0 or kind in exhausted:
+                continue
+            count = CHANGE_FNS[kind](session, fake, min(remaining, max(1, round(batch_size * mix[kind] / weight))))
+            if count == 0:
+                # an empty table or no eligible rows left, don't spin on it
+                exhausted.add(kind)
+            applied[kind] += count
+            done += count
+        session.commit()
+
+        if rate:
+            ahead = done / rate - (time.perf_counter() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+    session.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{'change':<16} {'applied':>10}")
+    for kind, count in applied.items():
+        print(f"{kind:<16} {count:>10,}")
+    print(f"+++++ {done:,} changes applied in {elapsed:.2f}s ({done / elapsed if elapsed else 0:,.0f} changes/s).")
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a stream of operational changes to the airline schema.")
+    parser.add_argument("--ratio", type=float, default=0.01, help=f"fraction of operational rows to change, e.g. {CHANGE_RATIOS}")
+    parser.add_argument("--rate", type=float, default=None, help="target changes per second, unthrottled if omitted")
+    parser.add_argument("--batch-size", type=int, default=1000, help="changes per transaction")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    simulate_changes(change_ratio=args.ratio, rate=args.rate, batch_size=args.batch_size, seed=args.seed)
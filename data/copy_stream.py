@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+"""
+Helpers for turning batches of ORM objects into Postgres COPY payloads.
+Used by the synth pipeline to skip the ORM insert path entirely.
+Supports the text, csv and binary COPY formats.
+"""
+
+import csv
+import enum
+import io
+import struct
+from datetime import date, datetime, timedelta
+
+import sqlalchemy
+from sqlalchemy.orm import DeclarativeBase
+
+COPY_FORMATS = ("text", "csv", "binary")
+
+PG_EPOCH = datetime(2000, 1, 1)
+PG_EPOCH_DATE = date(2000, 1, 1)
+MICROSECOND = datetime.resolution
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+BINARY_TRAILER = struct.pack("!h", -1)
+
+
+def table_columns(objs: list[DeclarativeBase]) -> tuple[sqlalchemy.Table, list[tuple[str, sqlalchemy.Column]]]:
+    """
+    Returns the target table and (attribute key, column) pairs to copy for a homogeneous list of objects.
+    Primary keys left empty on every object are dropped so the sequence default kicks in.
+    """
+    mapper = sqlalchemy.inspect(type(objs[0]))
+    table = mapper.local_table
+    assert isinstance(table, sqlalchemy.Table), f"{type(objs[0])} is not mapped to a table"
+
+    columns = []
+    for key, column in mapper.columns.items():
+        if column.primary_key and all(getattr(obj, key) is None for obj in objs):
+            continue
+        columns.append((key, column))
+
+    return table, columns
+
+
+def _column_value(obj: DeclarativeBase, key: str, column: sqlalchemy.Column):
+    value = getattr(obj, key)
+    # bulk_save_objects applies python-side scalar defaults for us, COPY does not
+    if value is None and column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+    if isinstance(value, enum.Enum):
+        value = value.value
+    return value
+
+
+def _text_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _binary_encoder(column: sqlalchemy.Column):
+    column_type = column.type
+    if isinstance(column_type, sqlalchemy.Boolean):
+        return lambda value: struct.pack("!?", value)
+    if isinstance(column_type, sqlalchemy.BigInteger):
+        return lambda value: struct.pack("!q", value)
+    if isinstance(column_type, sqlalchemy.Integer):
+        return lambda value: struct.pack("!i", value)
+    if isinstance(column_type, sqlalchemy.Float):
+        # sqlalchemy Float without precision maps to double precision
+        return lambda value: struct.pack("!d", value)
+    if isinstance(column_type, sqlalchemy.DateTime):
+        return lambda value: struct.pack("!q", (value - PG_EPOCH) // MICROSECOND)
+    if isinstance(column_type, sqlalchemy.Date):
+        return lambda value: struct.pack("!i", (value - PG_EPOCH_DATE).days)
+    # strings and enums share the text wire representation
+    return lambda value: str(value).encode()
+
+
+def encode_text(objs: list[DeclarativeBase]) -> tuple[str, list[str], bytes]:
+    """
+    Encodes objects as a COPY text format payload.
+    Returns (qualified table name, column names, payload).
+    """
+    table, columns = table_columns(objs)
+
+    buf = io.StringIO()
+    for obj in objs:
+        buf.write("\t".join(_text_value(_column_value(obj, key, column)) for key, column in columns))
+        buf.write("\n")
+
+    return table.fullname, [column.name for _, column in columns], buf.getvalue().encode()
+
+
+def encode_csv(objs: list[DeclarativeBase]) -> tuple[str, list[str], bytes]:
+    """
+    Encodes objects as a COPY csv format payload.
+    Every non-null field is quoted so empty strings survive the round trip.
+    """
+    table, columns = table_columns(objs)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_NOTNULL, lineterminator="\n")
+    for obj in objs:
+        writer.writerow([_csv_value(_column_value(obj, key, column)) for key, column in columns])
+
+    return table.fullname, [column.name for _, column in columns], buf.getvalue().encode()
+
+
+def encode_binary(objs: list[DeclarativeBase]) -> tuple[str, list[str], bytes]:
+    """
+    Encodes objects as a COPY binary format payload.
+    Cheapest for the server to parse, at the cost of strict typing on our side.
+    """
+    table, columns = table_columns(objs)
+    encoders = [_binary_encoder(column) for _, column in columns]
+    field_count = struct.pack("!h", len(columns))
+    null_field = struct.pack("!i", -1)
+
+    buf = io.BytesIO()
+    buf.write(BINARY_HEADER)
+    for obj in objs:
+        buf.write(field_count)
+        for (key, column), encoder in zip(columns, encoders):
+            value = _column_value(obj, key, column)
+            if value is None:
+                buf.write(null_field)
+                continue
+            data = encoder(value)
+            buf.write(struct.pack("!i", len(data)))
+            buf.write(data)
+    buf.write(BINARY_TRAILER)
+
+    return table.fullname, [column.name for _, column in columns], buf.getvalue()
+
+
+ENCODERS = {
+    "text": encode_text,
+    "csv": encode_csv,
+    "binary": encode_binary,
+}
+
+
+def encode(objs: list[DeclarativeBase], fmt: str = "text") -> tuple[str, list[str], bytes]:
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown COPY format: {fmt}")
+    return ENCODERS[fmt](objs)
+
+
+def _parse_value(column: sqlalchemy.Column, value: str):
+    column_type = column.type
+    if isinstance(column_type, sqlalchemy.Boolean):
+        return value in ("t", "true", "True")
+    if isinstance(column_type, sqlalchemy.Integer):
+        return int(value)
+    if isinstance(column_type, sqlalchemy.Float):
+        return float(value)
+    if isinstance(column_type, sqlalchemy.DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, sqlalchemy.Date):
+        return date.fromisoformat(value)
+    return value
+
+
+def _unescape_text(value: str) -> str:
+    if "\\" not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char != "\\":
+            out.append(char)
+            continue
+        escaped = next(chars, "")
+        out.append({"t": "\t", "n": "\n", "r": "\r"}.get(escaped, escaped))
+    return "".join(out)
+
+
+def _binary_decoder(column: sqlalchemy.Column):
+    column_type = column.type
+    if isinstance(column_type, sqlalchemy.Boolean):
+        return lambda data: data != b"\x00"
+    if isinstance(column_type, sqlalchemy.BigInteger):
+        return lambda data: struct.unpack("!q", data)[0]
+    if isinstance(column_type, sqlalchemy.Integer):
+        return lambda data: struct.unpack("!i", data)[0]
+    if isinstance(column_type, sqlalchemy.Float):
+        return lambda data: struct.unpack("!d", data)[0]
+    if isinstance(column_type, sqlalchemy.DateTime):
+        return lambda data: PG_EPOCH + timedelta(microseconds=struct.unpack("!q", data)[0])
+    if isinstance(column_type, sqlalchemy.Date):
+        return lambda data: PG_EPOCH_DATE + timedelta(days=struct.unpack("!i", data)[0])
+    return lambda data: data.decode()
+
+
+def decode(payload, fmt: str, columns: list[sqlalchemy.Column]) -> list[tuple]:
+    """
+    Inverse of encode(), used to read our own payloads back (e.g. from shard files).
+    The csv format cannot tell empty strings from nulls on the way back, both come out as None.
+    """
+    rows = []
+    if fmt == "binary":
+        view = memoryview(payload)
+        decoders = [_binary_decoder(column) for column in columns]
+        offset = len(BINARY_HEADER)
+        while True:
+            (field_count,) = struct.unpack_from("!h", view, offset)
+            offset += 2
+            if field_count == -1:
+                break
+            row = []
+            for decoder in decoders:
+                (length,) = struct.unpack_from("!i", view, offset)
+                offset += 4
+                if length == -1:
+                    row.append(None)
+                    continue
+                row.append(decoder(bytes(view[offset:offset + length])))
+                offset += length
+            rows.append(tuple(row))
+    elif fmt == "csv":
+        for record in csv.reader(io.StringIO(bytes(payload).decode())):
+            rows.append(tuple(
+                None if value == "" else _parse_value(column, value)
+                for column, value in zip(columns, record)
+            ))
+    elif fmt == "text":
+        for line in bytes(payload).decode().split("\n")[:-1]:
+            rows.append(tuple(
+                None if value == "\\N" else _parse_value(column, _unescape_text(value))
+                for column, value in zip(columns, line.split("\t"))
+            ))
+    else:
+        raise ValueError(f"Unknown COPY format: {fmt}")
+    return rows
+
+
+def copy_from_file(cursor, table: str, columns: list[str], file, fmt: str = "text") -> None:
+    """
+    Streams a file-like object holding an encoded payload into the given table using a raw psycopg2 cursor.
+    Does not commit.
+    """
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    stmt = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT {fmt})"
+    cursor.copy_expert(stmt, file)
+
+
+def copy_from_payload(cursor, table: str, columns: list[str], payload, fmt: str = "text") -> None:
+    copy_from_file(cursor, table, columns, io.BytesIO(payload), fmt)
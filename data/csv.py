@@ -10,7 +10,6 @@ from datetime import date, datetime
 import csv
 import random
 import os
-from faker import Faker
 import sqlalchemy
 from model.reldb import Flight
 from model.common import FlightStatusEnum
@@ -132,6 +131,8 @@ class AirlineReview:
         self.date_published: datetime = date_published
 
 def parse_airline_review_1(fname: str) -> list[AirlineReview]:
+    # deferred, the ETL imports this module for parse_our_reviews and never needs faker
+    from faker import Faker
     fake = Faker()
     cwd = os.getcwd()
     path = os.path.join(cwd, fname)
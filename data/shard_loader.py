@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Load half of the two-phase synthesis: bulk loads shard directories written by
+synthesize_reldb(shard_dir=...) into the operational database.
+Tables are loaded one at a time in FK order, the shards of each table in parallel COPYs.
+
+Usage:
+    python -m data.shard_loader load <shard_dir> [--workers N]
+    python -m data.shard_loader merge <out_dir> <shard_dir> [<shard_dir> ...]
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import database
+import database.reldb as reldb
+from data import copy_stream, shards
+from data.synth_pipeline import PipelineConfig, bulk_load
+
+
+def copy_shard(task: tuple[str, dict]) -> int:
+    shard_dir, entry = task
+    connection = reldb.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        with open(os.path.join(shard_dir, entry["path"]), "rb") as f:
+            copy_stream.copy_from_file(cursor, entry["table"], entry["columns"], f, entry["format"])
+        cursor.close()
+        connection.commit()
+    finally:
+        connection.close()
+    return entry["rows"]
+
+
+def load_shards(
+        shard_dir: str,
+        num_workers: int = 4,
+        unlogged: bool = True,
+        defer_indexes: bool = True,
+):
+    manifest = shards.read_manifest(shard_dir)
+    if not manifest["shards"]:
+        raise ValueError(f"No shards found in {shard_dir}")
+
+    print(f"+++++ Loading {len(manifest['shards'])} shards from {shard_dir} with {num_workers} workers...")
+    start = time.perf_counter()
+    database.wipe_schema(reldb.engine, reldb.metadata)
+    database.ensure_schema(reldb.engine, reldb.metadata)
+
+    total_rows = 0
+    config = PipelineConfig(num_rows=0, unlogged=unlogged, defer_indexes=defer_indexes)
+    with bulk_load(config, reldb.engine, reldb.metadata):
+        with mp.get_context("spawn").Pool(num_workers) as pool:
+            # parents before children, the FKs stay enforced during the load
+            for table in reldb.metadata.sorted_tables:
+                tasks = [(shard_dir, entry) for entry in manifest["shards"] if entry["table"] == table.fullname]
+                if not tasks:
+                    continue
+                table_start = time.perf_counter()
+                rows = sum(pool.imap_unordered(copy_shard, tasks))
+                total_rows += rows
+                print(f" --- {table.fullname}: {rows:,} rows from {len(tasks)} shards in {time.perf_counter() - table_start:.2f}s ---")
+
+    database.reset_sequences(reldb.engine, reldb.metadata)
+    elapsed = time.perf_counter() - start
+    print(f"+++++ Loaded {total_rows:,} rows in {elapsed:.2f}s ({total_rows / elapsed:,.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load or merge synthesized shard directories.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    load_parser = subparsers.add_parser("load", help="Load a shard directory into the operational database")
+    load_parser.add_argument("shard_dir")
+    load_parser.add_argument("--workers", type=int, default=4)
+    load_parser.add_argument("--logged", action="store_true", help="Keep tables logged during the load")
+    load_parser.add_argument("--keep-indexes", action="store_true", help="Maintain indexes during the load")
+
+    merge_parser = subparsers.add_parser("merge", help="Merge the manifests of several shard directories")
+    merge_parser.add_argument("out_dir")
+    merge_parser.add_argument("shard_dirs", nargs="+")
+
+    args = parser.parse_args()
+    if args.command == "load":
+        load_shards(args.shard_dir, args.workers, unlogged=not args.logged, defer_indexes=not args.keep_indexes)
+    else:
+        shards.merge_manifests(args.out_dir, args.shard_dirs)
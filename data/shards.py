@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""
+Sharded on-disk storage for synthesized batches.
+Every batch is written as one COPY payload file per table, described by a manifest.json
+in the shard directory, so a dataset can be generated once and bulk loaded many times
+(see data.shard_loader).
+"""
+
+import json
+import os
+
+from sqlalchemy.orm import DeclarativeBase
+
+from data import copy_stream
+from model.reldb import metadata
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+FILE_EXTENSIONS = {
+    "text": "tsv",
+    "csv": "csv",
+    "binary": "bin",
+}
+
+
+def manifest_path(shard_dir: str) -> str:
+    return os.path.join(shard_dir, MANIFEST_NAME)
+
+
+def read_manifest(shard_dir: str) -> dict:
+    path = manifest_path(shard_dir)
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "shards": []}
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version in {path}: {manifest.get('version')}")
+    return manifest
+
+
+def write_manifest(shard_dir: str, manifest: dict):
+    # write-then-rename so a crash never leaves a truncated manifest behind
+    path = manifest_path(shard_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def shard_key(entry: dict) -> tuple[str, str, int]:
+    return entry["table"], entry["phase"], entry["batch_id"]
+
+
+def append_manifest(shard_dir: str, entries: list[dict]):
+    """
+    Adds entries to the manifest, replacing any previous entry for the same (table, phase, batch).
+    Only ever called from a single process.
+    """
+    manifest = read_manifest(shard_dir)
+    by_key = {shard_key(entry): entry for entry in manifest["shards"]}
+    for entry in entries:
+        by_key[shard_key(entry)] = entry
+    manifest["shards"] = sorted(by_key.values(), key=shard_key)
+    write_manifest(shard_dir, manifest)
+
+
+def write_batch(
+        shard_dir: str,
+        phase: str,
+        batch_id: int,
+        batch: tuple[list[DeclarativeBase], ...],
+        fmt: str,
+) -> list[dict]:
+    """
+    Writes one file per non-empty table in the batch and returns their manifest entries.
+    """
+    entries = []
+    for list_of_objs in batch:
+        if not list_of_objs:
+            continue
+        table, columns, payload = copy_stream.encode(list_of_objs, fmt)
+        rel_path = os.path.join(table, f"{phase}-{batch_id:06d}.{FILE_EXTENSIONS[fmt]}")
+        os.makedirs(os.path.join(shard_dir, table), exist_ok=True)
+        with open(os.path.join(shard_dir, rel_path), "wb") as f:
+            f.write(payload)
+
+        entry = {
+            "table": table,
+            "columns": columns,
+            "format": fmt,
+            "path": rel_path,
+            "rows": len(list_of_objs),
+            "bytes": len(payload),
+            "phase": phase,
+            "batch_id": batch_id,
+        }
+        # explicit id ranges let merge_manifests catch shards that would collide on load
+        if "id" in columns:
+            ids = [obj.id for obj in list_of_objs]
+            entry["min_id"] = min(ids)
+            entry["max_id"] = max(ids)
+        entries.append(entry)
+    return entries
+
+
+def read_rows(shard_dir: str, table: str, columns: list[str]) -> list[tuple]:
+    """
+    Reads the given columns of every shard of a table back, ordered by (phase, batch).
+    """
+    table_columns = metadata.tables[table].c
+    rows = []
+    for entry in read_manifest(shard_dir)["shards"]:
+        if entry["table"] != table:
+            continue
+        with open(os.path.join(shard_dir, entry["path"]), "rb") as f:
+            payload = f.read()
+        decoded = copy_stream.decode(payload, entry["format"], [table_columns[name] for name in entry["columns"]])
+        positions = [entry["columns"].index(name) for name in columns]
+        rows.extend(tuple(row[i] for i in positions) for row in decoded)
+    return rows
+
+
+def merge_manifests(out_dir: str, src_dirs: list[str]) -> dict:
+    """
+    Builds a manifest in out_dir referencing the shards of several shard directories,
+    e.g. partitions generated on different machines. Files are not copied.
+    Shards with the same (table, phase, batch) are assumed identical and kept once,
+    overlapping explicit id ranges are rejected.
+    """
+    merged = {}
+    duplicates = 0
+    for src_dir in src_dirs:
+        for entry in read_manifest(src_dir)["shards"]:
+            key = shard_key(entry)
+            if key in merged:
+                duplicates += 1
+                continue
+            merged[key] = dict(entry, path=os.path.relpath(os.path.join(src_dir, entry["path"]), out_dir))
+
+    by_table: dict[str, list[dict]] = {}
+    for entry in merged.values():
+        if "min_id" in entry:
+            by_table.setdefault(entry["table"], []).append(entry)
+    for table, entries in by_table.items():
+        entries.sort(key=lambda entry: entry["min_id"])
+        for previous, current in zip(entries, entries[1:]):
+            if current["min_id"] <= previous["max_id"]:
+                raise ValueError(
+                    f"Overlapping ids in {table}: {previous['path']} and {current['path']}, "
+                    "were the partitions generated with distinct partition indexes?"
+                )
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"version": MANIFEST_VERSION, "shards": sorted(merged.values(), key=shard_key)}
+    write_manifest(out_dir, manifest)
+    print(f"+++++ Merged {len(merged)} shards from {len(src_dirs)} directories ({duplicates} duplicates skipped).")
+    return manifest
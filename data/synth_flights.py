@@ -67,14 +67,16 @@ def flight_producer(
     airport_ids: list[int], 
     airport_delay_probs: dict[int, float], 
     airplane_ids: list[int],
-    pilot_schedule: dict[int, list[tuple[datetime, datetime]]],
-    airplane_schedule: dict[int, list[tuple[datetime, datetime]]],
-    airplane_location: dict[int, int],
 ) -> tuple[list[Flight]]:
-    random.seed(batch_offset)
-
     results = []
 
+    # every batch places the airplanes afresh with its own seeded random (see synth_pipeline.batch_seed), locations
+    # and schedules carry over between the flights of a batch only, so a batch never depends on which other batches
+    # ran before it or in which worker
+    airplane_location = {airplane_id: random.choice(airport_ids) for airplane_id in airplane_ids}
+    pilot_schedule: dict[int, list[tuple[datetime, datetime]]] = defaultdict(list)
+    airplane_schedule: dict[int, list[tuple[datetime, datetime]]] = defaultdict(list)
+
     base_day = datetime(2024, 1, 1) + timedelta(days=batch_offset)
 
     for i in range(batch_size):
@@ -165,13 +167,12 @@ def flight_complement_producer(
     flight_ids: list[tuple[int, datetime, datetime]],
     crew_ids: list[int],
     max_customer_id: int,
-    crew_schedule: dict[int, list[tuple[datetime, datetime]]],
-    customer_schedule: dict[int, list[tuple[datetime, datetime]]],
 ):
-    random.seed(batch_offset)
-
     batch_crew_links = []
     batch_bookings = []
+    # per batch like the flight schedules, see flight_producer
+    crew_schedule: dict[int, list[tuple[datetime, datetime]]] = defaultdict(list)
+    customer_schedule: dict[int, list[tuple[datetime, datetime]]] = defaultdict(list)
 
     batch_flights = flight_ids[batch_offset * batch_size:(batch_offset + 1) * batch_size]
     for flight_id, dep_time, block_end in batch_flights:
@@ -180,10 +181,13 @@ def flight_complement_producer(
             pick_entity(max_customer_id, customer_schedule, dep_time, block_end) for _ in range(random.randint(120, 160))
         ]
 
+        # None when the one drawn is already busy at that time, the crew is one short and the seat stays empty
         for crew_id in crew:
-            batch_crew_links.append(FlightCabinCrew(flight_id=flight_id, cabin_crew_id=crew_id))
+            if crew_id is not None:
+                batch_crew_links.append(FlightCabinCrew(flight_id=flight_id, cabin_crew_id=crew_id))
 
         for seat_num, cust_id in enumerate(passengers, start=1):
-            batch_bookings.append(FlightBooking(flight_id=flight_id, customer_id=cust_id, seat_number=str(seat_num)))
+            if cust_id is not None:
+                batch_bookings.append(FlightBooking(flight_id=flight_id, customer_id=cust_id, seat_number=str(seat_num)))
 
     return batch_crew_links, batch_bookings
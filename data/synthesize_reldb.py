@@ -4,30 +4,23 @@
 Main file for synthesizing the operational database.
 """
 
+import argparse
 import math
+import os
 import random
-import pandas as pd
-from data import synth_flights
+from data import shards, synth_flights
 from model import common
-from model.reldb import Base, Pilot, CabinCrew, Airport, Customer, Flight, FlightBooking, FlightCabinCrew, Airplane
+from model.reldb import Base, Pilot, CabinCrew, Airport, Customer, Flight, FlightBooking, FlightCabinCrew, Airplane, SynthCheckpoint
 from faker import Faker
 import database
 import database.reldb as reldb
-from data.synth_pipeline import PipelineConfig, run_pipeline, default_session_factory
+from database import engines
+from data.synth_pipeline import PipelineConfig, bulk_load, run_pipeline, default_session_factory
+from util import profiling
 from sqlalchemy import select, text
-from multiprocessing.managers import SyncManager, DictProxy
-from collections import defaultdict
 
 
-# multiprocessing manager for defaultdict
-# implements mutexes et al for thread safety by default
-class CustomMPManager(SyncManager):
-    defaultdict = defaultdict
-
-CustomMPManager.register('defaultdict', defaultdict, DictProxy)
-
-
-def customers_producer(fake: Faker, batch_size: int, *args) -> tuple[list[Customer]]:
+def customers_producer(fake: Faker, batch_offset: int, batch_size: int, *args) -> tuple[list[Customer]]:
     return ([
         Customer(
             full_name=fake.name(),
@@ -102,248 +95,438 @@ def flight_complement_producer(fake: Faker, batch_offset: int, batch_size: int,
     return batch_crew_links, batch_bookings
 
 
-def synthesize_reldb(
-        num_aircraft: int = 40,
-        flights_per_aircraft_per_day: int = 5,
-        days_per_year: int = 365,
-        pax_per_flight: int = 150,
-        num_airports: int = 100,
-        unique_customer_percentage: float = 0.25,
-        batch_size: int = 4000,
-        p_ferry_flight: float = 0.05,
-):
-    print("+++++ Synthesizing database...")
-    print("Configuration:")
-    print(f"  - Number of aircraft: {num_aircraft}")
-    print(f"  - Flights per aircraft per day: {flights_per_aircraft_per_day}")
-    print(f"  - Days per year: {days_per_year}")
-    print(f"  - Passengers per flight: {pax_per_flight}")
-    print(f"  - Number of airports: {num_airports}")
-    print(f"  - Unique customer percentage: {unique_customer_percentage}")
-    print(f"  - Flight batch size: {batch_size}")
-    print(f"  - Ferry flight probability: {p_ferry_flight}")
-
-    # Annual estimates
-    annual_flights = num_aircraft * flights_per_aircraft_per_day * days_per_year
-    annual_passengers = annual_flights * pax_per_flight
-
-    # Regulatory estimates (US FAA + EASA guidelines)
-    # 1 flight = 2 pilots (pilot + co-pilot), assume max 1000 flight hours per year per pilot (realistic upper limit)
-    pilot_hours_per_flight = 2.5  # avg short-medium haul
-    max_hours_per_pilot_per_year = 900
-    total_pilot_hours_needed = annual_flights * pilot_hours_per_flight
-    num_pilots = math.ceil(total_pilot_hours_needed / max_hours_per_pilot_per_year)
-
-    # Cabin crew: avg 4 crew members per flight (A320/737 typical config), similar working hours
-    crew_hours_per_flight = 2.5
-    max_hours_per_crew_per_year = 1000
-    total_crew_hours_needed = annual_flights * crew_hours_per_flight * 4
-    num_cabin_crew = math.ceil(total_crew_hours_needed / max_hours_per_crew_per_year)
-
-    num_customers = math.ceil(annual_passengers * unique_customer_percentage)
-
-    # Distribution preview
-    distribution_summary = pd.DataFrame({
-        "Table": [
-            "pilots",
-            "cabin_crew",
-            "flights",
-            "flight_bookings",
-            "airports",
-            "customers"
-        ],
-        "Estimated Rows": [
-            num_pilots,
-            num_cabin_crew,
-            annual_flights,
-            annual_passengers,
-            num_airports,
-            num_customers
-        ]
-    })
-
-    # print dataframe to console
-    print("Distribution Summary:")
-    print(distribution_summary)
-
-    database.wipe_schema(reldb.engine, reldb.metadata)
-    database.ensure_schema(reldb.engine, reldb.metadata)
-    session = database.get_session(reldb.engine)
-    fake = Faker()
-
-    # --- Data Generation ---
+def generate_reference_data(
+        fake: Faker,
+        num_pilots: int,
+        num_cabin_crew: int,
+        num_airports: int,
+        num_aircraft: int,
+) -> tuple[list[Pilot], list[CabinCrew], list[Airport], list[Airplane]]:
     print("Generating pilots...")
-    for _ in range(num_pilots):
-        session.add(Pilot(name=fake.name(), license_number=fake.uuid4()))
+    pilots = [Pilot(name=fake.name(), license_number=fake.uuid4()) for _ in range(num_pilots)]
 
     print("Generating cabin crew...")
-    for _ in range(num_cabin_crew):
-        session.add(CabinCrew(name=fake.name(), employee_id=fake.uuid4()))
+    cabin_crew = [CabinCrew(name=fake.name(), employee_id=fake.uuid4()) for _ in range(num_cabin_crew)]
 
     print("Generating airports...")
-    for _ in range(num_airports):
-        session.add(Airport(
+    airports = [
+        Airport(
             code=fake.unique.bothify(text='???').upper(),
             name=fake.city() + " International",
             city=fake.city(),
             country=fake.country()
-        ))
+        )
+        for _ in range(num_airports)
+    ]
 
     print("Generating airplanes...")
     models = ["Airbus A320neo", "Boeing 737 MAX 8", "Airbus A321neo", "Boeing 787-9", "Airbus A350-900"]
-    for _ in range(num_aircraft):
-        session.add(Airplane(
+    airplanes = [
+        Airplane(
             model=random.choice(models),
             registration_number=fake.unique.bothify(text='REG-####'),
             fuel_consumption_per_hour=round(random.uniform(2.5, 6.0), 2),
             maintenance_days=random.randint(10, 30)
-        ))
+        )
+        for _ in range(num_aircraft)
+    ]
+
+    return pilots, cabin_crew, airports, airplanes
+
+
+def synthesize_shards(
+        shard_dir: str,
+        partition: tuple[int, int],
+        copy_format: str,
+        seed: int,
+        batch_size: int,
+        annual_flights: int,
+        annual_passengers: int,
+        num_customers: int,
+        num_pilots: int,
+        num_cabin_crew: int,
+        num_airports: int,
+        num_aircraft: int,
+):
+    """
+    Generation half of a two-phase synthesis, nothing touches the database.
+    Every row gets its id up front so shards reference each other without a round trip,
+    load them with data.shard_loader.
+    With partition=(index, count) only every count-th customer/flight batch is generated, so
+    several machines can split the work and their shard directories be merged afterwards.
+    Reference data is seeded and identical on every partition, schedules are only kept
+    consistent within one partition.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    partition_index, _ = partition
+
+    random.seed(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    reference_data = generate_reference_data(fake, num_pilots, num_cabin_crew, num_airports, num_aircraft)
+    for reference_objs in reference_data:
+        for i, obj in enumerate(reference_objs, start=1):
+            obj.id = i
+    shards.append_manifest(shard_dir, shards.write_batch(shard_dir, "reference", 0, reference_data, copy_format))
+    pilots, cabin_crew, airports, airplanes = reference_data
+    pilot_ids = [p.id for p in pilots]
+    cabin_crew_ids = [c.id for c in cabin_crew]
+    airport_ids = [a.id for a in airports]
+    airplane_ids = [a.id for a in airplanes]
+    print("+++++ Reference shards written.")
 
     print("Generating customers...")
-    # batching
     run_pipeline(
         config=PipelineConfig(
             num_rows=num_customers,
             batch_size=batch_size,
+            copy_format=copy_format,
+            shard_dir=shard_dir,
+            phase="customers",
+            assign_ids=("customers",),
+            partition=partition,
+            seed=seed,
         ),
         producer_fn=customers_producer,
         consumer_session_factory=default_session_factory,
     )
-    print("+++++ Base data inserted.")
-
-    print("Loading reference data...")
-
-    session.commit()
-    pilot_ids = [p.id for p in session.query(Pilot).all()]
-    airport_ids = [a.id for a in session.query(Airport).all()]
-    airplane_ids = [a.id for a in session.query(Airplane).all()]
-    # customer_ids = [c.id for c in session.query(Customer).all()]
-    
-    manager = CustomMPManager()
-    manager.start()
-    # mp_airplane_schedule = manager.dict({airplane_id: [] for airplane_id in airplane_ids})
-
-    pilot_schedule = manager.defaultdict(list)
-    airplane_schedule = manager.defaultdict(list)
-    airplane_location = manager.dict({airplane_id: random.choice(airport_ids) for airplane_id in airplane_ids})
-    
+    # customer ids are a pure function of the batch id, so this holds across all partitions
+    max_customer_id = (num_customers // batch_size) * batch_size
 
+    random.seed(seed)
     airport_delay_probs = synth_flights.generate_airport_delay_probabilities(airport_ids)
 
-
     print("Generating flights...")
     run_pipeline(
         config=PipelineConfig(
             num_rows=annual_flights,
             batch_size=batch_size,
+            copy_format=copy_format,
+            shard_dir=shard_dir,
+            phase="flights",
+            assign_ids=("flights",),
+            partition=partition,
+            seed=seed,
             producer_extra_args=(
                 pilot_ids,
                 airport_ids,
                 airport_delay_probs,
                 airplane_ids,
-                pilot_schedule,
-                airplane_schedule,
-                airplane_location,
             ),
         ),
         producer_fn=synth_flights.flight_producer,
         consumer_session_factory=default_session_factory,
     )
 
-    max_customer_id = session.execute(text("SELECT MAX(id) FROM airline.customers")).scalar()
-    cabin_crew_ids = [c.id for c in session.query(CabinCrew).all()]
-    flight_id_dep_arr = [(f.id, f.departure_time, f.arrival_time) for f in session.query(Flight).from_statement(select(Flight.id, Flight.departure_time, Flight.arrival_time).where(Flight.status == common.FlightStatusEnum.SCHEDULED))]
-    crew_schedule = manager.defaultdict(list)
-    customer_schedule = manager.defaultdict(list)
+    # read our own flights back instead of querying them
+    flight_id_dep_arr = sorted(
+        (flight_id, departure_time, arrival_time)
+        for flight_id, departure_time, arrival_time, status in shards.read_rows(
+            shard_dir, Flight.__table__.fullname, ["id", "departure_time", "arrival_time", "status"]
+        )
+        if status == common.FlightStatusEnum.SCHEDULED
+    )
 
     print("Generating flight complements...")
     run_pipeline(
         config=PipelineConfig(
             num_rows=annual_flights,
             batch_size=batch_size // (annual_passengers // annual_flights),
+            copy_format=copy_format,
+            shard_dir=shard_dir,
+            # complements slice the local flight list, so batch ids are only unique per partition
+            phase=f"flight_complements-{partition_index}",
+            seed=seed,
             producer_extra_args=(
                 flight_id_dep_arr,
                 cabin_crew_ids,
                 max_customer_id,
-                crew_schedule,
-                customer_schedule,
             ),
         ),
         producer_fn=synth_flights.flight_complement_producer,
         consumer_session_factory=default_session_factory,
     )
+    print(f"+++++ Shards written to {shard_dir}.")
+
 
+def synthesize_reldb(
+        num_aircraft: int = 40,
+        flights_per_aircraft_per_day: int = 5,
+        days_per_year: int = 365,
+        pax_per_flight: int = 150,
+        num_airports: int = 100,
+        unique_customer_percentage: float = 0.25,
+        batch_size: int = 4000,
+        p_ferry_flight: float = 0.05,
+        consumer_mode: str = "copy",
+        copy_format: str = "binary",
+        unlogged: bool = True,
+        defer_indexes: bool = True,
+        shard_dir: str | None = None,
+        partition: tuple[int, int] = (0, 1),
+        seed: int = 0,
+        resume: bool = False,
+):
+    if resume and shard_dir is not None:
+        raise ValueError("Resume relies on checkpoints in the database, it does not apply to shard runs")
+    print("+++++ Synthesizing database...")
+    print("Configuration:")
+    print(f"  - Number of aircraft: {num_aircraft}")
+    print(f"  - Flights per aircraft per day: {flights_per_aircraft_per_day}")
+    print(f"  - Days per year: {days_per_year}")
+    print(f"  - Passengers per flight: {pax_per_flight}")
+    print(f"  - Number of airports: {num_airports}")
+    print(f"  - Unique customer percentage: {unique_customer_percentage}")
+    print(f"  - Flight batch size: {batch_size}")
+    print(f"  - Ferry flight probability: {p_ferry_flight}")
+    print(f"  - Consumer mode: {consumer_mode} ({copy_format})")
+    print(f"  - Unlogged tables: {unlogged}, deferred indexes: {defer_indexes}")
+    if shard_dir is not None:
+        print(f"  - Shard directory: {shard_dir}, partition {partition[0]} of {partition[1]}")
+    print(f"  - Seed: {seed}{', resuming' if resume else ''}")
+
+    # options shared by every pipeline run below
+    pipeline_options = dict(
+        seed=seed,
+        consumer_mode=consumer_mode,
+        copy_format=copy_format,
+        unlogged=unlogged,
+        defer_indexes=defer_indexes,
+    )
 
+    # Annual estimates
+    annual_flights = num_aircraft * flights_per_aircraft_per_day * days_per_year
+    annual_passengers = annual_flights * pax_per_flight
 
-    # for i in range(0, annual_flights, batch_size):
-    #     print(f"\r  -> Batch {i // batch_size + 1} / {annual_flights // batch_size + 1}: Generating {batch_size} flights", end="")
-    #     batch_crew_links = []
-    #     batch_bookings = []
-
-    #     for _ in range(batch_size):
-    #         departure, arrival = random.sample(airport_ids, 2)
-    #         pilot, copilot = random.sample(pilot_ids, 2)
-    #         departure_date = fake.date_between(start_date='-1y', end_date='today')
-    #         is_ferry = random.random() < p_ferry_flight
-    #         estimated_hours = round(random.uniform(1.0, 10.0), 1)
-
-    #         assigned_airplane = None
-    #         for airplane_id, schedule in airplane_schedule.items():
-    #             if departure_date not in schedule:
-    #                 assigned_airplane = airplane_id
-    #                 schedule.append(departure_date)
-    #                 break
-    #         if assigned_airplane is None:
-    #             continue
-
-    #         flight = Flight(
-    #             flight_number=fake.bothify(text='??####'),
-    #             departure_airport_id=departure,
-    #             arrival_airport_id=arrival,
-    #             departure_time=departure_date,
-    #             pilot_id=pilot,
-    #             copilot_id=copilot,
-    #             airplane_id=assigned_airplane,
-    #             is_ferry_flight=is_ferry,
-    #             estimated_flight_hours=estimated_hours
-    #         )
-    #         session.add(flight)
-    #         session.flush()
-
-    #         if not is_ferry:
-    #             assigned_crew = random.sample(cabin_crew_ids, 4)
-    #             for crew_id in assigned_crew:
-    #                 batch_crew_links.append(FlightCabinCrew(
-    #                     flight_id=flight.id,
-    #                     cabin_crew_id=crew_id
-    #                 ))
-
-    #             passengers = random.randint(120, 160)
-    #             booked_customers = random.sample(customer_ids, passengers)
-    #             for seat_num, cust_id in enumerate(booked_customers, start=1):
-    #                 batch_bookings.append(FlightBooking(
-    #                     flight_id=flight.id,
-    #                     customer_id=cust_id,
-    #                     seat_number=str(seat_num)
-    #                 ))
-
-    #     session.bulk_save_objects(batch_crew_links)
-    #     session.bulk_save_objects(batch_bookings)
-    #     session.commit()
+    # Regulatory estimates (US FAA + EASA guidelines)
+    # 1 flight = 2 pilots (pilot + co-pilot), assume max 1000 flight hours per year per pilot (realistic upper limit)
+    pilot_hours_per_flight = 2.5  # avg short-medium haul
+    max_hours_per_pilot_per_year = 900
+    total_pilot_hours_needed = annual_flights * pilot_hours_per_flight
+    num_pilots = math.ceil(total_pilot_hours_needed / max_hours_per_pilot_per_year)
 
+    # Cabin crew: avg 4 crew members per flight (A320/737 typical config), similar working hours
+    crew_hours_per_flight = 2.5
+    max_hours_per_crew_per_year = 1000
+    total_crew_hours_needed = annual_flights * crew_hours_per_flight * 4
+    num_cabin_crew = math.ceil(total_crew_hours_needed / max_hours_per_crew_per_year)
+
+    num_customers = math.ceil(annual_passengers * unique_customer_percentage)
+
+    # Distribution preview, pandas only for printing it so it is imported here
+    import pandas as pd
+    distribution_summary = pd.DataFrame({
+        "Table": [
+            "pilots",
+            "cabin_crew",
+            "flights",
+            "flight_bookings",
+            "airports",
+            "customers"
+        ],
+        "Estimated Rows": [
+            num_pilots,
+            num_cabin_crew,
+            annual_flights,
+            annual_passengers,
+            num_airports,
+            num_customers
+        ]
+    })
+
+    # print dataframe to console
+    print("Distribution Summary:")
+    print(distribution_summary)
+
+    if shard_dir is not None:
+        synthesize_shards(
+            shard_dir,
+            partition,
+            copy_format,
+            seed,
+            batch_size,
+            annual_flights,
+            annual_passengers,
+            num_customers,
+            num_pilots,
+            num_cabin_crew,
+            num_airports,
+            num_aircraft,
+        )
+        return
+
+    if not resume:
+        database.wipe_schema(reldb.engine, reldb.metadata)
+    database.ensure_schema(reldb.engine, reldb.metadata)
+    # customers and flights get explicit ids derived from their batch ids, so reruns of a batch
+    # produce the same rows and every batch is recorded in synth_checkpoints alongside its rows
+    pipeline_options.update(checkpoint=True, resume=resume)
+    with bulk_load(PipelineConfig(num_rows=0, **pipeline_options), reldb.engine, reldb.metadata):
+        # closed before bulk_load exits, even on failure: its ALTER TABLEs need exclusive locks the session's snapshot would block
+        with database.get_session(reldb.engine) as session:
+            # --- Data Generation ---
+            if session.get(SynthCheckpoint, ("reference", 0)) is None:
+                with profiling.profiled("reference"):
+                    random.seed(seed)
+                    fake = Faker()
+                    fake.seed_instance(seed)
+                    reference_data = generate_reference_data(fake, num_pilots, num_cabin_crew, num_airports, num_aircraft)
+                    for reference_objs in reference_data:
+                        session.add_all(reference_objs)
+                    session.add(SynthCheckpoint(phase="reference", batch_id=0, num_rows=sum(len(objs) for objs in reference_data)))
+                    session.commit()
+                    print("+++++ Reference data inserted.")
+            else:
+                print(" --- Reference data already committed, skipping ---")
+
+            print("Generating customers...")
+            # batching
+            run_pipeline(
+                config=PipelineConfig(
+                    num_rows=num_customers,
+                    batch_size=batch_size,
+                    phase="customers",
+                    assign_ids=("customers",),
+                    **pipeline_options,
+                ),
+                producer_fn=customers_producer,
+                consumer_session_factory=default_session_factory,
+            )
+            print("+++++ Base data inserted.")
+
+            print("Loading reference data...")
+
+            pilot_ids = list(session.scalars(select(Pilot.id).order_by(Pilot.id)))
+            airport_ids = list(session.scalars(select(Airport.id).order_by(Airport.id)))
+            airplane_ids = list(session.scalars(select(Airplane.id).order_by(Airplane.id)))
+            # customer_ids = [c.id for c in session.query(Customer).all()]
+
+            # reseeded so a resumed run sees the same delay probabilities, locations and schedules are kept per batch
+            random.seed(seed)
+            airport_delay_probs = synth_flights.generate_airport_delay_probabilities(airport_ids)
+
+            print("Generating flights...")
+            run_pipeline(
+                config=PipelineConfig(
+                    num_rows=annual_flights,
+                    batch_size=batch_size,
+                    phase="flights",
+                    assign_ids=("flights",),
+                    **pipeline_options,
+                    producer_extra_args=(
+                        pilot_ids,
+                        airport_ids,
+                        airport_delay_probs,
+                        airplane_ids,
+                    ),
+                ),
+                producer_fn=synth_flights.flight_producer,
+                consumer_session_factory=default_session_factory,
+            )
+
+            max_customer_id = session.execute(text("SELECT MAX(id) FROM airline.customers")).scalar()
+            cabin_crew_ids = list(session.scalars(select(CabinCrew.id).order_by(CabinCrew.id)))
+            # complement batches slice this list, it has to come back in the same order on resume
+            flight_id_dep_arr = [tuple(row) for row in session.execute(engines.streamed(
+                select(Flight.id, Flight.departure_time, Flight.arrival_time)
+                .where(Flight.status == common.FlightStatusEnum.SCHEDULED)
+                .order_by(Flight.id)
+            ))]
+
+            print("Generating flight complements...")
+            run_pipeline(
+                config=PipelineConfig(
+                    num_rows=annual_flights,
+                    batch_size=batch_size // (annual_passengers // annual_flights),
+                    phase="flight_complements",
+                    **pipeline_options,
+                    producer_extra_args=(
+                        flight_id_dep_arr,
+                        cabin_crew_ids,
+                        max_customer_id,
+                    ),
+                ),
+                producer_fn=synth_flights.flight_complement_producer,
+                consumer_session_factory=default_session_factory,
+            )
+
+
+        # for i in range(0, annual_flights, batch_size):
+        #     print(f"\r  -> Batch {i // batch_size + 1} / {annual_flights // batch_size + 1}: Generating {batch_size} flights", end="")
+        #     batch_crew_links = []
+        #     batch_bookings = []
+
+        #     for _ in range(batch_size):
+        #         departure, arrival = random.sample(airport_ids, 2)
+        #         pilot, copilot = random.sample(pilot_ids, 2)
+        #         departure_date = fake.date_between(start_date='-1y', end_date='today')
+        #         is_ferry = random.random() < p_ferry_flight
+        #         estimated_hours = round(random.uniform(1.0, 10.0), 1)
+
+        #         assigned_airplane = None
+        #         for airplane_id, schedule in airplane_schedule.items():
+        #             if departure_date not in schedule:
+        #                 assigned_airplane = airplane_id
+        #                 schedule.append(departure_date)
+        #                 break
+        #         if assigned_airplane is None:
+        #             continue
+
+        #         flight = Flight(
+        #             flight_number=fake.bothify(text='??####'),
+        #             departure_airport_id=departure,
+        #             arrival_airport_id=arrival,
+        #             departure_time=departure_date,
+        #             pilot_id=pilot,
+        #             copilot_id=copilot,
+        #             airplane_id=assigned_airplane,
+        #             is_ferry_flight=is_ferry,
+        #             estimated_flight_hours=estimated_hours
+        #         )
+        #         session.add(flight)
+        #         session.flush()
+
+        #         if not is_ferry:
+        #             assigned_crew = random.sample(cabin_crew_ids, 4)
+        #             for crew_id in assigned_crew:
+        #                 batch_crew_links.append(FlightCabinCrew(
+        #                     flight_id=flight.id,
+        #                     cabin_crew_id=crew_id
+        #                 ))
+
+        #             passengers = random.randint(120, 160)
+        #             booked_customers = random.sample(customer_ids, passengers)
+        #             for seat_num, cust_id in enumerate(booked_customers, start=1):
+        #                 batch_bookings.append(FlightBooking(
+        #                     flight_id=flight.id,
+        #                     customer_id=cust_id,
+        #                     seat_number=str(seat_num)
+        #                 ))
+
+        #     session.bulk_save_objects(batch_crew_links)
+        #     session.bulk_save_objects(batch_bookings)
+        #     session.commit()
+
+    # explicit ids leave the serial sequences behind
+    database.reset_sequences(reldb.engine, reldb.metadata)
     print("+++++ Flights, airplane assignments, crew, and bookings created.")
 
 if __name__ == "__main__":
-    synthesize_reldb()
-
-# if __name__ == "__main__":
-#     session = get_airline_session()
-#     flight_ids = [f.id for f in session.query(Flight).all()]
-#     cabin_crew_ids = [c.id for c in session.query(CabinCrew).all()]
-#     max_customer_id = session.execute(text("SELECT MAX(id) FROM airline.customers")).scalar()
-#     print('starting profiling')
-#     import cProfile
-#     cp = cProfile.Profile()
-#     cp.runcall(flight_complement_producer, Faker(), 0, 10000, flight_ids, cabin_crew_ids, max_customer_id)
-#     print('profiling done')
-#     cp.print_stats()
+    parser = argparse.ArgumentParser(description="Synthesize the operational database.")
+    parser.add_argument("--resume", action="store_true", help="Keep committed batches and only generate the missing ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shard-dir", help="Write shard files here instead of loading the database")
+    parser.add_argument("--partition", default="0/1", help="index/count of the batches to generate in shard mode")
+    parser.add_argument("--profile", help="Write cProfile and tracemalloc reports of every phase and worker into this directory")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable(args.profile)
+    partition_index, partition_count = map(int, args.partition.split("/"))
+    synthesize_reldb(
+        shard_dir=args.shard_dir,
+        partition=(partition_index, partition_count),
+        seed=args.seed,
+        resume=args.resume,
+    )
+    if args.profile:
+        profiling.write_report(args.profile)
@@ -49,5 +49,41 @@ def truncate_schema(engine: sqlalchemy.Engine, metadata: sqlalchemy.MetaData):
                 raise 
     print("+++++ Schema truncated successfully.")
 
+def set_logged(engine: sqlalchemy.Engine, metadata: sqlalchemy.MetaData, logged: bool):
+    # permanent tables may not reference unlogged ones, so children go unlogged first and parents go logged first
+    tables = metadata.sorted_tables if logged else list(reversed(metadata.sorted_tables))
+    persistence = "LOGGED" if logged else "UNLOGGED"
+    with engine.begin() as conn:
+        for table in tables:
+            conn.execute(sqlalchemy.text(f"ALTER TABLE {table.fullname} SET {persistence}"))
+    print(f"+++++ Tables set to {persistence}.")
+
+def drop_indexes(engine: sqlalchemy.Engine, metadata: sqlalchemy.MetaData):
+    with engine.begin() as conn:
+        for table in metadata.tables.values():
+            for index in table.indexes:
+                index.drop(conn, checkfirst=True)
+    print("+++++ Indexes dropped successfully.")
+
+def create_indexes(engine: sqlalchemy.Engine, metadata: sqlalchemy.MetaData):
+    with engine.begin() as conn:
+        for table in metadata.tables.values():
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    print("+++++ Indexes created successfully.")
+
+def reset_sequences(engine: sqlalchemy.Engine, metadata: sqlalchemy.MetaData):
+    # rows loaded with explicit ids leave serial sequences behind, move them past the current max
+    with engine.begin() as conn:
+        for table in metadata.tables.values():
+            for column in table.primary_key.columns:
+                if not isinstance(column.type, sqlalchemy.Integer):
+                    continue
+                conn.execute(sqlalchemy.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.fullname}', '{column.name}'), "
+                    f"COALESCE((SELECT MAX({column.name}) FROM {table.fullname}), 0) + 1, false)"
+                ))
+    print("+++++ Sequences reset successfully.")
+
 def get_session(engine: sqlalchemy.Engine):
     return sessionmaker(bind=engine)()
\ No newline at end of file
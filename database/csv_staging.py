@@ -5,12 +5,13 @@ Schema for the csv staging database.
 Used for a single table (airline_reviews) to simplify ETL for review csv files
 """
 
-from sqlalchemy import MetaData, Integer, String, DateTime, Boolean, Float, create_engine
+from sqlalchemy import MetaData, Integer, String, DateTime, Boolean, Float
 from sqlalchemy.orm import DeclarativeBase, mapped_column
 from datetime import datetime
-from constants import CSV_STAGING_SCHEMA, DATABASE_URL
+from constants import CSV_STAGING_SCHEMA
+from database import engines
 
-engine = create_engine(DATABASE_URL)
+__getattr__ = engines.engine_attribute("warehouse", __name__)
 metadata = MetaData(schema=CSV_STAGING_SCHEMA)
 
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+Engine registry, one engine (and connection pool) per role instead of one per module or per call.
+    operational  the operational database (reldb)
+    warehouse    warehouse, csv staging and star schema, the loaders share its pool
+    meta         ETL bookkeeping (etl_meta): ledger, locks, change log status
+    synth        synth pipeline consumers, one or two connections per consumer process
+    extract      reads of the warehouse loads on the operational database: streamed extract, latency probes
+Each role has its own pool size and session settings (statement_timeout, work_mem, max_parallel_workers_per_gather,
+application_name, so pg_stat_activity tells the roles apart). ETL_<ROLE>_STATEMENT_TIMEOUT, ETL_<ROLE>_WORK_MEM and
+ETL_<ROLE>_PARALLEL_WORKERS override a role's settings, e.g. ETL_EXTRACT_WORK_MEM=16MB (see etl.governor).
+Engines are created on first use, importing a database module does not need its URL. Forked children drop the inherited pool connections on start and open their own, spawned
+ones import the registry fresh.
+"""
+
+import os
+
+import sqlalchemy
+
+import constants
+
+# rows fetched per round trip by server-side cursors, see streamed()
+LARGE_READ_ROWS = 10_000
+
+
+class EngineSettings:
+    def __init__(self,
+                 url: str,
+                 pool_size: int = 5,
+                 max_overflow: int = 10,
+                 pre_ping: bool = True, # checks connections on checkout, long idle ones get dropped by servers and poolers
+                 statement_timeout: str | None = None, # postgres interval, e.g. "30s"
+                 work_mem: str | None = None, # e.g. "256MB"
+                 max_parallel_workers_per_gather: int | None = None,
+                 application_name: str = "airline-bi",
+                 execution_options: dict | None = None,
+                 ):
+        self.url = url
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pre_ping = pre_ping
+        self.statement_timeout = statement_timeout
+        self.work_mem = work_mem
+        self.max_parallel_workers_per_gather = max_parallel_workers_per_gather
+        self.application_name = application_name
+        self.execution_options = execution_options or {}
+
+    def connect_args(self) -> dict:
+        options = []
+        if self.statement_timeout is not None:
+            options.append(f"-c statement_timeout={self.statement_timeout}")
+        if self.work_mem is not None:
+            options.append(f"-c work_mem={self.work_mem}")
+        if self.max_parallel_workers_per_gather is not None:
+            options.append(f"-c max_parallel_workers_per_gather={self.max_parallel_workers_per_gather}")
+        args = {"application_name": self.application_name}
+        if options:
+            args["options"] = " ".join(options)
+        return args
+
+
+# factories, the URLs are only looked up when a role's engine is first created
+ROLES = {
+    "operational": lambda: EngineSettings(
+        constants.DATABASE_URL,
+        application_name="airline-bi/operational",
+    ),
+    "warehouse": lambda: EngineSettings(
+        constants.WAREHOUSE_DATABASE_URL,
+        pool_size=4,
+        max_overflow=4,
+        # the SCD2 statements hash join and sort whole tables
+        work_mem="256MB",
+        application_name="airline-bi/warehouse",
+        # with separate databases the loaders read the operational tables from their streamed copies on the warehouse side,
+        # the same statements run against both setups
+        execution_options={"schema_translate_map": {constants.AIRLINE_SCHEMA: constants.AIRLINE_STAGING_SCHEMA}} if constants.SPLIT_DATABASES else None,
+    ),
+    "meta": lambda: EngineSettings(
+        constants.DATABASE_URL,
+        pool_size=2,
+        max_overflow=3,
+        # bookkeeping must never hold up a load for long
+        statement_timeout="30s",
+        application_name="airline-bi/meta",
+    ),
+    "synth": lambda: EngineSettings(
+        constants.DATABASE_URL,
+        pool_size=1,
+        max_overflow=1,
+        application_name="airline-bi/synth",
+    ),
+    "extract": lambda: EngineSettings(
+        constants.DATABASE_URL,
+        pool_size=2,
+        max_overflow=2,
+        # plain key range scans, the parallel workers are left to operational traffic
+        max_parallel_workers_per_gather=0,
+        application_name="airline-bi/extract",
+    ),
+}
+
+# environment variable suffix per setting, see environment_overrides()
+ENV_SETTINGS = {
+    "STATEMENT_TIMEOUT": "statement_timeout",
+    "WORK_MEM": "work_mem",
+    "PARALLEL_WORKERS": "max_parallel_workers_per_gather",
+}
+
+_engines: dict[str, sqlalchemy.Engine] = {}
+
+
+def environment_overrides(role: str) -> dict:
+    overrides = {}
+    for suffix, setting in ENV_SETTINGS.items():
+        value = os.getenv(f"ETL_{role.upper()}_{suffix}")
+        if value:
+            overrides[setting] = int(value) if setting == "max_parallel_workers_per_gather" else value
+    return overrides
+
+
+def create_role_engine(role: str, **overrides) -> sqlalchemy.Engine:
+    """
+    A new engine with the settings of role, overrides replace single settings (e.g. pool_size for a benchmark),
+    the environment's (environment_overrides) included.
+    Not registered, the caller disposes it.
+    """
+    if role not in ROLES:
+        raise ValueError(f"Unknown engine role: {role}")
+    settings = EngineSettings(**{**vars(ROLES[role]()), **environment_overrides(role), **overrides})
+    return sqlalchemy.create_engine(
+        settings.url,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_pre_ping=settings.pre_ping,
+        connect_args=settings.connect_args(),
+        execution_options=settings.execution_options,
+    )
+
+
+def get_engine(role: str) -> sqlalchemy.Engine:
+    if role not in _engines:
+        _engines[role] = create_role_engine(role)
+    return _engines[role]
+
+
+def engine_attribute(role: str, module_name: str):
+    """
+    Module __getattr__ for database modules: their engine attribute is the role's engine, created on first access.
+    """
+    def __getattr__(name: str):
+        if name == "engine":
+            return get_engine(role)
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+    return __getattr__
+
+
+def streamed(statement):
+    # server-side cursor, large reads arrive LARGE_READ_ROWS at a time instead of all at once
+    return statement.execution_options(yield_per=LARGE_READ_ROWS)
+
+
+def dispose_all():
+    for engine in _engines.values():
+        engine.dispose()
+
+
+def _after_fork():
+    # the parent's connections must not be used from the child, close=False leaves them open for the parent
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
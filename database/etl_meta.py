@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Schema for ETL bookkeeping, kept apart from the warehouse and star schema so full loads do not wipe it.
+etl_runs is the run ledger: one row per batch, the batch id comes from a sequence.
+etl_run_tables has the rows each batch inserted, closed (SCD2 end_date set) and deleted per table.
+etl_source_states has the source signatures a successful batch started from.
+etl_lock_decisions records every attempt to take the stage locks and what came of it.
+etl_change_log is the CDC log the triggers on the operational tables write to (see etl.cdc).
+etl_checkpoints has the steps (one table each) a batch committed, a failed batch resumes after them (see etl.checkpoints).
+"""
+
+from sqlalchemy import MetaData, BigInteger, Integer, String, DateTime, Float, ForeignKey, Sequence, func
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from constants import ETL_META_SCHEMA
+from database import engines
+
+__getattr__ = engines.engine_attribute("meta", __name__)
+metadata = MetaData(schema=ETL_META_SCHEMA)
+
+batch_id_seq = Sequence("etl_batch_id_seq", metadata=metadata)
+
+
+class Base(DeclarativeBase):
+    metadata = metadata
+
+class EtlRun(Base):
+    __tablename__ = "etl_runs"
+
+    batch_id: Mapped[int] = mapped_column(Integer, batch_id_seq, primary_key=True)
+    kind: Mapped[str] = mapped_column(String) # "full", "reload", "incremental", "csv" or "cdc"
+    status: Mapped[str] = mapped_column(String) # "running", "succeeded" or "failed"
+    started_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+    finished_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+    duration_seconds: Mapped[float] = mapped_column(Float, nullable=True)
+    rows_inserted: Mapped[int] = mapped_column(Integer, default=0)
+    rows_closed: Mapped[int] = mapped_column(Integer, default=0)
+    rows_deleted: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[str] = mapped_column(String, nullable=True)
+
+class EtlRunTable(Base):
+    __tablename__ = "etl_run_tables"
+
+    batch_id: Mapped[int] = mapped_column(Integer, ForeignKey(EtlRun.batch_id, ondelete="CASCADE"), primary_key=True)
+    table_name: Mapped[str] = mapped_column(String, primary_key=True)
+    phase: Mapped[str] = mapped_column(String)
+    statements: Mapped[int] = mapped_column(Integer, default=0)
+    rows_inserted: Mapped[int] = mapped_column(Integer, default=0)
+    rows_closed: Mapped[int] = mapped_column(Integer, default=0)
+    rows_deleted: Mapped[int] = mapped_column(Integer, default=0)
+    seconds: Mapped[float] = mapped_column(Float, default=0.0)
+
+class EtlSourceState(Base):
+    # change detection signals of each source as a successful run saw them before loading (see etl.change_detection)
+    __tablename__ = "etl_source_states"
+
+    batch_id: Mapped[int] = mapped_column(Integer, ForeignKey(EtlRun.batch_id, ondelete="CASCADE"), primary_key=True)
+    source: Mapped[str] = mapped_column(String, primary_key=True)
+    signature: Mapped[str] = mapped_column(String)
+
+class EtlLockDecision(Base):
+    # what a run did about the stage locks (see etl.locks), coalesced requests are handled by the run holding them
+    __tablename__ = "etl_lock_decisions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    stages: Mapped[str] = mapped_column(String)
+    mode: Mapped[str] = mapped_column(String) # "skip", "wait" or "coalesce"
+    decision: Mapped[str] = mapped_column(String) # "acquired", "skipped", "timed_out" or "coalesced"
+    waited_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    decided_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+    handled_at: Mapped[DateTime] = mapped_column(DateTime, nullable=True)
+
+class EtlChangeLog(Base):
+    # one row per changed operational row, consumed in id order by etl.warehouse.apply_change_log
+    __tablename__ = "etl_change_log"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    table_name: Mapped[str] = mapped_column(String)
+    pk: Mapped[int] = mapped_column(Integer, nullable=True) # null for a truncate
+    op: Mapped[str] = mapped_column(String(1)) # "I", "U", "D" or "T"
+    changed_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.clock_timestamp())
+
+class EtlCheckpoint(Base):
+    # no foreign key to etl_runs, loads run with an explicit batch id outside the ledger checkpoint as well
+    __tablename__ = "etl_checkpoints"
+
+    batch_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    step: Mapped[str] = mapped_column(String, primary_key=True) # the table the step loaded, e.g. "warehouse.flights"
+    rows: Mapped[int] = mapped_column(Integer, default=0) # warehouse rows inserted or closed
+    committed_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
@@ -5,9 +5,8 @@ Base file for the operational database.
 """
 
 
-from sqlalchemy import create_engine
-import constants
+from database import engines
 from model.reldb import metadata
 
-engine = create_engine(constants.DATABASE_URL)
+__getattr__ = engines.engine_attribute("operational", __name__)
 metadata = metadata
\ No newline at end of file
@@ -4,9 +4,9 @@
 Base file for the star schema database.
 """
 
-from sqlalchemy import create_engine, MetaData
-import constants
+from sqlalchemy import MetaData
+from database import engines
 import model.star_schema as star_schema
 
-engine = create_engine(constants.DATABASE_URL)
+__getattr__ = engines.engine_attribute("warehouse", __name__)
 metadata = star_schema.metadata
\ No newline at end of file
@@ -4,9 +4,8 @@
 Base file for the warehouse database.
 """
 
-from sqlalchemy import create_engine
-import constants
+from database import engines
 from model.warehouse import metadata
 
-engine = create_engine(constants.DATABASE_URL)
+__getattr__ = engines.engine_attribute("warehouse", __name__)
 metadata = metadata
\ No newline at end of file
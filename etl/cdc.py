@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""
+Trigger based change data capture of the operational tables.
+install_capture() puts row level triggers on the tables the warehouse loads from, every inserted, updated
+or deleted row appends (table, pk, op, changed_at) to etl_meta.etl_change_log in the writing transaction,
+a TRUNCATE appends one entry without a pk. etl.warehouse.apply_change_log() consumes the log in order and
+only touches the warehouse versions of the logged keys, instead of diffing whole tables.
+The triggers cost every write to the operational tables an extra insert, so they are opt in; drop them
+before bulk synthesizing data.
+
+Usage:
+    python -m etl.cdc install
+    python -m etl.cdc status
+    python -m etl.cdc remove
+"""
+
+import argparse
+
+import sqlalchemy
+
+import database.etl_meta as etl_meta
+import database.reldb as reldb
+import etl.instrumentation as instrumentation
+from database.etl_meta import EtlChangeLog
+from etl import ledger
+from etl.warehouse import id_map
+
+ROW_TRIGGER_NAME = "etl_cdc_row"
+TRUNCATE_TRIGGER_NAME = "etl_cdc_truncate"
+FUNCTION_NAME = "etl_cdc_capture"
+
+
+def install_capture():
+    """
+    (Re)creates the capture function and triggers, synthesizing the operational db drops the triggers with the schema.
+    """
+    ledger.ensure_ledger()
+    schema = reldb.metadata.schema
+    log_table = f"{etl_meta.metadata.schema}.{EtlChangeLog.__tablename__}"
+    with reldb.engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f"""
+            CREATE OR REPLACE FUNCTION {etl_meta.metadata.schema}.{FUNCTION_NAME}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    INSERT INTO {log_table} (table_name, pk, op) VALUES (TG_TABLE_NAME, NULL, 'T');
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO {log_table} (table_name, pk, op) VALUES (TG_TABLE_NAME, OLD.id, 'D');
+                ELSE
+                    INSERT INTO {log_table} (table_name, pk, op) VALUES (TG_TABLE_NAME, NEW.id, left(TG_OP, 1));
+                    -- a changed id leaves the old one behind as deleted
+                    IF TG_OP = 'UPDATE' AND OLD.id <> NEW.id THEN
+                        INSERT INTO {log_table} (table_name, pk, op) VALUES (TG_TABLE_NAME, OLD.id, 'D');
+                    END IF;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        for table_name in id_map:
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {ROW_TRIGGER_NAME} ON {schema}.{table_name}"))
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {TRUNCATE_TRIGGER_NAME} ON {schema}.{table_name}"))
+            connection.execute(sqlalchemy.text(
+                f"CREATE TRIGGER {ROW_TRIGGER_NAME} AFTER INSERT OR UPDATE OR DELETE ON {schema}.{table_name} "
+                f"FOR EACH ROW EXECUTE FUNCTION {etl_meta.metadata.schema}.{FUNCTION_NAME}()"
+            ))
+            connection.execute(sqlalchemy.text(
+                f"CREATE TRIGGER {TRUNCATE_TRIGGER_NAME} AFTER TRUNCATE ON {schema}.{table_name} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION {etl_meta.metadata.schema}.{FUNCTION_NAME}()"
+            ))
+    instrumentation.log_event("cdc_installed", log=log_table, tables=",".join(id_map))
+
+
+def remove_capture():
+    schema = reldb.metadata.schema
+    with reldb.engine.begin() as connection:
+        for table_name in id_map:
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {ROW_TRIGGER_NAME} ON {schema}.{table_name}"))
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {TRUNCATE_TRIGGER_NAME} ON {schema}.{table_name}"))
+        connection.execute(sqlalchemy.text(f"DROP FUNCTION IF EXISTS {etl_meta.metadata.schema}.{FUNCTION_NAME}()"))
+    instrumentation.log_event("cdc_removed")
+
+
+def pending_changes() -> dict[str, int]:
+    # log entries not consumed yet, per table
+    ledger.ensure_ledger()
+    with etl_meta.engine.connect() as connection:
+        return dict(connection.execute(
+            sqlalchemy.select(EtlChangeLog.table_name, sqlalchemy.func.count()).group_by(EtlChangeLog.table_name)
+        ).tuples().all())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trigger based change data capture of the operational tables.")
+    parser.add_argument("command", choices=("install", "status", "remove"))
+    args = parser.parse_args()
+    if args.command == "install":
+        install_capture()
+    elif args.command == "remove":
+        remove_capture()
+    else:
+        pending = pending_changes()
+        for table_name, entries in sorted(pending.items()):
+            print(f"{table_name:<20} {entries:>10,}")
+        print(f"+++++ {sum(pending.values()):,} change log entries pending")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+Cheap change detection in front of the incremental load.
+Every source gets a signature: the operational tables their pg_stat_user_tables insert/update/delete
+counters plus their max id, the reviews CSV its size, mtime and a sha1 of its contents.
+Compared with the signatures the last successful batch started from (kept in the run ledger), they
+tell which tables changed, the others are skipped.
+The counters only grow, rolled back writes and statistics resets count as changes, so a change may be
+reported that loads nothing. A committed change is never missed: it shows up in this run or, when the
+statistics had not caught up with it yet, in the next one.
+
+Usage:
+    python -m etl.change_detection
+"""
+
+import hashlib
+import os
+
+import sqlalchemy
+
+import database.reldb as reldb
+import etl.instrumentation as instrumentation
+from etl import ledger
+from etl.warehouse import REVIEWS_FNAME, id_map
+
+REVIEWS_SOURCE = "reviews.csv"
+# reviews are joined to the warehouse flights and customers, the ones dropped for a missing flight or
+# customer only get in once it does, so changes to those reload the reviews as well
+REVIEW_DEPENDENCIES = {"flights", "customers"}
+
+
+class ChangeSet:
+    def __init__(self, signatures: dict[str, str], changed: set[str]):
+        self.signatures = signatures
+        self.changed = changed
+
+    @property
+    def tables(self) -> set[str]:
+        return self.changed & set(id_map)
+
+    @property
+    def reviews(self) -> bool:
+        return REVIEWS_SOURCE in self.changed or bool(self.changed & REVIEW_DEPENDENCIES)
+
+    @property
+    def any(self) -> bool:
+        return bool(self.tables) or self.reviews
+
+
+def table_signatures(connection: sqlalchemy.Connection) -> dict[str, str]:
+    counters = {
+        name: (inserted, updated, deleted)
+        for name, inserted, updated, deleted in connection.execute(
+            sqlalchemy.text("SELECT relname, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables WHERE schemaname = :schema"),
+            {"schema": reldb.metadata.schema},
+        )
+    }
+    signatures = {}
+    for table_name, (reldb_id_col, _) in id_map.items():
+        inserted, updated, deleted = counters.get(table_name, (0, 0, 0))
+        max_id = connection.scalar(sqlalchemy.select(sqlalchemy.func.max(reldb_id_col)))
+        signatures[table_name] = f"ins={inserted} upd={updated} del={deleted} max_id={max_id}"
+    return signatures
+
+
+def file_sha1(fname: str) -> str:
+    digest = hashlib.sha1()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def csv_signature(fname: str, previous: str | None = None) -> str:
+    if not os.path.exists(fname):
+        return "missing"
+    stat = os.stat(fname)
+    prefix = f"size={stat.st_size} mtime={stat.st_mtime_ns}"
+    # the file is only hashed when size or mtime moved
+    if previous is not None and previous.startswith(prefix + " "):
+        return previous
+    return f"{prefix} sha1={file_sha1(fname)}"
+
+
+def csv_content(signature: str | None) -> str | None:
+    # a rewrite with the same contents is not a change
+    return signature.rsplit("sha1=", 1)[-1] if signature else None
+
+
+def source_signatures(previous: dict[str, str] | None = None) -> dict[str, str]:
+    with reldb.engine.connect() as connection:
+        signatures = table_signatures(connection)
+    signatures[REVIEWS_SOURCE] = csv_signature(REVIEWS_FNAME, (previous or {}).get(REVIEWS_SOURCE))
+    return signatures
+
+
+def compare(previous: dict[str, str], current: dict[str, str]) -> ChangeSet:
+    # everything counts as changed without previous signatures
+    if not previous:
+        return ChangeSet(current, set(current))
+    changed = {source for source, signature in current.items() if source != REVIEWS_SOURCE and previous.get(source) != signature}
+    if csv_content(current.get(REVIEWS_SOURCE)) != csv_content(previous.get(REVIEWS_SOURCE)):
+        changed.add(REVIEWS_SOURCE)
+    return ChangeSet(current, changed)
+
+
+def run_changes(batch_id: int) -> ChangeSet:
+    """
+    The changes batch_id set out to load: the signatures it started from against the last successful batch before it.
+    A resumed run loads these, whatever changed since is left to the next run. Everything counts as changed for a
+    run that recorded no signatures.
+    """
+    current = ledger.run_sources(batch_id)
+    if not current:
+        return ChangeSet({}, set(id_map) | {REVIEWS_SOURCE})
+    return compare(ledger.last_sources(before=batch_id), current)
+
+
+def detect_changes() -> ChangeSet:
+    """
+    Compares the sources with the last successful batch, everything counts as changed before the first one.
+    """
+    previous = ledger.last_sources()
+    current = source_signatures(previous)
+    changes = compare(previous, current)
+    changed = changes.changed
+    instrumentation.log_event(
+        "changes_detected",
+        changed=",".join(sorted(changed)) or None,
+        unchanged=",".join(sorted(set(current) - changed)) or None,
+        reviews=changes.reviews,
+    )
+    return changes
+
+
+if __name__ == "__main__":
+    changes = detect_changes()
+    for source, signature in changes.signatures.items():
+        print(f"{'CHANGED' if source in changes.changed else 'unchanged':<10} {source:<20} {signature}")
+    print(f"+++++ Incremental load would {'run for ' + ', '.join(sorted(changes.tables | ({'reviews'} if changes.reviews else set()))) if changes.any else 'be skipped'}")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Per table checkpoints of a batch (etl_meta.etl_checkpoints).
+The loaders commit every table on its own and record a checkpoint for it, with one database in the same
+transaction as the table's rows. With resume=True a loader skips the tables its batch already checkpointed,
+so a retry or a resumed failed run (ledger.run(resume=...)) continues with the first incomplete table instead
+of starting over. Every step is idempotent on its own, with a separate warehouse database the checkpoint is
+written right after the commit and a crash in between only repeats the step.
+
+Usage:
+    python -m etl.checkpoints 42
+"""
+
+import argparse
+
+import sqlalchemy
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+import constants
+import database
+import database.etl_meta as etl_meta
+import etl.instrumentation as instrumentation
+from database.etl_meta import EtlCheckpoint
+from etl import ledger
+
+
+def completed(batch_id: int) -> dict[str, int]:
+    # checkpointed steps of the batch and the rows they changed
+    ledger.ensure_ledger()
+    with etl_meta.engine.connect() as connection:
+        return dict(connection.execute(
+            sqlalchemy.select(EtlCheckpoint.step, EtlCheckpoint.rows).where(EtlCheckpoint.batch_id == batch_id)
+        ).tuples().all())
+
+
+def commit(session: Session | None, batch_id: int | None, step: str, rows: int = 0):
+    """
+    Commits session (None when the step committed on its own) and checkpoints step of batch_id.
+    Without a batch id, or while etl.explain intercepts the statements, it only commits.
+    """
+    if batch_id is None or instrumentation.intercepting():
+        if session is not None:
+            session.commit()
+        return
+    ledger.ensure_ledger()
+    checkpoint = pg_insert(EtlCheckpoint).values(batch_id=batch_id, step=step, rows=rows).on_conflict_do_nothing()
+    if session is not None and not constants.SPLIT_DATABASES:
+        # etl_meta lives next to the warehouse, the checkpoint commits with the step's rows or not at all
+        session.execute(checkpoint)
+        session.commit()
+    else:
+        if session is not None:
+            session.commit()
+        with etl_meta.engine.begin() as connection:
+            connection.execute(checkpoint)
+    instrumentation.log_event("checkpoint", batch_id=batch_id, step=step, rows=rows)
+
+
+def start(batch_id: int | None, steps: list[str], resume: bool) -> dict[str, int]:
+    """
+    Called by a loader before its steps, returns the steps to skip and the rows they changed.
+    Resuming skips the steps batch_id already completed, otherwise old checkpoints of the steps are dropped,
+    batch ids given by hand (benchmarks) are reused.
+    """
+    if batch_id is None or instrumentation.intercepting():
+        return {}
+    if not resume:
+        ledger.ensure_ledger()
+        with etl_meta.engine.begin() as connection:
+            connection.execute(sqlalchemy.delete(EtlCheckpoint).where(EtlCheckpoint.batch_id == batch_id, EtlCheckpoint.step.in_(steps)))
+        return {}
+    done = {step: rows for step, rows in completed(batch_id).items() if step in steps}
+    instrumentation.log_event("resuming", batch_id=batch_id, skipped=",".join(done) or None)
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checkpointed steps of a batch.")
+    parser.add_argument("batch_id", type=int)
+    args = parser.parse_args()
+    ledger.ensure_ledger()
+    with database.get_session(etl_meta.engine) as session:
+        checkpoints = list(session.scalars(
+            sqlalchemy.select(EtlCheckpoint).where(EtlCheckpoint.batch_id == args.batch_id).order_by(EtlCheckpoint.committed_at)
+        ))
+    for checkpoint in checkpoints:
+        print(f"{checkpoint.committed_at:%Y-%m-%d %H:%M:%S}  {checkpoint.step:<36} {checkpoint.rows:>10,}")
+    print(f"+++++ {len(checkpoints)} steps of batch {args.batch_id} committed")
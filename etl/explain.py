@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""
+Dry run of the incremental loaders that captures query plans instead of loading.
+Every statement the warehouse and star schema loaders would run for a batch is handed over by
+etl.instrumentation and EXPLAINed (VERBOSE, BUFFERS, FORMAT JSON, optionally ANALYZE inside a savepoint
+that is rolled back), the plan is stored together with a fingerprint of its shape.
+check compares a capture against a stored one and fails when a statement gains a sequential scan on a
+large table, or its row estimate blows up, e.g. a dimension join that lost its end_date filter.
+
+Nothing is loaded, so statements are planned against the tables as they were before the batch.
+The reviews CSV is still parsed into csv_staging, that schema is scratch and wiped again afterwards.
+
+Usage:
+    python -m etl.explain capture --out etl_plans/baseline.json
+    python -m etl.explain capture --analyze --out etl_plans/current.json
+    python -m etl.explain check etl_plans/baseline.json etl_plans/current.json --min-rows 10000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+import database.warehouse as warehouse
+import etl.instrumentation as instrumentation
+from etl import ledger
+from etl.star_schema import incremental_load_star_schema
+from etl.warehouse import incremental_load_warehouse
+
+RESULTS_VERSION = 1
+
+# plan keys that describe its shape, costs and estimates are left out of the fingerprint
+SHAPE_KEYS = ("Node Type", "Strategy", "Join Type", "Parent Relationship", "Schema", "Relation Name", "Index Name", "Operation")
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def relation_name(node: dict) -> str:
+    return f"{node['Schema']}.{node['Relation Name']}" if "Schema" in node else node["Relation Name"]
+
+
+def plan_shape(node: dict) -> dict:
+    shape = {key: node[key] for key in SHAPE_KEYS if key in node}
+    if "Plans" in node:
+        shape["Plans"] = [plan_shape(child) for child in node["Plans"]]
+    return shape
+
+
+def fingerprint(plan: dict) -> str:
+    return hashlib.sha1(json.dumps(plan_shape(plan["Plan"]), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def relation_sizes(connection: sqlalchemy.Connection) -> dict[str, float]:
+    # planner statistics, -1 (never analyzed) counts as empty
+    rows = connection.execute(sqlalchemy.text("""
+        SELECT n.nspname || '.' || c.relname, greatest(c.reltuples, 0)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'p') AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+    """))
+    return {name: float(size) for name, size in rows}
+
+
+def plan_summary(plan: dict, sizes: dict[str, float]) -> dict:
+    nodes = list(plan_nodes(plan["Plan"]))
+    relations = {relation_name(node) for node in nodes if "Relation Name" in node}
+    summary = {
+        "total_cost": plan["Plan"]["Total Cost"],
+        "plan_rows": plan["Plan"]["Plan Rows"],
+        "max_rows": max(node["Plan Rows"] for node in nodes),
+        "largest_relation_rows": max((sizes.get(relation, 0.0) for relation in relations), default=0.0),
+        "node_types": sorted({node["Node Type"] for node in nodes}),
+        "seq_scans": sorted({relation_name(node) for node in nodes if node["Node Type"] == "Seq Scan"}),
+    }
+    if "Execution Time" in plan:
+        summary["execution_ms"] = plan["Execution Time"]
+        summary["actual_rows"] = plan["Plan"].get("Actual Rows")
+    return summary
+
+
+class PlanCapture:
+    """
+    Interceptor for etl.instrumentation: explains each statement on the loader's session
+    and keeps the plans keyed by phase/table/operation (with #n for repeats).
+    """
+
+    def __init__(self, analyze: bool = False):
+        self.analyze = analyze
+        self.statements: dict[str, dict] = {}
+        self.sizes: dict[str, float] = {}
+
+    @property
+    def options(self) -> str:
+        return "ANALYZE, VERBOSE, BUFFERS, FORMAT JSON" if self.analyze else "VERBOSE, BUFFERS, FORMAT JSON"
+
+    def __call__(self, session: Session, statement, table: str, operation: str):
+        phase, batch_id = instrumentation.current_phase()
+        key = f"{phase}/{table}/{operation}"
+        repeat = sum(1 for existing in self.statements if existing == key or existing.startswith(key + "#"))
+        if repeat:
+            key += f"#{repeat + 1}"
+        connection = session.connection()
+        if not self.sizes:
+            self.sizes = relation_sizes(connection)
+
+        compiled = statement.compile(dialect=connection.dialect)
+        record = {
+            "phase": phase,
+            "batch_id": batch_id,
+            "table": table,
+            "operation": operation,
+            "sql": str(compiled),
+        }
+        # ANALYZE really runs the statement, the savepoint throws its changes away
+        savepoint = connection.begin_nested()
+        try:
+            # the compiled string is in the driver's paramstyle, so it goes to the driver as is
+            plan = connection.exec_driver_sql(f"EXPLAIN ({self.options}) {compiled}", compiled.params).scalar()[0]
+        except sqlalchemy.exc.DBAPIError as e:
+            record["error"] = str(e.orig).strip()
+            instrumentation.log_event("explain_failed", phase=phase, table=table, operation=operation, error=record["error"])
+        else:
+            record["plan"] = plan
+            record["fingerprint"] = fingerprint(plan)
+            record["summary"] = plan_summary(plan, self.sizes)
+            instrumentation.log_event(
+                "explained", phase=phase, table=table, operation=operation,
+                fingerprint=record["fingerprint"], rows=record["summary"]["plan_rows"],
+                seq_scans=",".join(record["summary"]["seq_scans"]) or None,
+            )
+        finally:
+            savepoint.rollback()
+        self.statements[key] = record
+
+
+def capture_plans(batch_id: int | None = None, analyze: bool = False) -> dict:
+    """
+    Runs the incremental warehouse and star schema loaders for batch_id with every statement explained instead of run.
+    """
+    batch_id = batch_id if batch_id is not None else ledger.next_batch_id()
+    capture = PlanCapture(analyze)
+    with instrumentation.intercept(capture):
+        incremental_load_warehouse(batch_id)
+        incremental_load_star_schema(batch_id)
+    return {
+        "version": RESULTS_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "batch_id": batch_id,
+        "analyze": analyze,
+        "database": str(warehouse.engine.url.render_as_string(hide_password=True)),
+        "relation_sizes": capture.sizes,
+        "statements": capture.statements,
+    }
+
+
+def check_plans(baseline: dict, current: dict, min_rows: float = 10_000, blowup: float = 10.0) -> list[str]:
+    """
+    Returns the statements whose plans regressed against the baseline:
+    - a sequential scan on a table of at least min_rows that the baseline plan did not have,
+    - a row estimate above blowup times the baseline's, or above blowup times the largest table it reads
+      (a join fanning out over the whole SCD2 history),
+    - a statement that could not be explained.
+    Changed fingerprints are only printed, most of them are harmless.
+    """
+    sizes = current["relation_sizes"]
+    problems = []
+    for key, record in current["statements"].items():
+        base = baseline["statements"].get(key)
+        if "error" in record:
+            problems.append(f"{key}: cannot be explained: {record['error']}")
+            continue
+        summary = record["summary"]
+        if summary["max_rows"] >= min_rows and summary["max_rows"] > blowup * max(summary["largest_relation_rows"], 1):
+            problems.append(f"{key}: estimates {summary['max_rows']:,.0f} rows, its largest table has {summary['largest_relation_rows']:,.0f}")
+        if base is None:
+            print(f"NEW {key} ({record['fingerprint']})")
+            continue
+        if "error" in base:
+            continue
+        base_summary = base["summary"]
+        new_scans = [
+            relation for relation in summary["seq_scans"]
+            if relation not in base_summary["seq_scans"] and sizes.get(relation, 0) >= min_rows
+        ]
+        if new_scans:
+            problems.append(f"{key}: new sequential scan on {', '.join(f'{relation} ({sizes[relation]:,.0f} rows)' for relation in new_scans)}")
+        if summary["max_rows"] >= min_rows and summary["max_rows"] > blowup * max(base_summary["max_rows"], 1):
+            problems.append(f"{key}: row estimate {base_summary['max_rows']:,.0f} -> {summary['max_rows']:,.0f}")
+        if record["fingerprint"] != base["fingerprint"]:
+            print(f"CHANGED {key} {base['fingerprint']} -> {record['fingerprint']}: "
+                  f"{' '.join(base_summary['node_types'])} -> {' '.join(summary['node_types'])}")
+    for key in baseline["statements"].keys() - current["statements"].keys():
+        print(f"GONE {key}")
+
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        print(f"+++++ {len(problems)} plan regressions")
+    else:
+        print(f"+++++ No plan regressions in {len(current['statements'])} statements")
+    return problems
+
+
+def write_plans(results: dict, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture and check query plans of the incremental loaders without loading.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = subparsers.add_parser("capture", help="Explain every loader statement and write the plans")
+    capture_parser.add_argument("--batch-id", type=int, help="defaults to the next batch id of the ledger")
+    capture_parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE, runs each statement and rolls it back")
+    capture_parser.add_argument("--out", default="etl_plans/current.json")
+
+    check_parser = subparsers.add_parser("check", help="Check captured plans against a baseline, exits 1 on regressions")
+    check_parser.add_argument("baseline")
+    check_parser.add_argument("current", nargs="?", help="a captured file, captures now when left out")
+    check_parser.add_argument("--batch-id", type=int)
+    check_parser.add_argument("--min-rows", type=float, default=10_000, help="ignore tables smaller than this")
+    check_parser.add_argument("--blowup", type=float, default=10.0, help="row estimate growth that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "capture":
+        results = capture_plans(args.batch_id, args.analyze)
+        write_plans(results, args.out)
+        print(f"+++++ {len(results['statements'])} plans written to {args.out}")
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if args.current:
+            with open(args.current) as f:
+                current = json.load(f)
+        else:
+            current = capture_plans(args.batch_id, baseline["analyze"])
+        sys.exit(1 if check_plans(baseline, current, args.min_rows, args.blowup) else 0)
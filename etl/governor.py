@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Resource governor for what the warehouse loads read from the operational database.
+    session settings  statement_timeout, work_mem and max_parallel_workers_per_gather per engine role:
+                      ETL_EXTRACT_* for the streamed extract, ETL_WAREHOUSE_* for the loaders' statements, which
+                      read the airline schema directly when the databases are shared (see database.engines)
+    chunks            etl.streaming copies a table in primary key ranges of ETL_EXTRACT_CHUNK_ROWS ids (50000 by
+                      default), each its own short statement and transaction, instead of one COPY of the whole table
+    pacing            ETL_EXTRACT_ROWS_PER_SECOND rows per second at most (unlimited by default) and
+                      ETL_EXTRACT_MAX_QUERIES tables copied at a time (1 by default)
+    back-off          before every chunk, and before every table a loader diffs or inserts, a probe query times the
+                      source. Above ETL_EXTRACT_PROBE_MS milliseconds (250 by default, 0 turns probing off) the load
+                      waits, doubling the pause up to 30 seconds, until the latency drops. After
+                      ETL_EXTRACT_MAX_BACKOFF seconds (300 by default) it goes on regardless, a load is slowed down,
+                      never failed
+Every pause is logged ("extract_backoff", "extract_throttled").
+
+Usage:
+    python -m etl.governor
+"""
+
+import logging
+import os
+import threading
+import time
+
+import sqlalchemy
+
+import etl.instrumentation as instrumentation
+from database import engines
+
+PROBE_QUERY = "SELECT 1"
+# probes closer together reuse the last measurement
+PROBE_INTERVAL = 1.0
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class Governor:
+    """
+    Limits of one extraction, shared by its threads.
+    """
+
+    def __init__(self,
+                 chunk_rows: int = 50_000,
+                 rows_per_second: float | None = None, # None for unlimited
+                 max_queries: int = 1,
+                 probe_ms: float = 250.0, # 0 to not probe
+                 max_backoff: float = 300.0,
+                 ):
+        if chunk_rows < 1 or max_queries < 1:
+            raise ValueError("chunk_rows and max_queries must be at least 1")
+        self.chunk_rows = chunk_rows
+        self.rows_per_second = rows_per_second
+        self.max_queries = max_queries
+        self.probe_ms = probe_ms
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.probed_at = 0.0
+        self.latency_ms = 0.0
+
+    @classmethod
+    def from_env(cls) -> "Governor":
+        rows_per_second = os.getenv("ETL_EXTRACT_ROWS_PER_SECOND")
+        return cls(
+            chunk_rows=int(os.getenv("ETL_EXTRACT_CHUNK_ROWS", "50000")),
+            rows_per_second=float(rows_per_second) if rows_per_second else None,
+            max_queries=int(os.getenv("ETL_EXTRACT_MAX_QUERIES", "1")),
+            probe_ms=float(os.getenv("ETL_EXTRACT_PROBE_MS", "250")),
+            max_backoff=float(os.getenv("ETL_EXTRACT_MAX_BACKOFF", "300")),
+        )
+
+    def probe(self) -> float:
+        # milliseconds the source takes to answer the probe query, measured at most once per PROBE_INTERVAL
+        with self.lock:
+            if time.perf_counter() - self.probed_at < PROBE_INTERVAL:
+                return self.latency_ms
+        with engines.get_engine("extract").connect() as connection:
+            start = time.perf_counter()
+            connection.execute(sqlalchemy.text(PROBE_QUERY))
+            latency_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.probed_at, self.latency_ms = time.perf_counter(), latency_ms
+        return latency_ms
+
+    def wait_for_source(self, table: str | None = None) -> float:
+        # blocks while the source is slower than probe_ms, returns the seconds waited
+        if not self.probe_ms:
+            return 0.0
+        waited, attempt = 0.0, 0
+        while (latency_ms := self.probe()) > self.probe_ms:
+            if waited >= self.max_backoff:
+                instrumentation.log_event("extract_backoff_exhausted", logging.WARNING, table=table, latency_ms=round(latency_ms, 1), waited_seconds=round(waited, 1))
+                break
+            delay = min(BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS, self.max_backoff - waited)
+            instrumentation.log_event("extract_backoff", logging.WARNING, table=table, latency_ms=round(latency_ms, 1), threshold_ms=self.probe_ms, delay_seconds=round(delay, 1))
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
+        return waited
+
+    def throttle(self, rows: int, table: str | None = None):
+        # counts rows extracted and sleeps while the extraction is ahead of rows_per_second
+        with self.lock:
+            self.rows += rows
+            ahead = self.rows / self.rows_per_second - (time.perf_counter() - self.start) if self.rows_per_second else 0.0
+        if ahead > 0:
+            instrumentation.log_event("extract_throttled", table=table, rows=self.rows, delay_seconds=round(ahead, 2))
+            time.sleep(ahead)
+
+    def key_ranges(self, low: int | None, high: int | None) -> list[tuple[int, int]]:
+        # inclusive id ranges of chunk_rows ids covering low..high, none for an empty table
+        if low is None or high is None:
+            return []
+        return [(start, min(start + self.chunk_rows - 1, high)) for start in range(low, high + 1, self.chunk_rows)]
+
+
+def wait_for_source(table: str | None = None) -> float:
+    # the back-off of the loaders, before a statement that reads a whole operational table
+    return Governor.from_env().wait_for_source(table)
+
+
+if __name__ == "__main__":
+    governor = Governor.from_env()
+    latencies = []
+    for _ in range(5):
+        governor.probed_at = 0.0
+        latencies.append(governor.probe())
+    print(f"+++++ Probe latency {min(latencies):.1f} ms min {max(latencies):.1f} ms max, back-off above {governor.probe_ms or '-'} ms")
+    print(f"+++++ Chunks of {governor.chunk_rows:,} ids, {governor.rows_per_second or 'unlimited'} rows/s, {governor.max_queries} tables at a time")
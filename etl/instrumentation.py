@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Instrumentation for the ETL loaders.
+Statements go through execute() instead of session.execute(), which records duration, rowcount,
+table, operation, phase and batch id as Prometheus metrics and as a structured log line.
+The compiled SQL is only logged at DEBUG.
+
+Environment:
+    ETL_METRICS_PORT      serve the metrics over HTTP on this port
+    ETL_METRICS_TEXTFILE  write the metrics to this file after every phase (node exporter textfile collector)
+    ETL_LOG_LEVEL         INFO by default, DEBUG adds the SQL
+    ETL_LOG_FORMAT        "json" for one JSON object per line, key=value pairs otherwise
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import time
+from typing import Any, Callable
+
+import sqlalchemy
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server, write_to_textfile
+from sqlalchemy.orm import Session
+
+from util import profiling
+
+logger = logging.getLogger("etl")
+
+registry = CollectorRegistry()
+STATEMENT_LABELS = ("phase", "table", "operation")
+statement_seconds = Histogram(
+    "etl_statement_duration_seconds", "Duration of ETL statements", STATEMENT_LABELS,
+    registry=registry, buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+statement_rows = Counter("etl_statement_rows", "Rows affected by ETL statements", STATEMENT_LABELS, registry=registry)
+statement_failures = Counter("etl_statement_failures", "ETL statements that raised", STATEMENT_LABELS, registry=registry)
+phase_seconds = Gauge("etl_phase_duration_seconds", "Duration of the last run of each ETL phase", ["phase"], registry=registry)
+phase_batch_id = Gauge("etl_phase_batch_id", "Batch id of the last run of each ETL phase", ["phase"], registry=registry)
+phase_last_success = Gauge("etl_phase_last_success_timestamp_seconds", "When each ETL phase last succeeded", ["phase"], registry=registry)
+
+# (phase, batch id) of the phase the current code runs in
+_current_phase: contextvars.ContextVar[tuple[str, int | None]] = contextvars.ContextVar("etl_phase", default=("unknown", None))
+# called with every statement record, e.g. by benchmarks
+_listeners: list[Callable[[dict], None]] = []
+# when set, execute() hands statements to this instead of running them (see etl.explain)
+_interceptor: contextvars.ContextVar[Callable | None] = contextvars.ContextVar("etl_interceptor", default=None)
+_metrics_started = False
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", {})
+        timestamp = self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+        if self.as_json:
+            return json.dumps({"ts": timestamp, "level": record.levelname, "event": record.getMessage(), **fields}, default=str)
+        pairs = " ".join(f"{key}={value}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {record.getMessage()} {pairs}".rstrip()
+
+
+def configure_logging():
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(as_json=os.getenv("ETL_LOG_FORMAT") == "json"))
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("ETL_LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any):
+    logger.log(level, event, extra={"fields": fields})
+
+
+def add_listener(listener: Callable[[dict], None]):
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[dict], None]):
+    _listeners.remove(listener)
+
+
+def current_phase() -> tuple[str, int | None]:
+    return _current_phase.get()
+
+
+def intercepting() -> bool:
+    # statements are handed to an interceptor instead of running, nothing the loaders do is real
+    return _interceptor.get() is not None
+
+
+@contextlib.contextmanager
+def intercept(handler: Callable):
+    """
+    Within the block execute() calls handler(session, statement, table, operation) instead of running the statement,
+    and phases are not recorded as successful loads.
+    """
+    token = _interceptor.set(handler)
+    try:
+        yield
+    finally:
+        _interceptor.reset(token)
+
+
+def start_metrics(port: int | None = None):
+    global _metrics_started
+    port = port or (int(os.environ["ETL_METRICS_PORT"]) if os.getenv("ETL_METRICS_PORT") else None)
+    if _metrics_started or port is None:
+        return
+    start_http_server(port, registry=registry)
+    _metrics_started = True
+    log_event("metrics_server_started", port=port)
+
+
+def write_metrics(path: str | None = None):
+    path = path or os.getenv("ETL_METRICS_TEXTFILE")
+    if path:
+        write_to_textfile(path, registry)
+
+
+@contextlib.contextmanager
+def phase(name: str, batch_id: int | None = None):
+    """
+    Marks the statements run inside as belonging to phase name and batch_id,
+    and records how long the phase took and whether it succeeded.
+    """
+    start_metrics()
+    token = _current_phase.set((name, batch_id))
+    log_event("phase_started", phase=name, batch_id=batch_id)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        log_event("phase_failed", logging.ERROR, phase=name, batch_id=batch_id, seconds=round(time.perf_counter() - start, 3), error=repr(e))
+        raise
+    else:
+        log_event("phase_finished", phase=name, batch_id=batch_id, seconds=round(time.perf_counter() - start, 3))
+        if _interceptor.get() is None:
+            phase_last_success.labels(name).set_to_current_time()
+    finally:
+        _current_phase.reset(token)
+        if _interceptor.get() is None:
+            phase_seconds.labels(name).set(time.perf_counter() - start)
+            if batch_id is not None:
+                phase_batch_id.labels(name).set(batch_id)
+            write_metrics()
+
+
+def phased(name: str, batch_param: str = "batch_id"):
+    """
+    Decorator running the whole function as phase name, the batch id is taken from its batch_param argument.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            with phase(name, bound.arguments.get(batch_param)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def step(table: str, operation: str):
+    """
+    Times a unit of work on one table, for work that is not a single execute() such as bulk saves.
+    The caller sets record["rows"] on the yielded record.
+    """
+    phase_name, batch_id = current_phase()
+    record = {"phase": phase_name, "batch_id": batch_id, "table": table, "operation": operation, "rows": 0}
+    labels = (phase_name, table, operation)
+    start = time.perf_counter()
+    try:
+        with profiling.profiled(f"{phase_name}.{table}.{operation}"):
+            yield record
+    except Exception as e:
+        statement_failures.labels(*labels).inc()
+        log_event("statement_failed", logging.ERROR, **record, seconds=round(time.perf_counter() - start, 3), error=repr(e))
+        raise
+    record["seconds"] = time.perf_counter() - start
+    statement_seconds.labels(*labels).observe(record["seconds"])
+    statement_rows.labels(*labels).inc(record["rows"])
+    log_event("statement", **dict(record, seconds=round(record["seconds"], 3)))
+    for listener in _listeners:
+        listener(record)
+
+
+def statement_target(statement) -> tuple[str, str]:
+    if isinstance(statement, sqlalchemy.sql.dml.UpdateBase):
+        operation = "insert" if statement.is_insert else "update" if statement.is_update else "delete"
+        return statement.table.fullname, operation
+    return "unknown", "select" if getattr(statement, "is_select", False) else "unknown"
+
+
+def execute(session: Session, statement, table: str | None = None, operation: str | None = None):
+    """
+    session.execute(statement) with instrumentation. Table and operation are read from DML statements,
+    text() statements should pass them.
+    """
+    default_table, default_operation = statement_target(statement)
+    handler = _interceptor.get()
+    if handler is not None:
+        return handler(session, statement, table or default_table, operation or default_operation)
+    with step(table or default_table, operation or default_operation) as record:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("sql", extra={"fields": {"table": record["table"], "sql": str(statement)}})
+        result = session.execute(statement)
+        record["rows"] = max(getattr(result, "rowcount", 0), 0)
+    return result
+
+
+configure_logging()
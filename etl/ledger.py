@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+ETL run ledger (etl_meta.etl_runs and etl_meta.etl_run_tables).
+run() allocates the batch id from a sequence and records the run as running. While it is open, every
+instrumented loader statement of that batch is added to the rows inserted, closed (SCD2 end_date set)
+and deleted of its table. The run ends as succeeded or failed, with its duration and error.
+The counts of a failed run include statements that were rolled back with it. A failed run can be resumed
+under its batch id, the loaders then skip the tables it checkpointed (see etl.checkpoints).
+
+Usage:
+    python -m etl.ledger history --limit 20
+    python -m etl.ledger tables 42
+"""
+
+import argparse
+import contextlib
+import logging
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+import database
+import database.etl_meta as etl_meta
+import etl.instrumentation as instrumentation
+from database.etl_meta import EtlRun, EtlRunTable, EtlSourceState
+
+# instrumented operation -> ledger column
+ROW_COLUMNS = {"insert": "rows_inserted", "update": "rows_closed", "delete": "rows_deleted"}
+# what run() records, full reloads of some tables are "reload", review csv loads "csv"
+RUN_KINDS = ("full", "reload", "incremental", "csv", "cdc")
+
+_schema_ready = False
+
+
+def ensure_ledger():
+    global _schema_ready
+    if not _schema_ready:
+        database.ensure_schema(etl_meta.engine, etl_meta.metadata)
+        _schema_ready = True
+
+
+def next_batch_id() -> int:
+    # peeks at the sequence without using up a value
+    ensure_ledger()
+    with etl_meta.engine.connect() as connection:
+        last_value, is_called = connection.execute(
+            sqlalchemy.text(f"SELECT last_value, is_called FROM {etl_meta.metadata.schema}.{etl_meta.batch_id_seq.name}")
+        ).one()
+    return last_value + 1 if is_called else last_value
+
+
+@contextlib.contextmanager
+def run(kind: str = "incremental", sources: dict[str, str] | None = None, resume: int | None = None):
+    """
+    Allocates a batch id, yields it and records the run in the ledger. Exceptions are recorded and re-raised.
+    sources are the source signatures taken before loading, they count once the run succeeds.
+    resume is the batch id of an unfinished run of the same kind to continue instead, it keeps the sources
+    it started from and its counts and duration add up (see etl.checkpoints).
+    """
+    if kind not in RUN_KINDS:
+        raise ValueError(f"Unknown run kind: {kind} (known: {', '.join(RUN_KINDS)})")
+    ensure_ledger()
+    with database.get_session(etl_meta.engine) as session:
+        if resume is None:
+            entry = EtlRun(kind=kind, status="running")
+            session.add(entry)
+            session.flush()
+            if sources:
+                session.add_all(EtlSourceState(batch_id=entry.batch_id, source=source, signature=signature) for source, signature in sources.items())
+        else:
+            entry = session.get(EtlRun, resume)
+            if entry is None or entry.kind != kind or entry.status == "succeeded":
+                raise ValueError(f"Batch {resume} is not an unfinished {kind} run")
+            entry.status = "running"
+            entry.error = None
+        session.commit()
+        batch_id = entry.batch_id
+        previous_seconds = entry.duration_seconds or 0.0
+        # counts of the earlier attempts of a resumed run
+        tables: dict[str, dict] = {
+            table.table_name: dict(phase=table.phase, statements=table.statements, rows_inserted=table.rows_inserted,
+                                   rows_closed=table.rows_closed, rows_deleted=table.rows_deleted, seconds=table.seconds)
+            for table in session.scalars(sqlalchemy.select(EtlRunTable).where(EtlRunTable.batch_id == batch_id))
+        }
+
+    # loaders may run tables of a batch on several threads
+    collect_lock = threading.Lock()
+
+    def collect(record: dict):
+        if record["batch_id"] != batch_id:
+            return
+        with collect_lock:
+            counts = tables.setdefault(record["table"], dict(phase=record["phase"], statements=0, rows_inserted=0, rows_closed=0, rows_deleted=0, seconds=0.0))
+            counts["statements"] += 1
+            counts["seconds"] += record["seconds"]
+            if record["operation"] in ROW_COLUMNS:
+                counts[ROW_COLUMNS[record["operation"]]] += record["rows"]
+
+    instrumentation.add_listener(collect)
+    instrumentation.log_event("run_started", batch_id=batch_id, kind=kind, resumed=resume is not None)
+    start = time.perf_counter()
+    status, error = "succeeded", None
+    try:
+        yield batch_id
+    except BaseException as e:
+        status, error = "failed", repr(e)
+        raise
+    finally:
+        instrumentation.remove_listener(collect)
+        duration = time.perf_counter() - start
+        with database.get_session(etl_meta.engine) as session:
+            session.execute(sqlalchemy.delete(EtlRunTable).where(EtlRunTable.batch_id == batch_id))
+            session.add_all(EtlRunTable(batch_id=batch_id, table_name=table, **counts) for table, counts in tables.items())
+            session.execute(sqlalchemy.update(EtlRun).where(EtlRun.batch_id == batch_id).values(
+                status=status,
+                finished_at=datetime.now(),
+                duration_seconds=previous_seconds + duration,
+                rows_inserted=sum(counts["rows_inserted"] for counts in tables.values()),
+                rows_closed=sum(counts["rows_closed"] for counts in tables.values()),
+                rows_deleted=sum(counts["rows_deleted"] for counts in tables.values()),
+                error=error,
+            ))
+            session.commit()
+        instrumentation.log_event(
+            "run_finished", logging.INFO if error is None else logging.ERROR,
+            batch_id=batch_id, kind=kind, status=status, seconds=round(duration, 3),
+        )
+
+
+def last_sources(before: int | None = None) -> dict[str, str]:
+    # signatures of the latest successful run that recorded them (of the runs before batch before), empty before the first one
+    ensure_ledger()
+    query = (
+        sqlalchemy.select(sqlalchemy.func.max(EtlSourceState.batch_id))
+        .join(EtlRun, EtlRun.batch_id == EtlSourceState.batch_id)
+        .where(EtlRun.status == "succeeded")
+    )
+    if before is not None:
+        query = query.where(EtlSourceState.batch_id < before)
+    with database.get_session(etl_meta.engine) as session:
+        batch_id = session.scalar(query)
+    return run_sources(batch_id) if batch_id is not None else {}
+
+
+def run_sources(batch_id: int) -> dict[str, str]:
+    # signatures batch_id started from, empty when it recorded none
+    ensure_ledger()
+    with database.get_session(etl_meta.engine) as session:
+        return dict(session.execute(
+            sqlalchemy.select(EtlSourceState.source, EtlSourceState.signature).where(EtlSourceState.batch_id == batch_id)
+        ).tuples().all())
+
+
+def history(limit: int = 20, kind: str | None = None) -> list[EtlRun]:
+    ensure_ledger()
+    query = sqlalchemy.select(EtlRun).order_by(EtlRun.batch_id.desc()).limit(limit)
+    if kind is not None:
+        query = query.where(EtlRun.kind == kind)
+    with database.get_session(etl_meta.engine) as session:
+        return list(session.scalars(query))
+
+
+def run_tables(batch_id: int) -> list[EtlRunTable]:
+    ensure_ledger()
+    with database.get_session(etl_meta.engine) as session:
+        return list(session.scalars(sqlalchemy.select(EtlRunTable).where(EtlRunTable.batch_id == batch_id).order_by(EtlRunTable.table_name)))
+
+
+def print_history(runs: list[EtlRun]):
+    print(f"{'batch':>6} {'kind':<12} {'status':<10} {'started':<20} {'seconds':>9} {'inserted':>10} {'closed':>9} {'deleted':>9} {'rows/s':>9}")
+    for entry in runs:
+        rows = (entry.rows_inserted or 0) + (entry.rows_closed or 0) + (entry.rows_deleted or 0)
+        seconds = entry.duration_seconds
+        print(f"{entry.batch_id:>6} {entry.kind:<12} {entry.status:<10} {entry.started_at:%Y-%m-%d %H:%M:%S}  "
+              f"{seconds if seconds is not None else float('nan'):>9.2f} {entry.rows_inserted or 0:>10,} {entry.rows_closed or 0:>9,} "
+              f"{entry.rows_deleted or 0:>9,} {rows / seconds if seconds else 0.0:>9,.0f}")
+        if entry.error:
+            print(f"{'':>6} {entry.error}")
+
+
+def print_tables(tables: list[EtlRunTable]):
+    print(f"{'table':<36} {'phase':<22} {'stmts':>6} {'inserted':>10} {'closed':>9} {'deleted':>9} {'seconds':>9}")
+    for table in tables:
+        print(f"{table.table_name:<36} {table.phase:<22} {table.statements:>6} {table.rows_inserted:>10,} "
+              f"{table.rows_closed:>9,} {table.rows_deleted:>9,} {table.seconds:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ETL run ledger.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    history_parser = subparsers.add_parser("history", help="Latest runs with their throughput")
+    history_parser.add_argument("--limit", type=int, default=20)
+    history_parser.add_argument("--kind", choices=RUN_KINDS)
+    tables_parser = subparsers.add_parser("tables", help="Rows per table of one batch")
+    tables_parser.add_argument("batch_id", type=int)
+    args = parser.parse_args()
+    if args.command == "history":
+        print_history(history(args.limit, args.kind))
+    else:
+        print_tables(run_tables(args.batch_id))
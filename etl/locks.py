@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""
+Postgres advisory locks per pipeline stage ("warehouse", "star_schema"), so loads never overlap.
+stage_locks() takes the locks of all stages a load touches, in a fixed order, on a connection of its own.
+When another load holds one of them, the mode decides:
+    skip      give up right away
+    wait      retry until timeout seconds have passed (float("inf") waits forever), then give up
+    coalesce  give up, but leave a request the holder picks up with take_coalesced() and runs one more
+              batch for, however many runs coalesced in the meantime (see run_coalesced). The locks are tried
+              once more after recording it, in case the holder released them before it could see the request
+Giving up raises StageBusy. Every decision is logged and recorded in etl_meta.etl_lock_decisions.
+
+Environment:
+    ETL_LOCK_MODE     skip, wait or coalesce (default)
+    ETL_LOCK_TIMEOUT  seconds to wait in wait mode, 60 by default
+"""
+
+import contextlib
+import logging
+from typing import Callable
+import os
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+import database
+import database.etl_meta as etl_meta
+import etl.instrumentation as instrumentation
+from database.etl_meta import EtlLockDecision
+from etl import ledger
+
+LOCK_MODES = ("skip", "wait", "coalesce")
+# every load of the warehouse ends with the star schema, loads take both
+PIPELINE_STAGES = ("warehouse", "star_schema")
+LOCK_NAMESPACE = "airline_etl"
+POLL_INTERVAL = 1.0
+
+
+class StageBusy(Exception):
+    def __init__(self, stages: tuple[str, ...], decision: str):
+        super().__init__(f"Stages {', '.join(stages)} are held by another load, {decision}")
+        self.stages = stages
+        self.decision = decision
+
+
+def record_decision(stages: tuple[str, ...], mode: str, decision: str, waited: float) -> int:
+    instrumentation.log_event(
+        "stage_lock", logging.INFO if decision == "acquired" else logging.WARNING,
+        stages=",".join(stages), mode=mode, decision=decision, waited_seconds=round(waited, 3),
+    )
+    with database.get_session(etl_meta.engine) as session:
+        lock_decision = EtlLockDecision(stages=",".join(stages), mode=mode, decision=decision, waited_seconds=waited)
+        session.add(lock_decision)
+        session.commit()
+        return lock_decision.id
+
+
+def mark_handled(decision_id: int):
+    # a coalesced request the run that recorded it ended up loading itself
+    with database.get_session(etl_meta.engine) as session:
+        session.execute(
+            sqlalchemy.update(EtlLockDecision)
+            .where(EtlLockDecision.id == decision_id, EtlLockDecision.handled_at.is_(None))
+            .values(handled_at=datetime.now())
+        )
+        session.commit()
+
+
+def try_lock_all(connection: sqlalchemy.Connection, stages: tuple[str, ...]) -> bool:
+    # all or nothing, a partial set is released again so two loads can not each hold half
+    taken = []
+    for stage in stages:
+        if not connection.scalar(sqlalchemy.text("SELECT pg_try_advisory_lock(hashtext(:namespace), hashtext(:stage))"), {"namespace": LOCK_NAMESPACE, "stage": stage}):
+            unlock_all(connection, tuple(taken))
+            return False
+        taken.append(stage)
+    return True
+
+
+def unlock_all(connection: sqlalchemy.Connection, stages: tuple[str, ...]):
+    for stage in stages:
+        connection.execute(sqlalchemy.text("SELECT pg_advisory_unlock(hashtext(:namespace), hashtext(:stage))"), {"namespace": LOCK_NAMESPACE, "stage": stage})
+
+
+@contextlib.contextmanager
+def stage_locks(*stages: str, mode: str | None = None, timeout: float | None = None):
+    """
+    Holds the advisory locks of stages for the block, or raises StageBusy as the mode says.
+    """
+    mode = mode or os.getenv("ETL_LOCK_MODE", "coalesce")
+    if mode not in LOCK_MODES:
+        raise ValueError(f"Unknown lock mode: {mode}")
+    timeout = timeout if timeout is not None else float(os.getenv("ETL_LOCK_TIMEOUT", "60"))
+    stages = tuple(sorted(stages))
+    ledger.ensure_ledger()
+
+    # session level locks on an autocommit connection, nothing sits idle in a transaction while the load runs
+    connection = etl_meta.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        start = time.perf_counter()
+        acquired = try_lock_all(connection, stages)
+        while not acquired and mode == "wait" and time.perf_counter() - start < timeout:
+            time.sleep(POLL_INTERVAL)
+            acquired = try_lock_all(connection, stages)
+        waited = time.perf_counter() - start
+        if not acquired and mode == "coalesce":
+            # the holder may have taken the requests for the last time and released the locks since the first
+            # try, this request would be left for nobody. Once it is recorded, either the holder still finds it
+            # after releasing (run_coalesced), or the locks are free now
+            request_id = record_decision(stages, mode, "coalesced", waited)
+            if not try_lock_all(connection, stages):
+                raise StageBusy(stages, "coalesced")
+            mark_handled(request_id)
+            acquired = True
+        if not acquired:
+            decision = {"skip": "skipped", "wait": "timed_out"}[mode]
+            record_decision(stages, mode, decision, waited)
+            raise StageBusy(stages, decision)
+        record_decision(stages, mode, "acquired", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            unlock_all(connection, stages)
+    finally:
+        connection.close()
+
+
+def take_coalesced(*stages: str) -> int:
+    """
+    Marks the coalesced requests for stages as handled and returns how many there were.
+    Called by the lock holder, a non-zero count means one more batch is due.
+    """
+    stages_key = ",".join(sorted(stages))
+    with database.get_session(etl_meta.engine) as session:
+        handled = session.scalars(
+            sqlalchemy.update(EtlLockDecision)
+            .where(EtlLockDecision.stages == stages_key, EtlLockDecision.decision == "coalesced", EtlLockDecision.handled_at.is_(None))
+            .values(handled_at=datetime.now())
+            .returning(EtlLockDecision.id)
+        ).all()
+        session.commit()
+    return len(handled)
+
+
+def run_coalesced(load: Callable[[], None], *stages: str, mode: str | None = None, timeout: float | None = None):
+    """
+    Runs load under the stage locks, then once more for every round of requests that coalesced meanwhile.
+    The requests are checked again after the locks are released, one recorded between the last check and the
+    release would be lost otherwise. For those the locks are taken again, StageBusy if another load got them.
+    """
+    while True:
+        with stage_locks(*stages, mode=mode, timeout=timeout):
+            load()
+            while take_coalesced(*stages):
+                load()
+        if not take_coalesced(*stages):
+            return
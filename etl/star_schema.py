@@ -11,6 +11,8 @@ import database
 import database.star_schema as star_db
 import model.star_schema as star
 import model.warehouse as whm
+import etl.checkpoints as checkpoints
+import etl.instrumentation as instrumentation
 import etl.utils as utils
 from sqlalchemy.dialects.postgresql import insert as pg_insert  # For ON CONFLICT
 
@@ -113,16 +115,74 @@ select_map: dict[str, sqlalchemy.Select] = {
     )
 }
 
-def incremental_load_star_schema():
-    print("--- Begin incremental load on star schema ---")
+# star dimension -> warehouse entity with its surrogate and natural key
+dimension_keys = {
+    star.DimFlight: (whm.Flight, "flight_sk", "flight_id"),
+    star.DimAirport: (whm.Airport, "airport_sk", "airport_id"),
+    star.DimAirplane: (whm.Airplane, "airplane_sk", "airplane_id"),
+    star.DimPilot: (whm.Pilot, "pilot_sk", "pilot_id"),
+    star.DimCustomer: (whm.Customer, "customer_sk", "customer_id"),
+}
+
+
+def successors(dimension) -> sqlalchemy.Subquery:
+    # surrogate keys of closed warehouse versions still in the dimension and the current version of the same natural key
+    entity, sk_name, id_name = dimension_keys[dimension]
+    closed = sqlalchemy.orm.aliased(entity, name="closed")
+    current = sqlalchemy.orm.aliased(entity, name="current")
+    return sqlalchemy.select(
+        getattr(closed, sk_name).label("old_sk"),
+        getattr(current, sk_name).label("new_sk"),
+    ).join(
+        dimension,
+        getattr(dimension, sk_name) == getattr(closed, sk_name),
+    ).join(
+        current,
+        sqlalchemy.and_(
+            getattr(current, id_name) == getattr(closed, id_name),
+            current.end_date == sqlalchemy.literal(datetime.datetime.max),
+        ),
+    ).where(
+        closed.end_date != sqlalchemy.literal(datetime.datetime.max),
+    ).subquery("successors")
+
+
+def remap_dimension(session: sqlalchemy.orm.Session, dimension):
+    """
+    Replaces the dimension rows of closed warehouse versions with the current version of their natural key:
+    every star column referencing them is moved to the current row, then the closed rows are deleted.
+    The current rows have to be inserted already. Keys deleted at the source have no current version, their
+    rows stay for the facts that still point at them.
+    """
+    dimension_table = dimension.__table__
+    _, sk_name, _ = dimension_keys[dimension]
+    mapping = successors(dimension)
+    for table in star_db.metadata.sorted_tables:
+        for foreign_key in table.foreign_keys:
+            if foreign_key.column.table is not dimension_table:
+                continue
+            instrumentation.execute(session, sqlalchemy.update(table).where(
+                foreign_key.parent == mapping.c.old_sk,
+            ).values({foreign_key.parent.name: mapping.c.new_sk}))
+    instrumentation.execute(session, sqlalchemy.delete(dimension_table).where(
+        dimension_table.c[sk_name].in_(sqlalchemy.select(mapping.c.old_sk)),
+    ))
+
+
+@instrumentation.phased("star_incremental")
+def incremental_load_star_schema(
+        batch_id: int | None = None,
+        resume: bool = False,
+):
+    # one step for the whole schema, it commits once (see etl.checkpoints)
+    if checkpoints.start(batch_id, [star_db.metadata.schema], resume):
+        return
     session = database.get_session(star_db.engine)
     # delete_stmt = sqlalchemy.delete(star.DimDate)
     # session.execute(delete_stmt)
     # session.commit()
 
     #delete facts and dimensions that have fks and are out of
-    print("--- Deleting tables with fks ---")
-    print("--- Fact review ---")
     delete_stmt = sqlalchemy.delete(star.FactReview).where(
         sqlalchemy.and_(
             whm.AirlineReview.airline_review_sk == star.FactReview.airline_review_sk,
@@ -130,54 +190,27 @@ def incremental_load_star_schema():
         )
     )
 
-    print(delete_stmt)
-    session.execute(delete_stmt)
+    instrumentation.execute(session, delete_stmt)
 
-    print("--- Fact booking ---")
     delete_stmt = sqlalchemy.delete(star.FactBooking).where(
         sqlalchemy.and_(
             whm.FlightBooking.flight_booking_sk == star.FactBooking.flight_booking_sk,
             whm.FlightBooking.end_date != sqlalchemy.literal(datetime.datetime.max),
         )
     )
-    print(delete_stmt)
-    session.execute(delete_stmt)
+    instrumentation.execute(session, delete_stmt)
 
-    print("--- Fact flight ---")
     delete_stmt = sqlalchemy.delete(star.FactFlight).where(
         sqlalchemy.and_(
             whm.Flight.flight_sk == star.FactFlight.flight_sk,
             whm.Flight.end_date != sqlalchemy.literal(datetime.datetime.max),
         )
     )
-    print(delete_stmt)
-    session.execute(delete_stmt)
-
-    print("--- Dim flight ---")
-    delete_stmt = sqlalchemy.delete(star.DimFlight).where(
-        sqlalchemy.and_(
-            whm.Flight.flight_sk == star.DimFlight.flight_sk,
-            whm.Flight.end_date != sqlalchemy.literal(datetime.datetime.max),
-        )
-    )
-    print(delete_stmt)
-    session.execute(delete_stmt)
-
-    #delete and reconstruct other dimensions
+    instrumentation.execute(session, delete_stmt)
 
-    print("--- Deleting and reconstructing other dimensions ---")
+    # dimensions are not deleted here, their closed versions are replaced once everything is inserted (see remap_dimension)
 
     #-- dim airport 
-    #-- delete
-    delete_stmt = sqlalchemy.delete(star.DimAirport).where(
-        sqlalchemy.and_(
-            whm.Airport.airport_sk == star.DimAirport.airport_sk,
-            whm.Airport.end_date != sqlalchemy.literal(datetime.datetime.max),
-        )
-    )
-    print(delete_stmt)
-    session.execute(delete_stmt)
-
     #-- insert
     select_stmt = select_map['dim_airport']
     insert_stmt = pg_insert(star.DimAirport).from_select(
@@ -196,18 +229,10 @@ def incremental_load_star_schema():
     )
 
 
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- dim airplane
         
-    delete_stmt = sqlalchemy.delete(star.DimAirplane).where(
-        sqlalchemy.and_(
-            whm.Airplane.airplane_sk == star.DimAirplane.airplane_sk,
-            whm.Airplane.end_date != sqlalchemy.literal(datetime.datetime.max),
-        )
-    )
-    print(delete_stmt)
-    session.execute(delete_stmt)
 
     #-- insert
     select_stmt = select_map['dim_airplane']
@@ -226,17 +251,9 @@ def incremental_load_star_schema():
         index_elements=[star.DimAirplane.airplane_sk]
     )
 
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- dim pilot
-    delete_stmt = sqlalchemy.delete(star.DimPilot).where(
-        sqlalchemy.and_(
-            whm.Pilot.pilot_sk == star.DimPilot.pilot_sk,
-            whm.Pilot.end_date != sqlalchemy.literal(datetime.datetime.max),
-        )
-    )
-    print(delete_stmt)
-    session.execute(delete_stmt)
 
     #-- insert
     select_stmt = select_map['dim_pilot']
@@ -252,17 +269,9 @@ def incremental_load_star_schema():
     ).on_conflict_do_nothing(
         index_elements=[star.DimPilot.pilot_sk]
     )
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- dim customer
-    delete_stmt = sqlalchemy.delete(star.DimCustomer).where(
-        sqlalchemy.and_(
-            whm.Customer.customer_sk == star.DimCustomer.customer_sk,
-            whm.Customer.end_date != sqlalchemy.literal(datetime.datetime.max),
-        )
-    )
-    print(delete_stmt)
-    session.execute(delete_stmt)
 
     #-- insert
     select_stmt = select_map['dim_customer']
@@ -279,11 +288,9 @@ def incremental_load_star_schema():
     ).on_conflict_do_nothing(
         index_elements=[star.DimCustomer.customer_sk]
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
-    #-- dim flight - we have already deleted, so we can just insert
-    print("--- Dim flight ---")
+    #-- dim flight
     #-- insert
     select_stmt = select_map['dim_flight']
     insert_stmt = pg_insert(star.DimFlight).from_select(
@@ -306,8 +313,7 @@ def incremental_load_star_schema():
     ).on_conflict_do_nothing(
         index_elements=[star.DimFlight.flight_sk]
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- we will ignore dim date for now seeing as it covers 100 years or so
 
@@ -328,8 +334,7 @@ def incremental_load_star_schema():
     ).on_conflict_do_nothing(
         index_elements=[star.FactFlight.flight_sk]
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- fact booking
     # write path overhead will kill the performance of half of this code but its fine,
@@ -345,15 +350,15 @@ def incremental_load_star_schema():
         select_stmt.join(
             star.FactBooking,
             star.FactBooking.flight_booking_sk == whm.FlightBooking.flight_booking_sk,
+            isouter=True,
         ).where(
             sqlalchemy.and_(
                 whm.FlightBooking.end_date == sqlalchemy.literal(datetime.datetime.max),
-                whm.FlightBooking.flight_booking_sk == sqlalchemy.null(),
+                star.FactBooking.flight_booking_sk == sqlalchemy.null(),
             )
         )
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
     #-- fact review
     select_stmt = select_map['fact_review']
@@ -378,25 +383,29 @@ def incremental_load_star_schema():
     ).on_conflict_do_nothing(
         index_elements=[star.FactReview.airline_review_sk]
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
+    instrumentation.execute(session, insert_stmt)
 
+    # dim flight first, its rows reference the other dimensions
+    for dimension in dimension_keys:
+        remap_dimension(session, dimension)
 
-    session.commit()
-    print("--- Star schema loaded ---")
+    checkpoints.commit(session, batch_id, star_db.metadata.schema)
 
+@instrumentation.phased("star_full")
 def full_load_star_schema(
         batch_id: int,
+        resume: bool = False,
 ):
-    print("--- Begin full load on star schema ---")
+    if checkpoints.start(batch_id, [star_db.metadata.schema], resume):
+        return
     session = database.get_session(star_db.engine)
 
-    print("--- Wiping and recreating schema (this may take a while on a large database) ---")
+    # this may take a while on a large database
+    instrumentation.log_event("schema_reset", schema=star_db.metadata.schema)
     database.wipe_schema(star_db.engine,star_db.metadata)
     database.ensure_schema(star_db.engine,star_db.metadata)
 
 
-    print("--- Dim airport ---")
     select_stmt = sqlalchemy.select(
         whm.Airport.airport_sk,
         whm.Airport.code,
@@ -414,11 +423,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Dim airport loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Dim airplane ---")
     select_stmt = sqlalchemy.select(
         whm.Airplane.airplane_sk,
         whm.Airplane.model,
@@ -436,11 +442,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
-    print("+++Dim airplane loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Dim pilot ---")
     select_stmt = sqlalchemy.select(
         whm.Pilot.pilot_sk,
         whm.Pilot.name,
@@ -454,10 +457,7 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Dim pilot loaded+++")
-    print("--- Dim customer ---")
+    instrumentation.execute(session, insert_stmt)
     select_stmt = sqlalchemy.select(
         whm.Customer.customer_sk,
         whm.Customer.full_name,
@@ -473,11 +473,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Dim customer loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Dim flight ---")
     select_stmt = sqlalchemy.select(
         whm.Flight.flight_sk,
         whm.Flight.flight_number,
@@ -507,13 +504,10 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Dim flight loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Dim date ---")
     #-- generate date dimension
-    session.execute(sqlalchemy.text("""
+    instrumentation.execute(session, sqlalchemy.text("""
         INSERT INTO star_schema.dim_date (date, day, month, year, weekday)
         SELECT
             date::date,
@@ -526,10 +520,8 @@ def full_load_star_schema(
             '2099-12-31'::date,
             '1 day'::interval
         ) AS date(date)
-    """))
-    print("+++Dim date loaded+++")
+    """), f"{star_db.metadata.schema}.dim_date", "insert")
 
-    print("--- Fact flight ---")
     #-- generate fact flight
     select_stmt = sqlalchemy.select(
         whm.Flight.flight_sk,
@@ -557,11 +549,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Fact flight loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Fact booking ---")
     #-- generate fact booking
     select_stmt = select_map['fact_booking']
 
@@ -574,11 +563,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    session.execute(insert_stmt)
-    print(insert_stmt)
-    print("+++Fact booking loaded+++")
+    instrumentation.execute(session, insert_stmt)
 
-    print("--- Fact review ---")
     #-- generate fact review
     select_stmt = sqlalchemy.select(
         whm.AirlineReview.airline_review_sk,
@@ -621,10 +607,8 @@ def full_load_star_schema(
         ],
         select_stmt,
     )
-    print(insert_stmt)
-    session.execute(insert_stmt)
-    session.commit()
-    print("--- Star schema loaded ---")
+    instrumentation.execute(session, insert_stmt)
+    checkpoints.commit(session, batch_id, star_db.metadata.schema)
 
 if __name__ == "__main__":
     full_load_star_schema(1)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""
+Per table choice between the two incremental load paths of the warehouse.
+    scd2     diffs every operational row against its current warehouse version and closes and inserts the
+             changed ones only (etl.warehouse.generate_incremental_load_stmts)
+    rebuild  closes all current versions in one pass and inserts every operational row as the new version,
+             no comparison (etl.warehouse.generate_rebuild_stmts). Unchanged rows get a new version too
+When most of a table changed, e.g. after a bulk fare or profile update, the diff costs more than it saves.
+The change ratio is estimated before loading from the operational table's pg_stat_user_tables counters:
+the updates and deletes since the signatures of the last successful batch (etl.change_detection) over the
+table's live rows. Inserts are left out, both paths insert new rows the same way. A row updated twice counts
+twice, the estimate errs towards rebuilding. Without a baseline, or after a statistics reset, the table
+takes the scd2 path.
+Either path works below the star schema: its refresh moves the facts from a dimension row of a closed version to
+the current version of the same natural key (etl.star_schema.remap_dimension), however many were closed.
+Each decision is logged with its estimate ("load_strategy") and, once the table is loaded, with the rows
+actually closed and the seconds it took ("load_strategy_cost").
+
+Environment:
+    ETL_LOAD_STRATEGY  auto (default), scd2 or rebuild
+    ETL_REBUILD_RATIO  estimated change ratio from which auto rebuilds, 0.5 by default
+
+Usage:
+    python -m etl.strategy
+"""
+
+import os
+import re
+
+import sqlalchemy
+
+import database.reldb as reldb
+import etl.instrumentation as instrumentation
+from etl import ledger
+
+STRATEGIES = ("auto", "scd2", "rebuild")
+SIGNATURE_COUNTERS = re.compile(r"ins=(\d+) upd=(\d+) del=(\d+)")
+
+
+class ChangeEstimate:
+    def __init__(self, table_name: str, live_rows: int, updated: int | None, deleted: int | None):
+        self.table_name = table_name
+        self.live_rows = live_rows
+        # None without a usable baseline
+        self.updated = updated
+        self.deleted = deleted
+
+    @property
+    def changed_rows(self) -> int | None:
+        if self.updated is None or self.deleted is None:
+            return None
+        return min(self.updated + self.deleted, self.live_rows + self.deleted)
+
+    @property
+    def ratio(self) -> float | None:
+        changed_rows = self.changed_rows
+        if changed_rows is None:
+            return None
+        return min(changed_rows / max(self.live_rows + self.deleted, 1), 1.0)
+
+
+class Decision:
+    def __init__(self, estimate: ChangeEstimate, strategy: str, reason: str):
+        self.estimate = estimate
+        self.strategy = strategy
+        self.reason = reason
+
+    @property
+    def estimated_closed_rows(self) -> int | None:
+        # scd2 closes the changed versions, rebuild all current ones
+        if self.strategy == "rebuild":
+            return self.estimate.live_rows + (self.estimate.deleted or 0)
+        return self.estimate.changed_rows
+
+
+def counters(signature: str | None) -> tuple[int, int, int] | None:
+    match = SIGNATURE_COUNTERS.match(signature or "")
+    return tuple(int(group) for group in match.groups()) if match else None
+
+
+def estimate_changes(table_names: list[str], baseline: dict[str, str] | None = None) -> dict[str, ChangeEstimate]:
+    """
+    Change estimates of the operational tables against baseline (signatures by table, by default those of
+    the last successful batch). One read of pg_stat_user_tables, no table is scanned.
+    """
+    if baseline is None:
+        baseline = ledger.last_sources()
+    with reldb.engine.connect() as connection:
+        current = {
+            name: (inserted, updated, deleted, live)
+            for name, inserted, updated, deleted, live in connection.execute(
+                sqlalchemy.text("SELECT relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup FROM pg_stat_user_tables WHERE schemaname = :schema"),
+                {"schema": reldb.metadata.schema},
+            )
+        }
+    estimates = {}
+    for table_name in table_names:
+        inserted, updated, deleted, live = current.get(table_name, (0, 0, 0, 0))
+        previous = counters(baseline.get(table_name))
+        if previous is None or any(now < before for now, before in zip((inserted, updated, deleted), previous)):
+            # no baseline, or the counters went back (statistics reset)
+            estimates[table_name] = ChangeEstimate(table_name, live, None, None)
+        else:
+            estimates[table_name] = ChangeEstimate(table_name, live, updated - previous[1], deleted - previous[2])
+    return estimates
+
+
+def choose(estimate: ChangeEstimate, batch_id: int | None = None, strategy: str | None = None, rebuild_ratio: float | None = None) -> Decision:
+    strategy = strategy or os.getenv("ETL_LOAD_STRATEGY", "auto")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown load strategy: {strategy} (known: {', '.join(STRATEGIES)})")
+    rebuild_ratio = rebuild_ratio if rebuild_ratio is not None else float(os.getenv("ETL_REBUILD_RATIO", "0.5"))
+
+    if strategy != "auto":
+        decision = Decision(estimate, strategy, "ETL_LOAD_STRATEGY")
+    elif estimate.ratio is None:
+        decision = Decision(estimate, "scd2", "no baseline")
+    elif estimate.ratio >= rebuild_ratio:
+        decision = Decision(estimate, "rebuild", f"ratio >= {rebuild_ratio}")
+    else:
+        decision = Decision(estimate, "scd2", f"ratio < {rebuild_ratio}")
+    instrumentation.log_event(
+        "load_strategy",
+        batch_id=batch_id,
+        table=estimate.table_name,
+        strategy=decision.strategy,
+        reason=decision.reason,
+        live_rows=estimate.live_rows,
+        estimated_changed_rows=estimate.changed_rows,
+        estimated_ratio=round(estimate.ratio, 4) if estimate.ratio is not None else None,
+        estimated_closed_rows=decision.estimated_closed_rows,
+    )
+    return decision
+
+
+def log_cost(decision: Decision, batch_id: int | None, closed_rows: int, inserted_rows: int, seconds: float):
+    instrumentation.log_event(
+        "load_strategy_cost",
+        batch_id=batch_id,
+        table=decision.estimate.table_name,
+        strategy=decision.strategy,
+        estimated_closed_rows=decision.estimated_closed_rows,
+        closed_rows=closed_rows,
+        inserted_rows=inserted_rows,
+        seconds=round(seconds, 3),
+    )
+
+
+if __name__ == "__main__":
+    # what the next incremental load would choose
+    from etl.warehouse import select_map
+
+    for estimate in estimate_changes(list(select_map)).values():
+        ratio = f"{estimate.ratio:.1%}" if estimate.ratio is not None else "-"
+        changed_rows = f"{estimate.changed_rows:,}" if estimate.changed_rows is not None else "-"
+        print(f"{estimate.table_name:<20} {estimate.live_rows:>10,} live {changed_rows:>10} changed {ratio:>7}  {choose(estimate).strategy}")
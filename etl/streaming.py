@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+Streaming extract for an operational database and warehouse on separate servers (WAREHOUSE_DATABASE_URL set).
+Every loaded table is copied into airline_staging on the warehouse side: COPY (SELECT ...) TO STDOUT on the
+source is piped into COPY ... FROM STDIN on the warehouse through an OS pipe, nothing lands on disk and only
+a pipe buffer of rows is in memory. The warehouse engine translates the airline schema to airline_staging,
+so the SCD2 statements of etl.warehouse then run locally, unchanged.
+Staging tables have the primary keys but no foreign keys, tables are copied independently.
+The source is read through the extract engine role in primary key ranges, paced and backed off by etl.governor.
+Each range is its own statement and transaction on the source, a row changed during the copy shows the state of
+its range's read and the next load picks up the rest. The staging copy commits once, after the last range.
+
+Usage:
+    python -m etl.streaming pilots flights
+"""
+
+import argparse
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy
+
+import constants
+import database.reldb as reldb
+import database.warehouse as warehouse
+import etl.instrumentation as instrumentation
+from data import copy_stream
+from database import engines
+from etl.governor import Governor
+
+COPY_FORMAT = "binary"
+
+staging_metadata = sqlalchemy.MetaData(schema=constants.AIRLINE_STAGING_SCHEMA)
+
+
+def staging_table(table_name: str) -> sqlalchemy.Table:
+    key = f"{staging_metadata.schema}.{table_name}"
+    if key not in staging_metadata.tables:
+        source = reldb.metadata.tables[f"{reldb.metadata.schema}.{table_name}"]
+        sqlalchemy.Table(
+            table_name, staging_metadata,
+            *[sqlalchemy.Column(column.name, column.type, primary_key=column.primary_key) for column in source.columns],
+        )
+    return staging_metadata.tables[key]
+
+
+def ensure_staging(table_names: list[str]):
+    tables = [staging_table(table_name) for table_name in table_names]
+    with warehouse.engine.begin() as connection:
+        connection.execute(sqlalchemy.schema.CreateSchema(staging_metadata.schema, if_not_exists=True))
+    staging_metadata.create_all(warehouse.engine, tables=tables)
+
+
+def copy_query(source_connection, target_cursor, select_sql: str, target: sqlalchemy.Table, columns: list[str]) -> int:
+    # pipes the rows of select_sql on the source into target, returns the rows copied
+    errors = []
+    read_fd, write_fd = os.pipe()
+
+    def extract():
+        # closing the write end is what ends the COPY on the other side
+        try:
+            with os.fdopen(write_fd, "wb") as pipe:
+                cursor = source_connection.cursor()
+                cursor.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH (FORMAT {COPY_FORMAT})", pipe)
+                cursor.close()
+            source_connection.commit()
+        except BaseException as e:
+            errors.append(e)
+
+    extractor = threading.Thread(target=extract, name=f"extract-{target.name}", daemon=True)
+    extractor.start()
+    try:
+        # a failed load closes the read end, the extractor then stops on a broken pipe
+        with os.fdopen(read_fd, "rb") as pipe:
+            copy_stream.copy_from_file(target_cursor, target.fullname, columns, pipe, COPY_FORMAT)
+    finally:
+        extractor.join()
+    if errors:
+        raise errors[0]
+    return target_cursor.rowcount
+
+
+def stream_table(table_name: str, governor: Governor | None = None) -> int:
+    """
+    Replaces the staging copy of an operational table with its current rows, returns the rows copied.
+    """
+    governor = governor or Governor.from_env()
+    source = reldb.metadata.tables[f"{reldb.metadata.schema}.{table_name}"]
+    target = staging_table(table_name)
+    columns = [column.name for column in source.columns]
+    extract_engine = engines.get_engine("extract")
+    key = list(source.primary_key.columns)[0]
+
+    governor.wait_for_source(table_name)
+    with extract_engine.connect() as connection:
+        key_ranges = governor.key_ranges(*connection.execute(sqlalchemy.select(sqlalchemy.func.min(key), sqlalchemy.func.max(key))).one())
+
+    source_connection = extract_engine.raw_connection()
+    target_connection = warehouse.engine.raw_connection()
+    try:
+        with instrumentation.step(target.fullname, "copy") as record:
+            cursor = target_connection.cursor()
+            cursor.execute(f"TRUNCATE {target.fullname}")
+            for low, high in key_ranges:
+                governor.wait_for_source(table_name)
+                select_sql = str(
+                    sqlalchemy.select(source).where(key.between(low, high))
+                    .compile(dialect=extract_engine.dialect, compile_kwargs={"literal_binds": True})
+                )
+                rows = copy_query(source_connection, cursor, select_sql, target, columns)
+                record["rows"] += rows
+                governor.throttle(rows, table_name)
+            cursor.close()
+            target_connection.commit()
+    finally:
+        source_connection.close()
+        target_connection.close()
+    return record["rows"]
+
+
+def stream_tables(table_names: list[str]) -> int:
+    ensure_staging(table_names)
+    governor = Governor.from_env()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=governor.max_queries, thread_name_prefix="stream") as executor:
+        # every table in a copy of the caller's context, its statements keep the phase and batch id
+        futures = [executor.submit(contextvars.copy_context().run, stream_table, table_name, governor) for table_name in table_names]
+        rows = sum(future.result() for future in futures)
+    instrumentation.log_event("tables_streamed", tables=",".join(table_names), rows=rows, seconds=round(time.perf_counter() - start, 3))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream operational tables into the warehouse staging schema.")
+    parser.add_argument("tables", nargs="*", help="all operational tables the warehouse loads by default")
+    args = parser.parse_args()
+    from etl.warehouse import select_map
+    table_names = args.tables or list(select_map)
+    rows = stream_tables(table_names)
+    print(f"+++++ Streamed {rows:,} rows of {len(table_names)} tables into {staging_metadata.schema}")
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+"""
+Event driven triggering of the incremental load.
+install_triggers() puts statement level triggers on the operational tables the warehouse loads from,
+every INSERT, UPDATE, DELETE, COPY or TRUNCATE on them sends NOTIFY airline_changes with the table name.
+Postgres folds identical notifications of one transaction into one, so a bulk write costs a single event.
+listen() waits for them and starts a load once changes have arrived:
+    debounce      seconds without new events before loading, a burst of writes becomes one batch
+    min_interval  seconds between the starts of two loads
+    max_interval  seconds a change waits at most, writes that never calm down are still loaded
+It loads once on start as well, changes made while nobody listened are not missed. A load that returns True
+left work behind (a CDC run that hit its cap), it is due again as if its changes had just been notified.
+Notifications only say that something changed, the load itself still goes through change detection.
+
+Usage:
+    python -m etl.triggers install
+    python -m etl.triggers remove
+    python -m flows.initial --listen
+"""
+
+import argparse
+import logging
+import select
+import time
+from typing import Callable
+
+import sqlalchemy
+
+import database.reldb as reldb
+import etl.instrumentation as instrumentation
+from etl.warehouse import id_map
+
+NOTIFY_CHANNEL = "airline_changes"
+TRIGGER_NAME = "etl_notify_change"
+FUNCTION_NAME = "etl_notify_change"
+# wakes up now and then even without events, so CTRL+C is handled on every platform
+IDLE_POLL = 60.0
+# stands in for the table names when a load left work behind
+LEFT_OVER = "left_over"
+
+
+def install_triggers():
+    """
+    (Re)creates the notify function and triggers, synthesizing the operational db drops them with the schema.
+    """
+    schema = reldb.metadata.schema
+    with reldb.engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f"""
+            CREATE OR REPLACE FUNCTION {schema}.{FUNCTION_NAME}() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        for table_name in id_map:
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {schema}.{table_name}"))
+            connection.execute(sqlalchemy.text(
+                f"CREATE TRIGGER {TRIGGER_NAME} AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {schema}.{table_name} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION {schema}.{FUNCTION_NAME}()"
+            ))
+    instrumentation.log_event("triggers_installed", channel=NOTIFY_CHANNEL, tables=",".join(id_map))
+
+
+def remove_triggers():
+    schema = reldb.metadata.schema
+    with reldb.engine.begin() as connection:
+        for table_name in id_map:
+            connection.execute(sqlalchemy.text(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {schema}.{table_name}"))
+        connection.execute(sqlalchemy.text(f"DROP FUNCTION IF EXISTS {schema}.{FUNCTION_NAME}()"))
+    instrumentation.log_event("triggers_removed", channel=NOTIFY_CHANNEL)
+
+
+class Debouncer:
+    """
+    Decides when the pending changes are due, times are time.monotonic() seconds.
+    """
+
+    def __init__(self, debounce: float, min_interval: float, max_interval: float):
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.tables: set[str] = set()
+        self.first_event: float | None = None
+        self.last_event: float | None = None
+        self.last_run: float | None = None
+
+    def notify(self, table_name: str, now: float):
+        self.tables.add(table_name)
+        if self.first_event is None:
+            self.first_event = now
+        self.last_event = now
+
+    def due(self) -> float | None:
+        # None while nothing is pending
+        if self.first_event is None:
+            return None
+        due = min(self.last_event + self.debounce, self.first_event + self.max_interval)
+        if self.last_run is not None:
+            due = max(due, self.last_run + self.min_interval)
+        return due
+
+    def take(self, now: float) -> set[str]:
+        tables = self.tables
+        self.tables = set()
+        self.first_event = self.last_event = None
+        self.last_run = now
+        return tables
+
+
+def listen(run_load: Callable[[], bool | None], debounce: float = 2.0, min_interval: float = 10.0, max_interval: float = 60.0):
+    """
+    Runs run_load() on start and whenever notified changes are due, until interrupted.
+    Events that arrive during a load are queued by the connection and handled after it.
+    """
+    install_triggers()
+    debouncer = Debouncer(debounce, min_interval, max_interval)
+
+    raw = reldb.engine.raw_connection()
+    try:
+        connection = raw.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        print(f"+++++ Listening on {NOTIFY_CHANNEL} (debounce {debounce}s, min interval {min_interval}s, max interval {max_interval}s)")
+
+        instrumentation.log_event("trigger_fired", reason="startup")
+        debouncer.take(time.monotonic())
+        if run_load():
+            debouncer.notify(LEFT_OVER, time.monotonic())
+
+        while True:
+            due = debouncer.due()
+            timeout = IDLE_POLL if due is None else max(due - time.monotonic(), 0.0)
+            if select.select([connection], [], [], timeout) != ([], [], []):
+                connection.poll()
+                while connection.notifies:
+                    debouncer.notify(connection.notifies.pop(0).payload, time.monotonic())
+            # checked after every wake-up, notifies arriving faster than the timeout must not hold off max_interval
+            now = time.monotonic()
+            due = debouncer.due()
+            if due is None or now < due:
+                continue
+            waited = now - debouncer.first_event
+            tables = debouncer.take(now)
+            instrumentation.log_event("trigger_fired", reason="changes", tables=",".join(sorted(tables)), waited_seconds=round(waited, 3))
+            try:
+                if run_load():
+                    debouncer.notify(LEFT_OVER, time.monotonic())
+            except Exception as e:
+                # the next events try again, a failed load must not stop the listener
+                instrumentation.log_event("trigger_load_failed", logging.ERROR, error=repr(e))
+    finally:
+        raw.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NOTIFY triggers on the operational tables.")
+    parser.add_argument("command", choices=("install", "remove"))
+    args = parser.parse_args()
+    if args.command == "install":
+        install_triggers()
+    else:
+        remove_triggers()
@@ -10,15 +10,30 @@ import database
 import database.reldb as reldb
 import database.warehouse as warehouse
 import database.csv_staging as csv_staging
+import database.etl_meta as etl_meta
+import etl.checkpoints as checkpoints
+import etl.governor as governor
+import etl.instrumentation as instrumentation
+import etl.strategy as strategy
+import etl.streaming as streaming
 import etl.utils as utils
 import model.warehouse as warehouse_model
 import model.reldb as reldb_model
 import data
 
+import contextvars
+import time
 import sqlalchemy
 import sqlalchemy.orm
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+REVIEWS_FNAME = "data/output/reviews.csv"
+# warehouse tables loaded from the reviews csv rather than from select_map
+CSV_TABLES = ("airline_reviews",)
+# change log entries apply_change_log takes per micro-batch
+CHANGE_LOG_BATCH = 10_000
+
 # reldb_tables = {
 #     "pilots": reldb_model.Pilot,
 #     "cabin_crew": reldb_model.CabinCrew,
@@ -34,6 +49,12 @@ arrival_airport = sqlalchemy.orm.aliased(warehouse_model.Airport, name="arrival_
 pilot = sqlalchemy.orm.aliased(warehouse_model.Pilot, name="pilot")
 copilot = sqlalchemy.orm.aliased(warehouse_model.Pilot, name="copilot")
 
+
+def current_version(entity) -> sqlalchemy.ColumnElement:
+    # referenced warehouse rows are joined by their current version, every closed one would add a row
+    return entity.end_date == sqlalchemy.literal(datetime.max)
+
+
 select_map: dict[str, sqlalchemy.Select] = {
     'pilots': sqlalchemy.select(
         reldb_model.Pilot.id.label("pilot_id"),
@@ -85,19 +106,19 @@ select_map: dict[str, sqlalchemy.Select] = {
             reldb_model.Flight.estimated_flight_hours,
         ).join(
             departure_airport,
-            reldb_model.Flight.departure_airport_id == departure_airport.airport_id,
+            sqlalchemy.and_(reldb_model.Flight.departure_airport_id == departure_airport.airport_id, current_version(departure_airport)),
         ).join(
             arrival_airport,
-            reldb_model.Flight.arrival_airport_id == arrival_airport.airport_id,
+            sqlalchemy.and_(reldb_model.Flight.arrival_airport_id == arrival_airport.airport_id, current_version(arrival_airport)),
         ).join(
             pilot,
-            reldb_model.Flight.pilot_id == pilot.pilot_id,
+            sqlalchemy.and_(reldb_model.Flight.pilot_id == pilot.pilot_id, current_version(pilot)),
         ).join(
             copilot,
-            reldb_model.Flight.copilot_id == copilot.pilot_id,
+            sqlalchemy.and_(reldb_model.Flight.copilot_id == copilot.pilot_id, current_version(copilot)),
         ).join(
             warehouse_model.Airplane,
-            reldb_model.Flight.airplane_id == warehouse_model.Airplane.airplane_id,
+            sqlalchemy.and_(reldb_model.Flight.airplane_id == warehouse_model.Airplane.airplane_id, current_version(warehouse_model.Airplane)),
         ),
     'flight_cabin_crew': sqlalchemy.select(
         warehouse_model.CabinCrew.cabin_crew_sk,
@@ -107,10 +128,10 @@ select_map: dict[str, sqlalchemy.Select] = {
         reldb_model.FlightCabinCrew.id.label("flight_cabin_crew_id"),
     ).join(
         warehouse_model.CabinCrew,
-        reldb_model.FlightCabinCrew.cabin_crew_id == warehouse_model.CabinCrew.cabin_crew_id,
+        sqlalchemy.and_(reldb_model.FlightCabinCrew.cabin_crew_id == warehouse_model.CabinCrew.cabin_crew_id, current_version(warehouse_model.CabinCrew)),
     ).join(
         warehouse_model.Flight,
-        reldb_model.FlightCabinCrew.flight_id == warehouse_model.Flight.flight_id,
+        sqlalchemy.and_(reldb_model.FlightCabinCrew.flight_id == warehouse_model.Flight.flight_id, current_version(warehouse_model.Flight)),
     ),
     'flight_bookings': sqlalchemy.select(
         reldb_model.FlightBooking.id.label("flight_booking_id"),
@@ -128,10 +149,10 @@ select_map: dict[str, sqlalchemy.Select] = {
         reldb_model.FlightBooking.seat_number,
     ).join(
         warehouse_model.Flight,
-        reldb_model.FlightBooking.flight_id == warehouse_model.Flight.flight_id,
+        sqlalchemy.and_(reldb_model.FlightBooking.flight_id == warehouse_model.Flight.flight_id, current_version(warehouse_model.Flight)),
     ).join(
         warehouse_model.Customer,
-        reldb_model.FlightBooking.customer_id == warehouse_model.Customer.customer_id,
+        sqlalchemy.and_(reldb_model.FlightBooking.customer_id == warehouse_model.Customer.customer_id, current_version(warehouse_model.Customer)),
     ),
 }
 
@@ -150,50 +171,155 @@ def reset_warehouse_schema(
         engine: sqlalchemy.engine.Engine,
         metadata: sqlalchemy.MetaData,
 ):
-    print(" --- Wiping warehouse schema ---")
+    instrumentation.log_event("schema_reset", schema=metadata.schema)
     database.wipe_schema(engine, metadata)
     database.ensure_schema(engine, metadata)
 
-    print(" --- Recreating warehouse schema ---")
     database.ensure_schema(engine, metadata)
 
-    print(" +++ Warehouse schema reset successfully +++ ")
+def warehouse_table_names() -> list[str]:
+    # every warehouse table in load order, a table comes after the tables it references
+    return [*select_map, *CSV_TABLES]
 
-def full_load_warehouse_2(
+
+def referenced_tables(table_name: str) -> set[str]:
+    wh_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"]
+    return {fk.column.table.name for fk in wh_table.foreign_keys} - {table_name}
+
+
+def table_dependents(tables: set[str]) -> list[str]:
+    """
+    tables plus every warehouse table that references one of them through a foreign key, transitively, in load order.
+    Reloading a table gives its rows new surrogate keys, the rows pointing at the old ones have to be reloaded too.
+    """
+    unknown = set(tables) - set(warehouse_table_names())
+    if unknown:
+        raise ValueError(f"Unknown warehouse tables: {', '.join(sorted(unknown))}")
+    closure = set(tables)
+    # load order, so one pass sees the referenced tables before their dependents
+    for table_name in warehouse_table_names():
+        if referenced_tables(table_name) & closure:
+            closure.add(table_name)
+    return [table_name for table_name in warehouse_table_names() if table_name in closure]
+
+
+def load_levels(table_names: list[str]) -> list[list[str]]:
+    # groups of tables that only reference tables of earlier groups (or tables not being loaded), a group can load concurrently
+    levels = []
+    remaining = list(table_names)
+    while remaining:
+        level = [table_name for table_name in remaining if not referenced_tables(table_name) & set(remaining)]
+        levels.append(level)
+        remaining = [table_name for table_name in remaining if table_name not in level]
+    return levels
+
+
+def step_name(table_name: str) -> str:
+    # checkpoint step of a warehouse table, see etl.checkpoints
+    return f"{warehouse.metadata.schema}.{table_name}"
+
+
+def load_table(
         insert_id: int,
+        table_name: str,
 ):
-    print(" --- Starting full load of warehouse ---")
-    warehouse_session = database.get_session(warehouse.engine)
+    # inserts the current operational rows of one empty warehouse table, in its own transaction with its checkpoint
+    if table_name in CSV_TABLES:
+        rows = incremental_load_csv_staging(insert_id, REVIEWS_FNAME)
+        checkpoints.commit(None, insert_id, step_name(table_name), rows)
+        return
 
-    reset_warehouse_schema(warehouse.engine, warehouse.metadata)
+    warehouse_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"]
 
-    for table_name, select_stmt in select_map.items():
-        print(f" --- Loading {table_name} table ---")
-        warehouse_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"]
+    assert isinstance(warehouse_table, sqlalchemy.Table), f"Table {table_name} is not a valid table"
 
-        assert isinstance(warehouse_table, sqlalchemy.Table), f"Table {table_name} is not a valid table"
+    insert_stmt = utils.create_warehouse_insert_stmt(
+        insert_id,
+        constants.WAREHOUSE_RELDB_SOURCE_ID,
+        select_map[table_name],
+        warehouse_table,
+    )
 
-        insert_stmt = utils.create_warehouse_insert_stmt(
-            insert_id,
-            constants.WAREHOUSE_RELDB_SOURCE_ID,
-            select_stmt,
-            warehouse_table,
-        )
+    if not constants.SPLIT_DATABASES:
+        # the insert reads the whole operational table, give way while the source is slow
+        governor.wait_for_source(table_name)
+    with database.get_session(warehouse.engine) as warehouse_session:
+        if constants.SPLIT_DATABASES:
+            # rows of an attempt that committed but died before its checkpoint
+            instrumentation.execute(warehouse_session, sqlalchemy.delete(warehouse_table).where(warehouse_table.c.insert_id == insert_id))
+        rows = affected_rows(instrumentation.execute(warehouse_session, insert_stmt))
+        checkpoints.commit(warehouse_session, insert_id, step_name(table_name), rows)
 
-        print(insert_stmt)
-        warehouse_session.execute(insert_stmt)
-        print(f" +++ {table_name} table loaded successfully +++ ")
 
-    warehouse_session.commit()
+def load_tables(
+        insert_id: int,
+        table_names: list[str],
+        parallel: int = 1,
+        done: dict[str, int] | None = None,
+):
+    """
+    Loads the tables level by level (see load_levels), up to parallel tables of a level at a time.
+    Tables whose step is in done (see etl.checkpoints.start) are skipped.
+    The warehouse pool has to allow parallel connections.
+    """
+    table_names = [table_name for table_name in table_names if step_name(table_name) not in (done or {})]
+    if constants.SPLIT_DATABASES:
+        streaming.stream_tables([table_name for table_name in table_names if table_name in select_map])
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="warehouse-load") as pool:
+        for level in load_levels(table_names):
+            # each worker runs in a copy of the caller's context, so statements keep their phase and batch id
+            futures = [pool.submit(contextvars.copy_context().run, load_table, insert_id, table_name) for table_name in level]
+            for future in futures:
+                future.result()
+
+
+@instrumentation.phased("warehouse_full", batch_param="insert_id")
+def full_load_warehouse_2(
+        insert_id: int,
+        parallel: int = 1,
+        resume: bool = False,
+):
+    table_names = warehouse_table_names()
+    done = checkpoints.start(insert_id, [step_name(table_name) for table_name in table_names], resume)
+    # a resumed load keeps the tables it got through
+    if not done:
+        reset_warehouse_schema(warehouse.engine, warehouse.metadata)
+    load_tables(insert_id, table_names, parallel, done)
 
-    incremental_load_csv_staging(insert_id, "data/output/reviews.csv")
-    print(" +++ Full load of warehouse completed successfully +++ ")
+
+@instrumentation.phased("warehouse_reload")
+def reload_warehouse_tables(
+        batch_id: int,
+        tables: set[str],
+        parallel: int = 1,
+        resume: bool = False,
+) -> list[str]:
+    """
+    Full reload of some warehouse tables and their dependents (see table_dependents), the other tables keep their rows.
+    The reloaded tables lose their SCD2 history like in a full load. Returns the reloaded tables.
+    """
+    table_names = table_dependents(tables)
+    done = checkpoints.start(batch_id, [step_name(table_name) for table_name in table_names], resume)
+    if not done:
+        targets = [warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"] for table_name in table_names]
+        with database.get_session(warehouse.engine) as warehouse_session:
+            # one statement, the foreign keys between the truncated tables do not get in the way
+            instrumentation.execute(
+                warehouse_session,
+                sqlalchemy.text(f"TRUNCATE {', '.join(target.fullname for target in targets)}"),
+                ",".join(target.fullname for target in targets),
+                "truncate",
+            )
+            warehouse_session.commit()
+    load_tables(batch_id, table_names, parallel, done)
+    return table_names
 
 
+@instrumentation.phased("warehouse_full", batch_param="insert_id")
 def full_load_warehouse(
         insert_id: int,
 ):
-    print(" --- Starting full load of warehouse ---")
     reldb_session = database.get_session(reldb.engine)
     warehouse_session = database.get_session(warehouse.engine)
 
@@ -229,8 +355,6 @@ def full_load_warehouse(
 
     # ----- PILOTS TABLE -----
 
-    print(" --- Loading pilots table ---")
-
     select_stmt = sqlalchemy.select(
         reldb_model.Pilot.id.label("pilot_id"),
         reldb_model.Pilot.name,
@@ -246,14 +370,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- CABIN CREW TABLE -----
 
-    print(" +++ Pilots table loaded successfully +++ ")
-
-    print(" --- Loading cabin crew table ---")
-
     select_stmt = sqlalchemy.select(
         reldb_model.CabinCrew.id.label("cabin_crew_id"),
         reldb_model.CabinCrew.name,
@@ -269,12 +389,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- CUSTOMERS TABLE -----
 
-    print(" +++ Cabin crew table loaded successfully +++ ")
-    print(" --- Loading customers table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.Customer.id.label("customer_id"),
@@ -293,12 +411,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- AIRPORTS TABLE -----
 
-    print(" +++ Customers table loaded successfully +++ ")
-    print(" --- Loading airports table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.Airport.id.label("airport_id"),
@@ -320,12 +436,10 @@ def full_load_warehouse(
         select_stmt,
     )
 
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- AIRPLANES TABLE -----
 
-    print(" +++ Airports table loaded successfully +++ ")
-    print(" --- Loading airplanes table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.Airplane.id.label("airplane_id"),
@@ -346,12 +460,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- FLIGHTS TABLE -----
 
-    print(" +++ Airplanes table loaded successfully +++ ")
-    print(" --- Loading flights table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.Flight.id.label("flight_id"),
@@ -403,12 +515,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- FLIGHT CABIN CREW TABLE -----
 
-    print(" +++ Flights table loaded successfully +++ ")
-    print(" --- Loading flight cabin crew table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.FlightCabinCrew.id.label("flight_cabin_crew_id"),
@@ -431,12 +541,10 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
+    instrumentation.execute(warehouse_session, insert_stmt)
 
     # ----- FLIGHT BOOKINGS TABLE -----
 
-    print(" +++ Flight cabin crew table loaded successfully +++ ")
-    print(" --- Loading flight bookings table ---")
 
     select_stmt = sqlalchemy.select(
         reldb_model.FlightBooking.id.label("flight_booking_id"),
@@ -461,12 +569,9 @@ def full_load_warehouse(
         ],
         select_stmt,
     )
-    warehouse_session.execute(insert_stmt)
-
-    print(" +++ Flight bookings table loaded successfully +++ ")
+    instrumentation.execute(warehouse_session, insert_stmt)
 
-    incremental_load_csv_staging(insert_id, "data/output/reviews.csv")
-    print(" +++ Full load of warehouse completed successfully +++ ")
+    incremental_load_csv_staging(insert_id, REVIEWS_FNAME)
 
     warehouse_session.commit()
 
@@ -479,8 +584,11 @@ def generate_incremental_load_stmts(
         wh_id_col: sqlalchemy.orm.InstrumentedAttribute,
         comparison_tuples: list[tuple[sqlalchemy.orm.InstrumentedAttribute, sqlalchemy.orm.InstrumentedAttribute]],
         select_stmt: sqlalchemy.Select,
+        key_filter: sqlalchemy.ColumnElement | None = None,
 ): 
-    print(f" --- Generating incremental load stmts for table: {wh_table.name} ---")
+    # key_filter restricts both statements to some operational rows, e.g. the keys in the change log
+    if key_filter is not None:
+        select_stmt = select_stmt.where(key_filter)
 
     diff_condition = utils.generate_diff_condition(
             wh_table,
@@ -525,6 +633,8 @@ def generate_incremental_load_stmts(
         update_id=sqlalchemy.literal(batch_id),
         source_id=sqlalchemy.literal(source_id),
     )
+    if key_filter is not None:
+        update_stmt = update_stmt.where(key_filter)
 
     #insert new values
     insert_stmt = utils.create_warehouse_insert_stmt(
@@ -543,20 +653,61 @@ def generate_incremental_load_stmts(
         wh_table,
     )
 
-    print(f" +++ Incremental load stmts generated successfully for table: {wh_table.name} +++ ")
-
     return insert_stmt, update_stmt
 
 
-def incremental_load_warehouse(
+def generate_rebuild_stmts(
         batch_id: int,
+        source_id: int,
+        wh_table: sqlalchemy.Table,
+        select_stmt: sqlalchemy.Select,
 ):
-    print(" --- Starting incremental load of warehouse ---")
+    # set-based counterpart of generate_incremental_load_stmts: closes every current version and inserts all
+    # operational rows as new ones, see etl.strategy. Rows deleted at the source stay closed
+    close_stmt = sqlalchemy.update(wh_table).where(
+        wh_table.c.end_date == sqlalchemy.literal(datetime.max),
+    ).values(
+        end_date=sqlalchemy.literal(datetime.now()),
+        update_id=sqlalchemy.literal(batch_id),
+        source_id=sqlalchemy.literal(source_id),
+    )
+    insert_stmt = utils.create_warehouse_insert_stmt(batch_id, source_id, select_stmt, wh_table)
+    return insert_stmt, close_stmt
 
-    warehouse_session = database.get_session(warehouse.engine)
 
-    for table_name, select_stmt in select_map.items():
-        print(f" --- Loading table: {table_name} ---")
+def affected_rows(result) -> int:
+    # None when etl.explain intercepts the statement
+    return max(result.rowcount, 0) if result is not None else 0
+
+
+@instrumentation.phased("warehouse_incremental")
+def incremental_load_warehouse(
+        batch_id: int,
+        tables: set[str] | None = None,
+        reviews: bool = True,
+        resume: bool = False,
+) -> int:
+    """
+    SCD2 load of the operational tables (all of select_map, or only those in tables) and, with reviews, of the review csv.
+    Each operational table is diffed or, when most of it changed, rebuilt (see etl.strategy).
+    Every table commits with its checkpoint, resume skips the ones batch_id already loaded (see etl.checkpoints).
+    Returns the number of warehouse rows inserted or closed, those of skipped tables included.
+    """
+
+    table_names = [table_name for table_name in select_map if tables is None or table_name in tables]
+    if reviews:
+        table_names += CSV_TABLES
+    done = checkpoints.start(batch_id, [step_name(table_name) for table_name in table_names], resume)
+    table_names = [table_name for table_name in table_names if step_name(table_name) not in done]
+    changed_rows = sum(done.values())
+    if constants.SPLIT_DATABASES:
+        streaming.stream_tables([table_name for table_name in table_names if table_name in select_map])
+    estimates = strategy.estimate_changes([table_name for table_name in table_names if table_name in select_map])
+
+    for table_name in table_names:
+        if table_name in CSV_TABLES:
+            continue
+        select_stmt = select_map[table_name]
         wh_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"]
         assert isinstance(wh_table, sqlalchemy.Table), "wh_table must be a sqlalchemy.Table"
 
@@ -565,6 +716,112 @@ def incremental_load_warehouse(
 
         reldb_id_col, wh_id_col = id_map[table_name]
 
+        decision = strategy.choose(estimates[table_name], batch_id)
+        if decision.strategy == "rebuild":
+            insert_stmt, update_stmt = generate_rebuild_stmts(
+                batch_id,
+                constants.WAREHOUSE_RELDB_SOURCE_ID,
+                wh_table,
+                select_stmt,
+            )
+        else:
+            insert_stmt, update_stmt = generate_incremental_load_stmts(
+                batch_id,
+                constants.WAREHOUSE_RELDB_SOURCE_ID,
+                wh_table,
+                op_table,
+                wh_id_col,
+                [(reldb_id_col, wh_id_col)],
+                select_stmt,
+            )
+        # the diff is idempotent, a step repeated after a crash finds nothing left to do.
+        # a repeated rebuild versions the table once more, the current versions stay the same
+        if not constants.SPLIT_DATABASES:
+            governor.wait_for_source(table_name)
+        start = time.perf_counter()
+        with database.get_session(warehouse.engine) as warehouse_session:
+            closed_rows = affected_rows(instrumentation.execute(warehouse_session, update_stmt))
+            inserted_rows = affected_rows(instrumentation.execute(warehouse_session, insert_stmt))
+            checkpoints.commit(warehouse_session, batch_id, step_name(table_name), closed_rows + inserted_rows)
+        strategy.log_cost(decision, batch_id, closed_rows, inserted_rows, time.perf_counter() - start)
+        changed_rows += closed_rows + inserted_rows
+
+    for table_name in CSV_TABLES:
+        if table_name in table_names:
+            rows = incremental_load_csv_staging(batch_id, REVIEWS_FNAME)
+            checkpoints.commit(None, batch_id, step_name(table_name), rows)
+            changed_rows += rows
+
+    return changed_rows
+
+
+def generate_close_deleted_stmt(
+        batch_id: int,
+        source_id: int,
+        wh_table: sqlalchemy.Table,
+        op_id_col: sqlalchemy.orm.InstrumentedAttribute,
+        wh_id_col: sqlalchemy.orm.InstrumentedAttribute,
+        keys: list[int] | None,
+):
+    # closes the current versions of keys whose operational row is gone, all of them without keys
+    conditions = [
+        wh_table.c.end_date == sqlalchemy.literal(datetime.max),
+        ~sqlalchemy.exists().where(op_id_col == wh_id_col),
+    ]
+    if keys is not None:
+        conditions.append(wh_id_col.in_(keys))
+    return sqlalchemy.update(wh_table).where(*conditions).values(
+        end_date=sqlalchemy.literal(datetime.now()),
+        update_id=sqlalchemy.literal(batch_id),
+        source_id=sqlalchemy.literal(source_id),
+    )
+
+
+@instrumentation.phased("warehouse_cdc")
+def apply_change_log(
+        batch_id: int,
+        limit: int = CHANGE_LOG_BATCH,
+) -> tuple[int, int]:
+    """
+    Micro-batch SCD2 apply of the CDC change log (see etl.cdc). Takes the oldest limit entries off the log and
+    runs the incremental load statements for the logged keys only, tables in select_map order so dimensions come
+    before the rows that reference them. Unlike the diff load it also closes the versions of deleted rows,
+    a truncated table is diffed as a whole.
+    The entries are deleted in the apply's transaction, when it fails they stay for the next one.
+    Returns the entries consumed and the warehouse rows inserted or closed.
+    """
+    if constants.SPLIT_DATABASES:
+        raise ValueError("The change log is applied within one database, it is not available with a separate warehouse database")
+
+    warehouse_session = database.get_session(warehouse.engine)
+    # the table rather than the mapped class, an ORM delete with RETURNING reports no rowcount
+    change_log = etl_meta.EtlChangeLog.__table__
+
+    # SKIP LOCKED, two appliers never take the same entries; uncommitted writes are not visible yet and come with a later batch
+    oldest = sqlalchemy.select(change_log.c.id).order_by(change_log.c.id).limit(limit).with_for_update(skip_locked=True)
+    taken = instrumentation.execute(
+        warehouse_session,
+        sqlalchemy.delete(change_log).where(change_log.c.id.in_(oldest)).returning(change_log.c.table_name, change_log.c.pk, change_log.c.op),
+    )
+    entries = taken.all() if taken is not None else []
+
+    keys: dict[str, set[int]] = {}
+    truncated = set()
+    for table_name, pk, op in entries:
+        if op == "T":
+            truncated.add(table_name)
+        else:
+            keys.setdefault(table_name, set()).add(pk)
+
+    changed_rows = 0
+    for table_name, select_stmt in select_map.items():
+        if table_name not in keys and table_name not in truncated:
+            continue
+        wh_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{table_name}"]
+        op_table = reldb.metadata.tables[f"{reldb.metadata.schema}.{table_name}"]
+        reldb_id_col, wh_id_col = id_map[table_name]
+        table_keys = None if table_name in truncated else sorted(keys[table_name])
+
         insert_stmt, update_stmt = generate_incremental_load_stmts(
             batch_id,
             constants.WAREHOUSE_RELDB_SOURCE_ID,
@@ -573,39 +830,43 @@ def incremental_load_warehouse(
             wh_id_col,
             [(reldb_id_col, wh_id_col)],
             select_stmt,
+            reldb_id_col.in_(table_keys) if table_keys is not None else None,
         )
-        print(f" --- Executing update stmt for table: {table_name} ---")
-        print(update_stmt)
-        warehouse_session.execute(update_stmt)
-        print(f" --- Executing insert stmt for table: {table_name} ---")
-        print(insert_stmt)
-        warehouse_session.execute(insert_stmt)
-        print(f" +++ Incremental load of table: {table_name} completed successfully +++ ")
-
-
-    incremental_load_csv_staging(batch_id, "data/output/reviews.csv")
-    print(" +++ Incremental load of warehouse completed successfully +++ ")
+        close_stmt = generate_close_deleted_stmt(
+            batch_id,
+            constants.WAREHOUSE_RELDB_SOURCE_ID,
+            wh_table,
+            reldb_id_col,
+            wh_id_col,
+            table_keys,
+        )
+        changed_rows += affected_rows(instrumentation.execute(warehouse_session, close_stmt))
+        changed_rows += affected_rows(instrumentation.execute(warehouse_session, update_stmt))
+        changed_rows += affected_rows(instrumentation.execute(warehouse_session, insert_stmt))
 
     warehouse_session.commit()
+    instrumentation.log_event(
+        "change_log_applied", batch_id=batch_id, entries=len(entries),
+        tables=",".join(sorted(keys.keys() | truncated)) or None, changed_rows=changed_rows,
+    )
+    return len(entries), changed_rows
 
 
+@instrumentation.phased("warehouse_reviews")
 def incremental_load_csv_staging(
         batch_id: int,
         fname: str,
-):
-    print(" --- Starting incremental load of csv staging ---")
+) -> int:
 
     warehouse_session = database.get_session(warehouse.engine)
 
-    print(" --- Wiping csv staging schema ---")
+    instrumentation.log_event("schema_reset", schema=csv_staging.metadata.schema)
     # clear csv staging schema
     database.wipe_schema(csv_staging.engine, csv_staging.metadata)
 
-    print(" --- Recreating csv staging schema ---")
     # recreate csv staging schema
     database.ensure_schema(csv_staging.engine, csv_staging.metadata)
 
-    print(" --- Inserting csv into csv staging table ---")
     #hardcode, because theres only 1 csv table
 
     #first, insert csv into the staging table
@@ -629,7 +890,7 @@ def incremental_load_csv_staging(
     #         for review in reviews
     #     ]
     # ))
-    try:
+    with instrumentation.step(f"{csv_staging.metadata.schema}.{csv_staging.AirlineReview.__tablename__}", "insert") as record:
         warehouse_session.bulk_save_objects(
             [
         csv_staging.AirlineReview(
@@ -649,16 +910,12 @@ def incremental_load_csv_staging(
             for review in reviews
         ]
         )
-    except Exception as e:
-        print(e)
-        raise e
+        record["rows"] = len(reviews)
 
     warehouse_session.commit()
 
-    print(" --- Generating update and insert statements for load ---")
     #now, generate update and insert statements for load
 
-    print(" --- Updating warehouse table ---")
     wh_table = warehouse.metadata.tables[f"{warehouse.metadata.schema}.{warehouse_model.AirlineReview.__tablename__}"]
     op_table = csv_staging.metadata.tables[f"{csv_staging.metadata.schema}.{csv_staging.AirlineReview.__tablename__}"]
 
@@ -667,7 +924,6 @@ def incremental_load_csv_staging(
     # airline reviews composite key:
     # (flight_id, customer_id, date_published,)
 
-    print(" --- Executing update and insert statements ---")
     insert_stmt, update_stmt = generate_incremental_load_stmts(
         batch_id,
         constants.WAREHOUSE_CSV_SOURCE_ID,
@@ -692,26 +948,21 @@ def incremental_load_csv_staging(
             op_table_t.date_published,
         ).join(
             warehouse_model.Flight,
-            op_table_t.flight_id == warehouse_model.Flight.flight_id,
+            sqlalchemy.and_(op_table_t.flight_id == warehouse_model.Flight.flight_id, current_version(warehouse_model.Flight)),
         ).join(
             warehouse_model.Customer,
-            op_table_t.customer_id == warehouse_model.Customer.customer_id,
+            sqlalchemy.and_(op_table_t.customer_id == warehouse_model.Customer.customer_id, current_version(warehouse_model.Customer)),
         )
     )
 
-    print(update_stmt)
-    print(insert_stmt)
-    warehouse_session.execute(update_stmt)
-    warehouse_session.execute(insert_stmt)
+    changed_rows = affected_rows(instrumentation.execute(warehouse_session, update_stmt))
+    changed_rows += affected_rows(instrumentation.execute(warehouse_session, insert_stmt))
 
-    print(" --- Committing changes ---")
     warehouse_session.commit()
 
-    print(" +++ Incremental load of csv staging completed successfully +++ ")
-
     #wipe staging schema
-    print(" --- Wiping csv staging schema ---")
     database.wipe_schema(csv_staging.engine, csv_staging.metadata)
+    return changed_rows
 
 
 if __name__ == "__main__":
@@ -1,8 +1,15 @@
+import argparse
+import time
+
 import prefect
-from etl.warehouse import full_load_warehouse_2, incremental_load_warehouse
+from prefect.runtime import task_run
+from etl.warehouse import apply_change_log, full_load_warehouse_2, incremental_load_warehouse
 from etl.star_schema import full_load_star_schema, incremental_load_star_schema
 from notifications import slack
-from util.batch_id import get_batch_id, set_batch_id
+from etl import cdc, change_detection, ledger, locks, triggers
+
+# the incremental load touches both, a scheduled run that overlaps a slow one never starts loading
+PIPELINE_STAGES = locks.PIPELINE_STAGES
 
 @prefect.task(name="initial-warehouse-load")
 def initial_load(
@@ -10,54 +17,122 @@ def initial_load(
 ):
     print("Starting initial load")
 
+    # one Slack message when the load ends, with the rows and seconds of every table
     try:
-        slack.send_message("Airline ETL: Starting initial load into warehouse")
-        full_load_star_schema(batch_id)
-        slack.send_message("Airline ETL: Warehouse loaded successfully!")
-        slack.send_message("Airline ETL: Starting initial load into star schema")
-        full_load_warehouse_2(batch_id)
-        slack.send_message("Airline ETL: Star schema loaded successfully!")
+        with slack.digest("Airline ETL: Initial load", batch_id):
+            full_load_warehouse_2(batch_id)
+            full_load_star_schema(batch_id)
     except Exception as e:
         print(e)
-        slack.send_message("Airline ETL: Initial load failed!\nError: " + str(e))
 
-    slack.send_message("Airline ETL: Initial load completed successfully!")
-@prefect.task(name="incremental-warehouse-load")
+# retries stay in the batch and continue after the last checkpointed table
+@prefect.task(name="incremental-warehouse-load", retries=2, retry_delay_seconds=60)
 def incremental_load(
     batch_id: int,
+    tables: set[str] | None = None,
+    reviews: bool = True,
 ):
+    resume = task_run.run_count > 1
     try:
-        slack.send_message("Airline ETL: Starting incremental load into warehouse")
-        incremental_load_warehouse(batch_id)
-        slack.send_message("Airline ETL: Warehouse loaded successfully!")
-        slack.send_message("Airline ETL: Starting incremental load into star schema")
-        incremental_load_star_schema()
-        slack.send_message("Airline ETL: Star schema loaded successfully!")
+        with slack.digest("Airline ETL: Incremental load", batch_id) as run_digest:
+            changed_rows = incremental_load_warehouse(batch_id, tables, reviews, resume)
+            if changed_rows:
+                incremental_load_star_schema(batch_id, resume)
+            else:
+                print("No warehouse rows changed, skipping the star schema")
+                run_digest.note("No warehouse rows changed, the star schema was skipped")
     except Exception as e:
         print(e)
-        slack.send_message("Airline ETL: Incremental load failed!\nError: " + str(e))
+        # so the ledger records the batch as failed
+        raise
 
 @prefect.flow(name="airline-etl", retries=3, retry_delay_seconds=120)
 def airline_etl():
+    # every run gets a fresh batch id from the ledger, failed ones stay visible there
+    def load_changes():
+        changes = change_detection.detect_changes()
+        if changes.any:
+            with ledger.run("incremental", sources=changes.signatures) as batch_id:
+                incremental_load(batch_id, changes.tables, changes.reviews)
+        else:
+            print("No source changes since the last batch, skipping")
+
     try:
-        batch_id = get_batch_id()
-        incremental_load(batch_id)
+        # runs that found us busy in coalesce mode are folded into one more batch
+        locks.run_coalesced(load_changes, *PIPELINE_STAGES)
+    except locks.StageBusy as e:
+        print(e)
     except Exception as e:
         print(e)
 
-    set_batch_id(batch_id + 1)
+@prefect.flow(name="airline-cdc")
+def airline_cdc(
+    max_batches: int = 20,
+    max_seconds: float = 60.0,
+) -> bool:
+    # applies the CDC change log in micro-batches, the reviews csv is left to the scheduled flow.
+    # under steady writes the log never runs dry, so a run stops after max_batches micro-batches or max_seconds,
+    # refreshes the star schema and releases the locks. Returns whether entries were left for the next run
+    try:
+        with locks.stage_locks(*PIPELINE_STAGES):
+            if not cdc.pending_changes():
+                print("Change log is empty, skipping")
+                return False
+            with ledger.run("cdc") as batch_id:
+                start = time.perf_counter()
+                changed_rows, batches, left_over = 0, 0, False
+                while True:
+                    entries, rows = apply_change_log(batch_id)
+                    changed_rows += rows
+                    batches += 1
+                    if not entries:
+                        break
+                    if batches >= max_batches or time.perf_counter() - start >= max_seconds:
+                        left_over = True
+                        break
+                if changed_rows:
+                    incremental_load_star_schema(batch_id)
+                if left_over:
+                    print(f"Stopped after {batches} micro-batches, the rest of the change log goes to the next run")
+                return left_over
+    except locks.StageBusy as e:
+        print(e)
+    except Exception as e:
+        print(e)
+        slack.send_message("Airline ETL: Change log apply failed!\nError: " + str(e))
+    return False
 
 
 if __name__ == "__main__":
-    # -------------------------------------------------------
-    # Launch Prefect’s local agent:
-    #   • Enqueue a new run every 5 minutes (300 seconds)
-    #   • Runs in this process until CTRL+C
-    # -------------------------------------------------------
-    airline_etl.serve(
-        name="incremental-load",
-        interval=300,
-        tags=["bi_project"],
-        pause_on_shutdown=False,
-    )
+    parser = argparse.ArgumentParser(description="Incremental airline ETL.")
+    parser.add_argument("--listen", action="store_true", help="load on NOTIFY events from the operational db instead of every 5 minutes")
+    parser.add_argument("--debounce", type=float, default=2.0, help="seconds without new events before loading")
+    parser.add_argument("--min-interval", type=float, default=10.0, help="seconds between the starts of two loads")
+    parser.add_argument("--max-interval", type=float, default=60.0, help="seconds a change waits at most")
+    parser.add_argument("--cdc", action="store_true", help="with --listen, apply the CDC change log instead of diffing the tables")
+    parser.add_argument("--cdc-max-batches", type=int, default=20, help="micro-batches one CDC run applies at most")
+    parser.add_argument("--cdc-max-seconds", type=float, default=60.0, help="seconds one CDC run applies the change log at most")
+    args = parser.parse_args()
+
+    if args.listen:
+        # -------------------------------------------------------
+        # Trigger mode: the flow runs seconds after changes arrive,
+        # and not at all while the operational db is idle
+        # -------------------------------------------------------
+        if args.cdc:
+            cdc.install_capture()
+        run_load = (lambda: airline_cdc(args.cdc_max_batches, args.cdc_max_seconds)) if args.cdc else airline_etl
+        triggers.listen(run_load, args.debounce, args.min_interval, args.max_interval)
+    else:
+        # -------------------------------------------------------
+        # Launch Prefect’s local agent:
+        #   • Enqueue a new run every 5 minutes (300 seconds)
+        #   • Runs in this process until CTRL+C
+        # -------------------------------------------------------
+        airline_etl.serve(
+            name="incremental-load",
+            interval=300,
+            tags=["bi_project"],
+            pause_on_shutdown=False,
+        )
     
\ No newline at end of file
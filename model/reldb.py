@@ -9,7 +9,7 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped
 from sqlalchemy.dialects.postgresql import ENUM
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, func
 import constants
 from model import common
 
@@ -97,6 +97,14 @@ class FlightBooking(Base):
     customer_id: Mapped[int] = mapped_column(Integer, ForeignKey('customers.id'))
     seat_number: Mapped[str] = mapped_column(String)
 
+class SynthCheckpoint(Base):
+    # one row per batch committed by the synth pipeline, written in the same transaction as the batch
+    __tablename__ = 'synth_checkpoints'
+    phase: Mapped[str] = mapped_column(String, primary_key=True)
+    batch_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    num_rows: Mapped[int] = mapped_column(Integer)
+    committed_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
+
 
 #indexes
 
@@ -109,3 +109,5 @@ class FactReview(Base):
 
 fact_booking_sk_index = Index("fact_booking_sk_index", FactBooking.flight_booking_sk)
 fact_booking_flight_sk_index = Index("fact_booking_flight_sk_index", FactBooking.flight_sk, FactBooking.customer_sk)
+# deleting a replaced dim_customer row checks its bookings by customer
+fact_booking_customer_sk_index = Index("fact_booking_customer_sk_index", FactBooking.customer_sk)
@@ -3,21 +3,213 @@
 """
 This module contains code required to send messages to a slack channel.
 Mainly used for load push notifs
+
+send_message() only queues the message, a background thread posts it, so a slow or unreachable Slack never
+holds up or fails a load. Messages queued while a post is under way go out together as one. Failed posts are
+retried with exponential backoff (and Slack's Retry-After when rate limited), then dropped with an error log.
+Errors that are not Slack API or connection errors, like a missing channel, token or slack_sdk, are dropped
+right away.
+digest() collects the messages of a run together with the rows and seconds of every table it loaded and
+sends them as one message when the run ends.
+
+Environment:
+    SLACK_API_URL  Web API base url, e.g. http://localhost:8099/api/ to post to a local stub instead of Slack
 """
 
-import slack_sdk
-import slack_sdk.errors
+import atexit
+import contextlib
+import logging
+import queue
+import threading
+import time
+import urllib.error
 
 import constants
+import etl.instrumentation as instrumentation
 
-client = slack_sdk.WebClient(token=constants.BOT_TOKEN)
+RETRIES = 5
+BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+# queued messages are joined into one post up to this length
+MAX_MESSAGE_CHARS = 4000
+# how long a finishing process waits for the queue to drain
+FLUSH_TIMEOUT = 10.0
+# not worth retrying
+PERMANENT_ERRORS = {"invalid_auth", "not_authed", "account_inactive", "token_revoked", "channel_not_found", "not_in_channel", "is_archived"}
+# raised when Slack can not be reached, retried like API errors
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, urllib.error.URLError)
 
-def send_message(message):
+_client = None
+
+def get_client():
+    # slack_sdk and the token are only needed once a message is sent
+    global _client
+    if _client is None:
+        import slack_sdk
+        if constants.SLACK_API_URL:
+            _client = slack_sdk.WebClient(token=constants.BOT_TOKEN, base_url=constants.SLACK_API_URL)
+        else:
+            _client = slack_sdk.WebClient(token=constants.BOT_TOKEN)
+    return _client
+
+def post_message(message: str):
+    # synchronous, raises when Slack does
     if constants.CHANNEL is None:
         raise ValueError("CHANNEL is not set")
 
-    client.chat_postMessage(channel=constants.CHANNEL, text=message)
+    get_client().chat_postMessage(channel=constants.CHANNEL, text=message)
+
+
+def retry_delay(error: Exception, attempt: int) -> float | None:
+    # seconds before the next attempt, None when the error will not go away
+    response = getattr(error, "response", None)
+    if response is not None:
+        if response.get("error") in PERMANENT_ERRORS:
+            return None
+        retry_after = response.headers.get("Retry-After") if response.headers else None
+        if retry_after is not None:
+            return float(retry_after)
+    elif not isinstance(error, TRANSIENT_ERRORS):
+        # configuration or programming errors, every attempt fails the same way
+        return None
+    return min(BACKOFF_SECONDS * 2 ** attempt, MAX_BACKOFF_SECONDS)
+
+
+class Notifier:
+    """
+    Posts queued messages from a daemon thread, started with the first message.
+    """
+
+    def __init__(self, post=post_message):
+        self.post = post
+        self.queue: queue.Queue[str] = queue.Queue()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+        # taken off the queue but too long to join, goes out first with the next post
+        self.carry: str | None = None
+
+    def send(self, message: str):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="slack-notifier", daemon=True)
+                self.thread.start()
+        self.queue.put(message)
+
+    def flush(self, timeout: float = FLUSH_TIMEOUT) -> bool:
+        # waits until everything queued so far was posted or given up on, False on timeout
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def take(self) -> tuple[str, int]:
+        # blocks for one message and joins what else is queued, returns the text and how many messages it holds
+        if self.carry is not None:
+            messages, self.carry = [self.carry], None
+        else:
+            messages = [self.queue.get()]
+        length = len(messages[0])
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if length + len(message) + 2 > MAX_MESSAGE_CHARS:
+                self.carry = message
+                break
+            messages.append(message)
+            length += len(message) + 2
+        return "\n\n".join(messages), len(messages)
+
+    def run(self):
+        while True:
+            text, count = self.take()
+            try:
+                self.deliver(text, count)
+            finally:
+                for _ in range(count):
+                    self.queue.task_done()
+
+    def deliver(self, text: str, count: int):
+        for attempt in range(RETRIES + 1):
+            try:
+                self.post(text)
+                instrumentation.log_event("slack_sent", messages=count, attempts=attempt + 1)
+                return
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt == RETRIES:
+                    instrumentation.log_event("slack_failed", logging.ERROR, messages=count, attempts=attempt + 1, error=repr(e))
+                    return
+                instrumentation.log_event("slack_retry", logging.WARNING, attempt=attempt + 1, delay_seconds=delay, error=repr(e))
+                time.sleep(delay)
+
+
+notifier = Notifier()
+atexit.register(notifier.flush)
+
+def send_message(message):
+    notifier.send(message)
+
+
+class Digest:
+    """
+    Messages and per table statement totals of one run, see digest().
+    """
+
+    def __init__(self, title: str, batch_id: int | None = None):
+        self.title = title
+        self.batch_id = batch_id
+        self.notes: list[str] = []
+        self.tables: dict[str, dict] = {}
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def note(self, message: str):
+        self.notes.append(message)
+
+    def collect(self, record: dict):
+        if self.batch_id is not None and record["batch_id"] != self.batch_id:
+            return
+        with self.lock:
+            totals = self.tables.setdefault(record["table"], {"rows": 0, "seconds": 0.0})
+            totals["rows"] += record["rows"]
+            totals["seconds"] += record["seconds"]
+
+    def render(self, error: BaseException | None = None) -> str:
+        status = "failed" if error is not None else "succeeded"
+        batch = f" (batch {self.batch_id})" if self.batch_id is not None else ""
+        lines = [f"{self.title}{batch} {status} in {time.perf_counter() - self.start:.1f}s"]
+        lines += self.notes
+        if error is not None:
+            lines.append(f"Error: {error}")
+        if self.tables:
+            lines.append("```")
+            lines += [f"{table:<36} {totals['rows']:>10,} rows {totals['seconds']:>8.2f}s" for table, totals in sorted(self.tables.items())]
+            lines.append("```")
+        return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def digest(title: str, batch_id: int | None = None):
+    """
+    Collects the run's notes and loader statements (of batch_id only, when given) and queues one message when
+    the block ends, failed or not. Exceptions are re-raised.
+    """
+    run_digest = Digest(title, batch_id)
+    instrumentation.add_listener(run_digest.collect)
+    error = None
+    try:
+        yield run_digest
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        instrumentation.remove_listener(run_digest.collect)
+        send_message(run_digest.render(error))
 
 
 if __name__ == "__main__":
-    send_message("Hello, world!")
\ No newline at end of file
+    send_message("Hello, world!")
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+"""
+Argument parsing of the command line, no database needed.
+"""
+
+import pytest
+
+from airline_bi import cli
+
+
+def test_synth_passes_options_on():
+    args = cli.parse_args(["synth", "--resume"])
+    assert args.handler is cli.run_synth
+    assert args.arguments == ["--resume"]
+
+    assert cli.parse_args(["synth", "--sf", "2", "--resume"]).arguments == ["--sf", "2", "--resume"]
+    assert cli.parse_args(["synth"]).arguments == []
+
+
+def test_bench_passes_options_on():
+    args = cli.parse_args(["bench", "etl_scale", "--sf", "1"])
+    assert args.name == "etl_scale"
+    assert args.arguments == ["--sf", "1"]
+
+    assert cli.parse_args(["bench", "etl_scale", "run", "--sf", "1"]).arguments == ["run", "--sf", "1"]
+    assert cli.parse_args(["bench", "import_time", "--", "--help"]).arguments == ["--help"]
+
+
+def test_load_commands_reject_unknown_options():
+    with pytest.raises(SystemExit):
+        cli.parse_args(["full", "--sf", "2"])
+    assert cli.parse_args(["full", "--parallel", "2"]).parallel == 2
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+Round trips of the COPY payloads data.copy_stream encodes, in all three formats.
+"""
+
+import struct
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, MetaData, String
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from data import copy_stream
+from model.common import FlightStatusEnum
+from model.reldb import Flight
+
+
+class Base(DeclarativeBase):
+    metadata = MetaData(schema="copy_test")
+
+
+class Row(Base):
+    # one column of every type the encoders know
+    __tablename__ = "rows"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    big: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    text: Mapped[str] = mapped_column(String, nullable=True)
+    ratio: Mapped[float] = mapped_column(Float, nullable=True)
+    flag: Mapped[bool] = mapped_column(Boolean, nullable=True)
+    at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    on: Mapped[date] = mapped_column(Date, nullable=True)
+
+
+COLUMNS = list(Row.__table__.columns)
+
+ROWS = [
+    Row(id=1, big=2**40, text="plain", ratio=0.25, flag=True, at=datetime(2024, 2, 29, 13, 45, 1, 5), on=date(2024, 2, 29)),
+    Row(id=2, big=-1, text="tab\there\nnew line\r\\back slash", ratio=-1.5, flag=False, at=datetime(1999, 12, 31, 23, 59, 59, 999999), on=date(1970, 1, 1)),
+    Row(id=3, big=None, text=None, ratio=None, flag=None, at=None, on=None),
+    Row(id=4, big=0, text="comma, \"quoted\"", ratio=0.0, flag=True, at=copy_stream.PG_EPOCH, on=copy_stream.PG_EPOCH_DATE),
+]
+
+
+def as_tuple(row: Row) -> tuple:
+    return tuple(getattr(row, column.key) for column in COLUMNS)
+
+
+@pytest.mark.parametrize("fmt", copy_stream.COPY_FORMATS)
+def test_round_trip(fmt):
+    table, columns, payload = copy_stream.encode(ROWS, fmt)
+    assert table == "copy_test.rows"
+    assert columns == [column.name for column in COLUMNS]
+    assert copy_stream.decode(payload, fmt, COLUMNS) == [as_tuple(row) for row in ROWS]
+
+
+def test_text_escapes_separators():
+    _, _, payload = copy_stream.encode([ROWS[1]], "text")
+    line = payload.decode()
+    # one line, one tab per column boundary
+    assert line.count("\n") == 1 and line.endswith("\n")
+    assert line.count("\t") == len(COLUMNS) - 1
+    assert "tab\\there\\nnew line\\r\\\\back slash" in line
+
+
+def test_text_keeps_a_literal_null_marker():
+    row = Row(id=5, text="\\N")
+    _, _, payload = copy_stream.encode([row], "text")
+    assert copy_stream.decode(payload, "text", COLUMNS) == [as_tuple(row)]
+
+
+def test_csv_empty_string_comes_back_as_null():
+    _, _, payload = copy_stream.encode([Row(id=6, text="")], "csv")
+    assert copy_stream.decode(payload, "csv", COLUMNS)[0][2] is None
+
+
+def test_binary_counts_from_the_postgres_epoch():
+    _, _, payload = copy_stream.encode([Row(id=7, at=datetime(2000, 1, 1, 0, 0, 0, 1), on=date(1999, 12, 31))], "binary")
+    assert payload.startswith(copy_stream.BINARY_HEADER)
+    assert payload.endswith(copy_stream.BINARY_TRAILER)
+    # microseconds and days since 2000-01-01, each behind its length
+    assert struct.pack("!i", 8) + struct.pack("!q", 1) in payload
+    assert struct.pack("!i", 4) + struct.pack("!i", -1) in payload
+
+
+def test_enum_and_default_columns():
+    flight = Flight(
+        id=1, flight_number="AB1234", departure_airport_id=1, arrival_airport_id=2,
+        departure_time=datetime(2024, 1, 1, 8), arrival_time=None, delay_minutes=0,
+        status=FlightStatusEnum.CANCELLED, pilot_id=None, copilot_id=None, airplane_id=3,
+        estimated_flight_hours=3.5,
+    )
+    columns = list(Flight.__table__.columns)
+    for fmt in copy_stream.COPY_FORMATS:
+        _, _, payload = copy_stream.encode([flight], fmt)
+        row = dict(zip((column.key for column in columns), copy_stream.decode(payload, fmt, columns)[0]))
+        assert row["status"] == FlightStatusEnum.CANCELLED
+        # the python side default, COPY does not apply it
+        assert row["is_ferry_flight"] is False
+        assert row["arrival_time"] is None
+
+
+def test_primary_keys_left_empty_are_not_copied():
+    _, columns, _ = copy_stream.encode([Row(text="a"), Row(text="b")], "text")
+    assert "id" not in columns
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        copy_stream.encode(ROWS, "json")
+    with pytest.raises(ValueError):
+        copy_stream.decode(b"", "json", COLUMNS)
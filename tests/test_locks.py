@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Coalescing of the stage locks, with the advisory locks and etl_lock_decisions kept in memory.
+"""
+
+import pytest
+
+import database.etl_meta as etl_meta
+from etl import locks
+
+STAGES = locks.PIPELINE_STAGES
+
+
+class FakeConnection:
+    def execution_options(self, **options):
+        return self
+
+    def close(self):
+        pass
+
+
+class FakeEngine:
+    def connect(self):
+        return FakeConnection()
+
+
+class FakeMeta:
+    # the advisory locks and the coalesced requests, with a hook that runs right before the locks are released
+    def __init__(self):
+        self.held = False
+        self.requests = {}
+        self.before_unlock = None
+
+    def try_lock_all(self, connection, stages):
+        if self.held:
+            return False
+        self.held = True
+        return True
+
+    def unlock_all(self, connection, stages):
+        if self.before_unlock:
+            before_unlock, self.before_unlock = self.before_unlock, None
+            before_unlock()
+        self.held = False
+
+    def record_decision(self, stages, mode, decision, waited):
+        decision_id = len(self.requests) + 1
+        self.requests[decision_id] = decision == "coalesced"
+        return decision_id
+
+    def mark_handled(self, decision_id):
+        self.requests[decision_id] = False
+
+    def take_coalesced(self, *stages):
+        pending = [decision_id for decision_id, open in self.requests.items() if open]
+        for decision_id in pending:
+            self.requests[decision_id] = False
+        return len(pending)
+
+
+@pytest.fixture
+def meta(monkeypatch):
+    fake = FakeMeta()
+    monkeypatch.setattr(locks.ledger, "ensure_ledger", lambda: None)
+    # set in the module dict, reading the attribute first would create the real engine
+    monkeypatch.setitem(vars(etl_meta), "engine", FakeEngine())
+    for name in ("try_lock_all", "unlock_all", "record_decision", "mark_handled", "take_coalesced"):
+        monkeypatch.setattr(locks, name, getattr(fake, name))
+    return fake
+
+
+def competing_run(loads):
+    # a run that finds the locks held records its request and gives up
+    with pytest.raises(locks.StageBusy):
+        locks.run_coalesced(lambda: loads.append("competitor"), *STAGES, mode="coalesce")
+
+
+def test_request_during_the_load_gets_one_more_batch(meta):
+    loads = []
+
+    def load():
+        loads.append("holder")
+        if len(loads) == 1:
+            competing_run(loads)
+            competing_run(loads)
+
+    locks.run_coalesced(load, *STAGES, mode="coalesce")
+    assert loads == ["holder", "holder"]
+    assert not meta.held
+
+
+def test_request_between_last_check_and_release_is_not_lost(meta):
+    loads = []
+
+    def load():
+        loads.append("holder")
+        if len(loads) == 1:
+            # the holder's last take_coalesced() has returned 0 by the time this request is recorded
+            meta.before_unlock = lambda: competing_run(loads)
+
+    locks.run_coalesced(load, *STAGES, mode="coalesce")
+    assert loads == ["holder", "holder"]
+    assert not any(meta.requests.values())
+
+
+def test_request_after_release_takes_the_locks_itself(meta, monkeypatch):
+    loads = []
+    meta.held = True
+    original_record = meta.record_decision
+
+    def record_and_release(stages, mode, decision, waited):
+        # the holder releases, and checks for requests, after the first try but before this one is recorded
+        meta.held = False
+        return original_record(stages, mode, decision, waited)
+
+    monkeypatch.setattr(locks, "record_decision", record_and_release)
+    locks.run_coalesced(lambda: loads.append("competitor"), *STAGES, mode="coalesce")
+    assert loads == ["competitor"]
+    assert not any(meta.requests.values())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Retries and joining of the Slack notifier, with a fake post instead of Slack.
+"""
+
+import logging
+
+import pytest
+
+from notifications import slack
+
+
+class FakeResponse(dict):
+    def __init__(self, error: str, headers: dict | None = None):
+        super().__init__(ok=False, error=error)
+        self.headers = headers or {}
+
+
+class FakeApiError(Exception):
+    # what slack_sdk raises for an API error, the response says which
+    def __init__(self, error: str, headers: dict | None = None):
+        super().__init__(error)
+        self.response = FakeResponse(error, headers)
+
+
+class FakePost:
+    # fails with the given errors in turn, then posts
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls: list[str] = []
+
+    def __call__(self, text: str):
+        self.calls.append(text)
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(slack, "BACKOFF_SECONDS", 0.0)
+
+
+def failures(caplog) -> list[logging.LogRecord]:
+    return [record for record in caplog.records if record.getMessage() == "slack_failed"]
+
+
+def test_transient_errors_are_retried(caplog):
+    post = FakePost(FakeApiError("ratelimited", {"Retry-After": "0"}), ConnectionError("reset"), FakeApiError("internal_error"))
+    slack.Notifier(post).deliver("load finished", 1)
+    assert post.calls == ["load finished"] * 4
+    assert not failures(caplog)
+
+
+def test_permanent_errors_are_dropped_at_once(caplog):
+    for error in (FakeApiError("channel_not_found"), ValueError("CHANNEL is not set"), EnvironmentError("Missing required environment variable: BOT_TOKEN"), KeyError("channel")):
+        caplog.clear()
+        post = FakePost(error)
+        slack.Notifier(post).deliver("load finished", 1)
+        assert post.calls == ["load finished"]
+        assert len(failures(caplog)) == 1
+
+
+def test_retries_give_up(caplog):
+    post = FakePost(*[TimeoutError()] * (slack.RETRIES + 1))
+    slack.Notifier(post).deliver("load finished", 1)
+    assert len(post.calls) == slack.RETRIES + 1
+    assert len(failures(caplog)) == 1
+
+
+def test_queued_messages_are_joined_with_the_carry():
+    notifier = slack.Notifier(FakePost())
+    long_message = "x" * (slack.MAX_MESSAGE_CHARS - 10)
+    for message in ("first", "second", long_message, "last"):
+        notifier.queue.put(message)
+
+    assert notifier.take() == ("first\n\nsecond", 2)
+    # too long to join, carried over and joined with what came after it
+    assert notifier.carry == long_message
+    assert notifier.take() == (f"{long_message}\n\nlast", 2)
+    assert notifier.carry is None
+
+
+def test_send_posts_from_the_thread():
+    post = FakePost(FakeApiError("ratelimited", {"Retry-After": "0"}))
+    notifier = slack.Notifier(post)
+    notifier.send("load finished")
+    assert notifier.flush(timeout=5)
+    assert post.calls[-1] == "load finished"
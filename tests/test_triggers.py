@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""
+When the trigger listener's debouncer says a load is due, times passed in instead of read from the clock.
+"""
+
+from etl.triggers import Debouncer
+
+
+def test_nothing_pending_is_never_due():
+    debouncer = Debouncer(debounce=2.0, min_interval=10.0, max_interval=60.0)
+    assert debouncer.due() is None
+    debouncer.notify("flights", 5.0)
+    debouncer.take(8.0)
+    assert debouncer.due() is None
+
+
+def test_due_once_events_are_quiet_for_the_debounce():
+    debouncer = Debouncer(debounce=2.0, min_interval=0.0, max_interval=60.0)
+    debouncer.notify("flights", 100.0)
+    assert debouncer.due() == 102.0
+    # every new event restarts the window
+    debouncer.notify("flight_bookings", 101.5)
+    assert debouncer.due() == 103.5
+
+
+def test_max_interval_caps_a_stream_of_events():
+    debouncer = Debouncer(debounce=2.0, min_interval=0.0, max_interval=60.0)
+    for second in range(0, 100):
+        debouncer.notify("flight_bookings", 100.0 + second)
+    # events never calmed down, the first one waited max_interval
+    assert debouncer.due() == 160.0
+
+
+def test_min_interval_after_the_last_load():
+    debouncer = Debouncer(debounce=2.0, min_interval=10.0, max_interval=60.0)
+    debouncer.take(100.0)
+    debouncer.notify("customers", 101.0)
+    assert debouncer.due() == 110.0
+    # later events are only held off by the debounce
+    debouncer.notify("customers", 109.0)
+    assert debouncer.due() == 111.0
+
+
+def test_min_interval_wins_over_max_interval():
+    debouncer = Debouncer(debounce=2.0, min_interval=30.0, max_interval=5.0)
+    debouncer.take(100.0)
+    debouncer.notify("flights", 101.0)
+    assert debouncer.due() == 130.0
+
+
+def test_take_returns_the_notified_tables_and_starts_over():
+    debouncer = Debouncer(debounce=2.0, min_interval=10.0, max_interval=60.0)
+    for table_name in ("flights", "customers", "flights"):
+        debouncer.notify(table_name, 100.0)
+    assert debouncer.take(102.0) == {"flights", "customers"}
+    assert debouncer.tables == set()
+    assert debouncer.first_event is None and debouncer.last_event is None
+    assert debouncer.last_run == 102.0
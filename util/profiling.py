@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""
+CPU and memory profiling of synthesis phases, pipeline workers and ETL steps.
+Profiling is on when PROFILE_DIR is set (synthesize_reldb and etl_scale set it from --profile),
+spawned workers inherit it from the environment. Every profiled stage writes, per process:
+    <stage>.<pid>.pstats     cProfile stats, summed over repeated runs of the stage
+    <stage>.<pid>.alloc.txt  top tracemalloc allocations and the peak of traced memory, per run
+report merges the stats of all processes, per stage and overall, so the hottest functions
+across producers, consumers and the main process show up in one place.
+
+Usage:
+    python -m util.profiling report profiles/run-1 --top 30
+"""
+
+import argparse
+import contextlib
+import cProfile
+import glob
+import io
+import os
+import pstats
+import re
+import tracemalloc
+from collections import defaultdict
+
+PROFILE_DIR_ENV = "PROFILE_DIR"
+TOP_ALLOCATIONS = 25
+
+# cProfile allows one active profiler per process, nested stages are folded into the outer one
+_active = False
+
+
+def profile_dir() -> str | None:
+    return os.getenv(PROFILE_DIR_ENV)
+
+
+def enable(run_dir: str):
+    # set in the environment so spawned workers pick it up
+    os.makedirs(run_dir, exist_ok=True)
+    os.environ[PROFILE_DIR_ENV] = run_dir
+
+
+def stage_file_name(stage: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", stage)
+
+
+def write_allocations(path: str, snapshot: tracemalloc.Snapshot, peak: int):
+    # appended, a stage that runs more than once in a process gets one section per run
+    with open(path, "a") as f:
+        f.write(f"peak traced memory: {peak / 2**20:,.1f} MiB\n")
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            frame = statistic.traceback[0]
+            f.write(f"{statistic.size / 2**10:>12,.1f} KiB {statistic.count:>10,} blocks  {frame.filename}:{frame.lineno}\n")
+
+
+@contextlib.contextmanager
+def profiled(stage: str):
+    """
+    Profiles the block as stage when profiling is enabled, does nothing otherwise.
+    """
+    global _active
+    run_dir = profile_dir()
+    if run_dir is None or _active:
+        yield
+        return
+    _active = True
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        _active = False
+        os.makedirs(run_dir, exist_ok=True)
+        prefix = os.path.join(run_dir, f"{stage_file_name(stage)}.{os.getpid()}")
+        stats = pstats.Stats(profiler)
+        if os.path.exists(f"{prefix}.pstats"):
+            stats.add(f"{prefix}.pstats")
+        stats.dump_stats(f"{prefix}.pstats")
+        write_allocations(f"{prefix}.alloc.txt", snapshot, peak)
+
+
+def run_profiled(stage: str, fn, *args):
+    # process target wrapper, keeps the worker functions themselves unaware of profiling
+    with profiled(stage):
+        fn(*args)
+
+
+def stage_profiles(run_dir: str) -> dict[str, list[str]]:
+    # <stage>.<pid>.pstats, merged files have no pid and are skipped
+    stages = defaultdict(list)
+    for path in sorted(glob.glob(os.path.join(run_dir, "*.pstats"))):
+        match = re.fullmatch(r"(.+)\.(\d+)\.pstats", os.path.basename(path))
+        if match:
+            stages[match.group(1)].append(path)
+    return dict(stages)
+
+
+def stats_text(stats: pstats.Stats, sort: str, top: int) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    # print_stats starts with one line per merged file otherwise
+    stats.files = []
+    stats.sort_stats(sort).print_stats(top)
+    return stream.getvalue()
+
+
+def write_report(run_dir: str | None = None, top: int = 30) -> str | None:
+    """
+    Merges the per-process stats of stages run by several processes into <stage>.merged.pstats and all of them into all.merged.pstats,
+    and writes report.txt with the hottest functions overall and per stage. Returns the report path.
+    """
+    run_dir = run_dir or profile_dir()
+    stages = stage_profiles(run_dir) if run_dir else {}
+    if not stages:
+        return None
+    report_path = os.path.join(run_dir, "report.txt")
+    with open(report_path, "w") as report:
+        overall = pstats.Stats(*[path for paths in stages.values() for path in paths])
+        overall.dump_stats(os.path.join(run_dir, "all.merged.pstats"))
+        report.write(f"===== all stages, {sum(len(paths) for paths in stages.values())} profiles, by own time\n")
+        report.write(stats_text(overall, "tottime", top))
+        for stage, paths in stages.items():
+            stats = pstats.Stats(*paths)
+            if len(paths) > 1:
+                stats.dump_stats(os.path.join(run_dir, f"{stage}.merged.pstats"))
+            report.write(f"===== {stage}, {len(paths)} process(es), by cumulative time\n")
+            report.write(stats_text(stats, "cumulative", top))
+    print(f"+++++ Profiling report written to {report_path}")
+    return report_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profiling reports.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Merge the profiles of a run directory and write report.txt")
+    report_parser.add_argument("run_dir")
+    report_parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+    if write_report(args.run_dir, args.top) is None:
+        print(f"No profiles in {args.run_dir}")